@@ -9,6 +9,8 @@ from typing import Literal
 
 from wipac_dev_tools import from_environment_as_dataclass, logging_tools
 
+from .utils.slots import SlotSize
+
 LOGGER = logging.getLogger(__name__)
 
 
@@ -63,12 +65,40 @@ class EnvConfig:
     # incoming queue - settings
     EWMS_PILOT_PREFETCH: int = (
         1  # prefetch amount for incoming messages (off by default -- prefetch is an optimization)
+        # -- this is also the size of the pilot's local buffer of received-but-not-started messages
     )
     EWMS_PILOT_TIMEOUT_QUEUE_WAIT_FOR_FIRST_MESSAGE: int | None = (
         None  # timeout (sec) for the first message to arrive at the pilot (defaults to incoming timeout value)
     )
     EWMS_PILOT_TIMEOUT_QUEUE_INCOMING: int = 1  # timeout (sec) for messages TO pilot
 
+    # outgoing queue - settings
+    EWMS_PILOT_OUTBOX: bool = (
+        False
+        # whether to keep output-events that can't be sent in an on-disk outbox
+        # (in the pilot's data dir) and retry them, instead of failing their tasks
+        # -- their input-event messages are acked once they're sent (see README)
+    )
+    EWMS_PILOT_OUTBOX_FLUSH_TIMEOUT: int = (
+        600  # at the end, how long (sec) to keep retrying the outbox before leaving
+        # its output-events for the next pilot on this node
+    )
+
+    # broker connections (incoming & outgoing queues)
+    EWMS_PILOT_BROKER_RECONNECT_TIMEOUT: int = (
+        0  # how long (sec) to keep trying to reconnect to a broker after losing the connection
+        # -- running tasks keep going meanwhile (0 = don't reconnect, fail the pilot instead)
+    )
+
+    # result cache
+    EWMS_PILOT_RESULT_CACHE: bool = (
+        False  # whether to reuse the outfile of an identical task (same image, args & message data)
+        # instead of running another container -- kept in the pilot's data dir (see README)
+    )
+    EWMS_PILOT_RESULT_CACHE_MAX_GB: float = (
+        1  # disk budget for the cached outfiles (0 -> unlimited)
+    )
+
     # files
     EWMS_PILOT_EXTERNAL_DIRECTORIES: str = ""  # comma-delimited
 
@@ -99,6 +129,49 @@ class EnvConfig:
         #    EWMS_PILOT_STOP_LISTENING_ON_TASK_ERROR setting
     )
     EWMS_PILOT_MAX_CONCURRENT_TASKS: int = 1  # max no. of tasks to process in parallel
+    EWMS_PILOT_ADAPTIVE_CONCURRENCY: bool = (
+        False
+        # whether to raise/lower the no. of tasks in parallel based on the slot's
+        # load (see README) -- EWMS_PILOT_MAX_CONCURRENT_TASKS is the upper bound
+    )
+    EWMS_PILOT_TASK_WORKER_MODE: bool = (
+        False
+        # whether to start up to EWMS_PILOT_MAX_CONCURRENT_TASKS long-lived task
+        # containers once, then send each one task after task (see README);
+        # ex: set to True if the task container has a long startup (imports, tables, ...)
+    )
+    EWMS_PILOT_TASK_BATCH_SIZE: int = (
+        1  # max no. of messages to process in one task container (see README)
+        # -- a bigger EWMS_PILOT_PREFETCH is needed for the messages to be on-hand
+    )
+    EWMS_PILOT_TASK_BATCH_WAIT_MS: int = (
+        0  # how long (ms) to wait for more messages to fill a batch
+    )
+    EWMS_PILOT_APPTAINER_INSTANCE_MODE: bool = (
+        False
+        # whether to run each task in an apptainer instance of the task image (one
+        # task at a time per instance) -- skipping the per-container setup (apptainer only)
+    )
+    EWMS_PILOT_PARTITION_SLOT_RESOURCES: bool = (
+        False
+        # whether to split the pilot's CPUs, memory, and PID limit between its
+        # EWMS_PILOT_MAX_CONCURRENT_TASKS task containers (see README);
+        # on apptainer, this requires cgroups
+    )
+    EWMS_PILOT_JSON_PASSTHROUGH: bool = (
+        False
+        # whether to pass '.json' task files' contents to/from the queues as-is,
+        # without decoding/re-encoding them (see README) -- the task container
+        # must write valid JSON, since the pilot doesn't check it
+    )
+
+    # auto-configuration
+    EWMS_PILOT_AUTO_CONFIGURE: bool = (
+        False
+        # whether to derive the defaults of EWMS_PILOT_MAX_CONCURRENT_TASKS,
+        # EWMS_PILOT_PREFETCH, and _EWMS_PILOT_DOCKER_SHM_SIZE from the slot's
+        # size (see README) -- any of these that are set explicitly are kept
+    )
 
     # misc settings
     EWMS_PILOT_KEEP_ALL_TASK_FILES: bool = False
@@ -114,7 +187,18 @@ class EnvConfig:
     _EWMS_PILOT_CONTAINER_PLATFORM: str = "docker"
     _EWMS_PILOT_APPTAINER_BUILD_WORKDIR: str = "/var/tmp"
     _EWMS_PILOT_APPTAINER_IMAGE_DIRECTORY_MUST_BE_PRESENT: bool = True
+    _EWMS_PILOT_APPTAINER_IMAGE_CACHE_MAX_GB: float = (
+        50  # disk budget for all converted images on the node (0 -> unlimited)
+    )
     _EWMS_PILOT_DOCKER_SHM_SIZE: str | None = None  # this should be set to max allowed
+    _EWMS_PILOT_DOCKER_ENGINE_API: bool = False  # use the api instead of the docker cli
+    _EWMS_PILOT_DOCKER_SOCKET: str = "/var/run/docker.sock"
+    _EWMS_PILOT_FILE_IO_THREADS: int = (
+        4  # max no. of threads for task-file I/O -- keeps it off the event loop
+    )
+    _EWMS_PILOT_JSON_CODEC: str = (
+        "auto"  # for .json task files: auto (= stdlib), or opt in to orjson, msgspec
+    )
 
     def __post_init__(self) -> None:
         """Do advanced validation."""
@@ -132,6 +216,9 @@ class EnvConfig:
                 # b/c frozen
                 object.__setattr__(self, "EWMS_PILOT_TASK_TIMEOUT", int(timeout))
 
+        if self.EWMS_PILOT_AUTO_CONFIGURE:
+            self._auto_configure(SlotSize.detect())
+
         # must be positive
         if self.EWMS_PILOT_MAX_CONCURRENT_TASKS < 1:
             LOGGER.warning(
@@ -139,6 +226,12 @@ class EnvConfig:
                 " defaulting to '1'."
             )
             object.__setattr__(self, "EWMS_PILOT_CONCURRENT_TASKS", 1)  # b/c frozen
+        if self.EWMS_PILOT_TASK_BATCH_SIZE < 1:
+            LOGGER.warning(
+                f"Invalid value for 'EWMS_PILOT_TASK_BATCH_SIZE' ({self.EWMS_PILOT_TASK_BATCH_SIZE}),"
+                " defaulting to '1'."
+            )
+            object.__setattr__(self, "EWMS_PILOT_TASK_BATCH_SIZE", 1)  # b/c frozen
 
         # mutually exclusive
         if (
@@ -151,6 +244,57 @@ class EnvConfig:
                 f"'{self.EWMS_PILOT_STOP_LISTENING_ON_TASK_ERROR}'"
             )
 
+        if (
+            self.EWMS_PILOT_APPTAINER_INSTANCE_MODE
+            and self.EWMS_PILOT_TASK_WORKER_MODE
+        ):
+            raise RuntimeError(
+                "Cannot use both 'EWMS_PILOT_APPTAINER_INSTANCE_MODE' and "
+                "'EWMS_PILOT_TASK_WORKER_MODE'"
+            )
+        if (
+            self.EWMS_PILOT_APPTAINER_INSTANCE_MODE
+            and self.EWMS_PILOT_PARTITION_SLOT_RESOURCES
+        ):
+            raise RuntimeError(
+                "Cannot use both 'EWMS_PILOT_APPTAINER_INSTANCE_MODE' and "
+                "'EWMS_PILOT_PARTITION_SLOT_RESOURCES'"
+            )
+        if self.EWMS_PILOT_TASK_BATCH_SIZE > 1 and self.EWMS_PILOT_TASK_WORKER_MODE:
+            raise RuntimeError(
+                "Cannot use both 'EWMS_PILOT_TASK_BATCH_SIZE' (>1) and "
+                "'EWMS_PILOT_TASK_WORKER_MODE'"
+            )
+
+    def _auto_configure(self, slot: SlotSize) -> None:
+        """Derive the defaults for the slot-dependent settings from the slot's size.
+
+        Explicitly-set env vars are never overridden.
+        """
+        LOGGER.info(f"Auto-configuring for slot: {slot}")
+
+        def set_default(name: str, value: object) -> None:
+            if os.getenv(name) is not None:
+                LOGGER.info(f"Keeping explicit '{name}' ({getattr(self, name)})")
+                return
+            LOGGER.info(f"Auto-configured '{name}' to {value}")
+            object.__setattr__(self, name, value)  # b/c frozen
+
+        # one task (container) per core
+        if slot.cpus:
+            set_default("EWMS_PILOT_MAX_CONCURRENT_TASKS", slot.cpus)
+        # keep enough messages on-hand to fill every container
+        set_default(
+            "EWMS_PILOT_PREFETCH",
+            self.EWMS_PILOT_MAX_CONCURRENT_TASKS * self.EWMS_PILOT_TASK_BATCH_SIZE,
+        )
+        # /dev/shm counts against memory -- give each container half its share
+        if slot.memory_bytes:
+            set_default(
+                "_EWMS_PILOT_DOCKER_SHM_SIZE",
+                f"{slot.memory_bytes // max(1, self.EWMS_PILOT_MAX_CONCURRENT_TASKS) // 2}b",
+            )
+
 
 ENV = from_environment_as_dataclass(EnvConfig)
 
@@ -170,6 +314,8 @@ class InTaskContainerEnvVarNames(enum.Enum):
     EWMS_TASK_DATA_HUB_DIR = enum.auto()
     EWMS_TASK_INFILE = enum.auto()
     EWMS_TASK_OUTFILE = enum.auto()
+    EWMS_TASK_WORKER_FIFO = enum.auto()  # only in worker mode
+    EWMS_TASK_MANIFEST = enum.auto()  # only for batches
 
 
 # --------------------------------------------------------------------------------------
@@ -10,6 +10,8 @@ import mqclient as mq
 from typing_extensions import ParamSpec
 
 from . import htchirp_tools
+from .tasks.reconnect import ReconnectingPubResource, ReconnectingSubResource
+from .utils.stats import RuntimeStats
 
 LOGGER = logging.getLogger(__name__)
 
@@ -38,6 +40,7 @@ class Housekeeping:
 
     def __init__(self, chirper: htchirp_tools.Chirper) -> None:
         self.prev_rabbitmq_heartbeat = 0.0
+        self.prev_total_msg_count = 0
         self.chirper = chirper
 
     async def basic_housekeeping(
@@ -66,8 +69,8 @@ class Housekeeping:
     async def queue_housekeeping(
         self,
         in_queue: mq.Queue,
-        sub: mq.queue.ManualQueueSubResource,
-        pub: mq.queue.QueuePubResource,
+        sub: ReconnectingSubResource,
+        pub: ReconnectingPubResource,
     ) -> None:
         """Do housekeeping for queue + basic housekeeping."""
 
@@ -79,10 +82,15 @@ class Housekeeping:
                 > self.RABBITMQ_HEARTBEAT_INTERVAL
             ):
                 self.prev_rabbitmq_heartbeat = time.time()
-                for raw_q in [pub.pub, sub._sub]:
-                    if raw_q.connection:  # type: ignore[attr-defined, union-attr]
+                raw_sub = sub.resource._sub if sub.resource else None
+                for raw_q in [pub.pub, raw_sub]:
+                    if raw_q and raw_q.connection:  # type: ignore[attr-defined, union-attr]
                         LOGGER.info("sending heartbeat to RabbitMQ broker...")
-                        raw_q.connection.process_data_events()  # type: ignore[attr-defined, union-attr]
+                        try:
+                            raw_q.connection.process_data_events()  # type: ignore[attr-defined, union-attr]
+                        except Exception as e:
+                            # a lost connection is dealt with by whoever uses it next
+                            LOGGER.warning(f"Could not send heartbeat: {repr(e)}")
 
         # TODO -- add other housekeeping
 
@@ -94,15 +102,38 @@ class Housekeeping:
     @with_basic_housekeeping
     async def message_received(self, total_msg_count: int) -> None:
         """Update message count for chirp."""
-        if total_msg_count == 1:
+        if not self.prev_total_msg_count:  # could be 2+ messages at once (a batch)
             self.chirper.chirp_status(htchirp_tools.PilotStatus.Tasking)
+        self.prev_total_msg_count = total_msg_count
         self.chirper.chirp_new_total(total_msg_count)
 
     @with_basic_housekeeping
-    async def new_messages_done(self, n_success: int, n_failed: int) -> None:
-        """Update done counts for chirp."""
+    async def new_messages_done(
+        self,
+        n_success: int,
+        n_failed: int,
+        resource_stats: dict[str, RuntimeStats] | None = None,
+    ) -> None:
+        """Update done counts (and resource usage) for chirp."""
         self.chirper.chirp_new_failed_total(n_failed)
         self.chirper.chirp_new_success_total(n_success)
+        if resource_stats:
+            self.chirper.chirp_resource_stats(resource_stats)
+
+    @with_basic_housekeeping
+    async def outputs_published(
+        self,
+        queue_depth: int,
+        send_latency: RuntimeStats,
+    ) -> None:
+        """Update the finished-task queue's depth & the send latency for chirp."""
+        self.chirper.chirp_publish_stats(queue_depth, send_latency)
+
+    @with_basic_housekeeping
+    async def concurrency_limit_changed(self, limit: int, reason: str) -> None:
+        """Log the new limit on concurrent tasks + chirp it."""
+        LOGGER.info(f"Changed task concurrency limit to {limit}: {reason}")
+        self.chirper.chirp_concurrency_limit(limit)
 
     @with_basic_housekeeping
     async def pending_remaining_tasks(self) -> None:
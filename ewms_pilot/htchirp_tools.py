@@ -47,6 +47,15 @@ class HTChirpAttr(enum.Enum):
     HTChirpEWMSPilotTasksFailed = enum.auto()
     HTChirpEWMSPilotTasksSuccess = enum.auto()
 
+    HTChirpEWMSPilotTasksCpuSeconds = enum.auto()
+    HTChirpEWMSPilotTasksPeakMemoryMax = enum.auto()
+    HTChirpEWMSPilotTasksIOBytes = enum.auto()
+
+    HTChirpEWMSPilotConcurrencyLimit = enum.auto()
+
+    HTChirpEWMSPilotPublishQueueDepth = enum.auto()
+    HTChirpEWMSPilotPublishLatencyMean = enum.auto()
+
     HTChirpEWMSPilotError = enum.auto()
     HTChirpEWMSPilotErrorTraceback = enum.auto()
 
@@ -211,6 +220,48 @@ class Chirper:
         self._backlog[HTChirpAttr.HTChirpEWMSPilotTasksFailed] = total
         self.chirp_backlog(is_rate_limited=True)
 
+    def chirp_resource_stats(self, resource_stats: dict[str, Any]) -> None:
+        """Send a Condor Chirp signalling the (successful) tasks' resource usage.
+
+        `resource_stats` maps each `ResourceUsage` field to its `RuntimeStats`.
+
+        This chirp is enqueued (rate limited) and sent every X seconds.
+        """
+
+        def total(*names: str) -> float | None:
+            found = [resource_stats[n].total for n in names if n in resource_stats]
+            return sum(found) if found else None
+
+        if (cpu := total("cpu_user_sec", "cpu_system_sec")) is not None:
+            self._backlog[HTChirpAttr.HTChirpEWMSPilotTasksCpuSeconds] = round(cpu, 1)
+        if mem := resource_stats.get("peak_memory_bytes"):
+            self._backlog[HTChirpAttr.HTChirpEWMSPilotTasksPeakMemoryMax] = int(mem.max)
+        if (io := total("io_read_bytes", "io_write_bytes")) is not None:
+            self._backlog[HTChirpAttr.HTChirpEWMSPilotTasksIOBytes] = int(io)
+        self.chirp_backlog(is_rate_limited=True)
+
+    def chirp_concurrency_limit(self, limit: int) -> None:
+        """Send a Condor Chirp signalling a new limit on concurrent tasks.
+
+        This chirp is enqueued (rate limited) and sent every X seconds.
+        """
+        self._backlog[HTChirpAttr.HTChirpEWMSPilotConcurrencyLimit] = limit
+        self.chirp_backlog(is_rate_limited=True)
+
+    def chirp_publish_stats(self, queue_depth: int, send_latency: Any) -> None:
+        """Send a Condor Chirp signalling the finished-task queue's depth & send latency.
+
+        `send_latency` is a `RuntimeStats` of each output-event's send (sec).
+
+        This chirp is enqueued (rate limited) and sent every X seconds.
+        """
+        self._backlog[HTChirpAttr.HTChirpEWMSPilotPublishQueueDepth] = queue_depth
+        if send_latency.count:
+            self._backlog[HTChirpAttr.HTChirpEWMSPilotPublishLatencyMean] = round(
+                send_latency.mean, 3
+            )
+        self.chirp_backlog(is_rate_limited=True)
+
     def initial_chirp(self) -> None:
         """Send a Condor Chirp signalling that processing has started."""
         self.chirp_status(PilotStatus.Started)
@@ -1,40 +1,58 @@
 """API for launching an MQ-task pilot."""
 
 import asyncio
+import contextlib
+import functools
 import logging
-import sys
 import time
+from typing import Any, Awaitable, Collection, TypeVar
 
 import mqclient as mq
+from mqclient.broker_client_interface import Message
 
 from . import htchirp_tools
 from .config import (
     ENV,
+    PILOT_DATA_DIR,
     REFRESH_INTERVAL,
 )
 from .housekeeping import Housekeeping
 from .init_container.init_container import run_init_container
 from .tasks.io import FileExtension
-from .tasks.map import TaskMapping
-from .tasks.task import process_msg_task
-from .tasks.wait_on_tasks import wait_on_tasks_with_ack
+from .tasks.map import TaskLedger, TaskMapping
+from .tasks.outbox import OUTBOX_FILE_NAME, Outbox
+from .tasks.prefetch import MessagePrefetcher
+from .tasks.publish import OutputPublisher
+from .tasks.reconnect import (
+    ReconnectingPubResource,
+    ReconnectingSubResource,
+    open_pub,
+    open_sub_manual_acking,
+)
+from .tasks.result_cache import RESULT_CACHE_DIR_NAME, ResultCache
+from .tasks.task import (
+    get_msg_result_from_batch,
+    process_msg_batch_task,
+    process_msg_task,
+    process_msg_task_on_worker,
+)
+from .tasks.wait_on_tasks import mark_finished_tasks
+from .tasks.worker import TaskWorkerPool
+from .utils.concurrency import ConcurrencyController
+from .utils.offload import EventLoopLagMonitor
+from .utils.resources import ResourceUsage
 from .utils.runner import ContainerRunner
 from .utils.utils import (
     all_task_errors_string,
     dump_all_taskmaps,
     dump_tallies,
+    dump_task_resource_stats,
     dump_task_runtime_stats,
 )
 
 LOGGER = logging.getLogger(__name__)
 
-# fmt:off
-if sys.version_info[1] < 10:
-    # this is built in for py3.10+
-    async def anext(ait):
-        return await ait.__anext__()
-# fmt:on
-
+T = TypeVar("T")
 
 # if there's an error, have the cluster try again (probably a system error)
 _EXCEPT_ERRORS = False
@@ -46,6 +64,11 @@ async def consume_and_reply(
     task_args: str = ENV.EWMS_PILOT_TASK_ARGS,
     task_timeout: int | None = ENV.EWMS_PILOT_TASK_TIMEOUT,
     max_concurrent_tasks: int = ENV.EWMS_PILOT_MAX_CONCURRENT_TASKS,
+    adaptive_concurrency: bool = ENV.EWMS_PILOT_ADAPTIVE_CONCURRENCY,
+    task_worker_mode: bool = ENV.EWMS_PILOT_TASK_WORKER_MODE,
+    task_apptainer_instance_mode: bool = ENV.EWMS_PILOT_APPTAINER_INSTANCE_MODE,
+    task_batch_size: int = ENV.EWMS_PILOT_TASK_BATCH_SIZE,
+    task_batch_wait_ms: int = ENV.EWMS_PILOT_TASK_BATCH_WAIT_MS,
     #
     # incoming queue
     queue_incoming: str = ENV.EWMS_PILOT_QUEUE_INCOMING,
@@ -64,6 +87,16 @@ async def consume_and_reply(
     queue_outgoing_auth_token: str = ENV.EWMS_PILOT_QUEUE_OUTGOING_AUTH_TOKEN,
     queue_outgoing_broker_type: str = ENV.EWMS_PILOT_QUEUE_OUTGOING_BROKER_TYPE,
     queue_outgoing_broker_address: str = ENV.EWMS_PILOT_QUEUE_OUTGOING_BROKER_ADDRESS,
+    # outgoing queue - settings
+    outbox: bool = ENV.EWMS_PILOT_OUTBOX,
+    outbox_flush_timeout: int = ENV.EWMS_PILOT_OUTBOX_FLUSH_TIMEOUT,
+    #
+    # broker connections
+    broker_reconnect_timeout: int = ENV.EWMS_PILOT_BROKER_RECONNECT_TIMEOUT,
+    #
+    # result cache
+    result_cache: bool = ENV.EWMS_PILOT_RESULT_CACHE,
+    result_cache_max_gb: float = ENV.EWMS_PILOT_RESULT_CACHE_MAX_GB,
     #
     # for subprocess
     infile_ext: str = ENV.EWMS_PILOT_INFILE_EXT,
@@ -91,19 +124,34 @@ async def consume_and_reply(
     housekeeper = Housekeeping(chirper)
 
     try:
-        # Init command
-        if init_image:
-            await run_init_container(
-                ContainerRunner(
-                    init_image,
-                    init_args,
-                    init_timeout,
-                    ENV.EWMS_PILOT_INIT_ENV_JSON,
-                ),
-                housekeeper,
+        init_runner = (
+            ContainerRunner(
+                init_image,
+                init_args,
+                init_timeout,
+                ENV.EWMS_PILOT_INIT_ENV_JSON,
             )
+            if init_image
+            else None
+        )
+        task_runner = ContainerRunner(
+            task_image,
+            task_args,
+            task_timeout,
+            ENV.EWMS_PILOT_TASK_ENV_JSON,
+            n_resource_slots=(
+                max_concurrent_tasks
+                if ENV.EWMS_PILOT_PARTITION_SLOT_RESOURCES
+                else None
+            ),
+        )
+        worker_pool = (
+            TaskWorkerPool(task_runner, max_concurrent_tasks)
+            if task_worker_mode
+            else None
+        )
 
-        # connect queues
+        # queues -- these connect when opened (see below)
         in_queue = mq.Queue(
             queue_incoming_broker_type,
             address=queue_incoming_broker_address,
@@ -122,29 +170,75 @@ async def consume_and_reply(
             # timeout=timeout_outgoing,  # no timeout needed b/c this queue is only for pub
         )
 
-        task_runner = ContainerRunner(
-            task_image,
-            task_args,
-            task_timeout,
-            ENV.EWMS_PILOT_TASK_ENV_JSON,
-        )
-
         # MQ tasks
-        await _consume_and_reply(
-            task_runner,
-            #
-            in_queue,
-            out_queue,
-            FileExtension(infile_ext),
-            FileExtension(outfile_ext),
-            #
-            timeout_wait_for_first_message,
-            timeout_incoming,
-            #
-            max_concurrent_tasks,
-            #
-            housekeeper,
-        )
+        try:
+            await _consume_and_reply(
+                task_runner,
+                worker_pool,
+                #
+                in_queue,
+                out_queue,
+                FileExtension(infile_ext),
+                FileExtension(outfile_ext),
+                #
+                prefetch,
+                timeout_wait_for_first_message,
+                timeout_incoming,
+                #
+                max_concurrent_tasks,
+                (
+                    ConcurrencyController(
+                        max_concurrent_tasks,
+                        # docker's containers are not in the pilot's cgroup
+                        use_cgroup=ENV._EWMS_PILOT_CONTAINER_PLATFORM.lower()
+                        != "docker",
+                    )
+                    if adaptive_concurrency
+                    else None
+                ),
+                task_batch_size,
+                task_batch_wait_ms,
+                #
+                Outbox(PILOT_DATA_DIR / OUTBOX_FILE_NAME) if outbox else None,
+                outbox_flush_timeout,
+                #
+                broker_reconnect_timeout,
+                #
+                (
+                    ResultCache(
+                        PILOT_DATA_DIR / RESULT_CACHE_DIR_NAME,
+                        int(result_cache_max_gb * 1024**3),
+                        task_image,
+                        task_args,
+                        task_runner.env,
+                        FileExtension(infile_ext),
+                        FileExtension(outfile_ext),
+                        init_image,
+                        init_args,
+                        init_runner.env if init_runner else None,
+                    )
+                    if result_cache
+                    else None
+                ),
+                #
+                housekeeper,
+                #
+                # everything needed before the first task -- done while the queues connect
+                _prepare_for_tasks(
+                    init_runner,
+                    task_runner,
+                    worker_pool,
+                    task_apptainer_instance_mode,
+                    housekeeper,
+                ),
+            )
+        finally:
+            if worker_pool:
+                await worker_pool.stop()
+            await task_runner.stop_instances()
+            await task_runner.close()
+            if init_runner:
+                await init_runner.close()
 
     # ERROR -> Quarantine
     except Exception as e:
@@ -163,15 +257,106 @@ async def consume_and_reply(
         chirper.close()
 
 
+async def _timed_stage(name: str, stage: Awaitable[T], timings: dict[str, float]) -> T:
+    """Await the startup stage, logging & recording how long it took."""
+    LOGGER.info(f"Startup stage '{name}' started")
+    start = time.time()
+    try:
+        return await stage
+    finally:
+        timings[name] = time.time() - start
+        LOGGER.info(f"Startup stage '{name}' ended after {timings[name]:.2f}s")
+
+
+async def _gather_or_cancel(*aws: Awaitable[Any]) -> list[Any]:
+    """Like `asyncio.gather()`, but if one fails, the rest are cancelled.
+
+    The first error is raised as-is.
+    """
+    tasks = [asyncio.ensure_future(a) for a in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def _keep_queues_alive_during(
+    stage: Awaitable[T],
+    connect: "asyncio.Future[list[Any]]",
+    in_queue: mq.Queue,
+    housekeeper: Housekeeping,
+) -> T:
+    """Await the startup stage--meanwhile, once the queues are connected, keep them alive.
+
+    Otherwise, a long stage (ex: the init container) would get the connections
+    dropped by the broker for missing heartbeats (see `queue_housekeeping()`).
+    """
+    task = asyncio.ensure_future(stage)
+    try:
+        while not task.done():
+            await asyncio.wait([task], timeout=REFRESH_INTERVAL)
+            if task.done() or not connect.done() or connect.cancelled():
+                continue
+            if connect.exception() is None:  # else, startup is being cancelled
+                pub, sub = connect.result()
+                await housekeeper.queue_housekeeping(in_queue, sub, pub)
+        return task.result()
+    finally:
+        task.cancel()  # if it's not done, this is being cancelled
+
+
+async def _prepare_for_tasks(
+    init_runner: ContainerRunner | None,
+    task_runner: ContainerRunner,
+    worker_pool: TaskWorkerPool | None,
+    task_apptainer_instance_mode: bool,
+    housekeeper: Housekeeping,
+) -> dict[str, float]:
+    """Do everything needed before the first task, at the same time as possible.
+
+    Return each stage's runtime.
+    """
+    timings: dict[str, float] = {}
+
+    async def _init_container(init_runner: ContainerRunner) -> None:
+        await init_runner.prepare_image()
+        await run_init_container(init_runner, housekeeper)
+
+    # the task image can be prepped (pulled/converted) while the init container runs
+    # -- and, containers leaked by earlier pilots on this node are cleaned up
+    await _gather_or_cancel(
+        _timed_stage(
+            "reap orphaned containers", task_runner.lifecycle.reap_orphans(), timings
+        ),
+        _timed_stage("task image", task_runner.prepare_image(), timings),
+        *(
+            [_timed_stage("init container", _init_container(init_runner), timings)]
+            if init_runner
+            else []
+        ),
+    )
+
+    # these run the task image, so they must wait for the init container
+    if task_apptainer_instance_mode:
+        await _timed_stage("apptainer instance", task_runner.start_instance(), timings)
+    if worker_pool:
+        await _timed_stage("task workers", worker_pool.start(), timings)
+
+    return timings
+
+
 def listener_loop_exit(
-    task_errors: list[BaseException],
+    task_error_type_names: set[str],
     current_msg_waittime: float,
     msg_waittime_timeout: float,
 ) -> bool:
     """Essentially a big IF condition -- but now with logging!"""
     # ERRORS?
-    if task_errors and ENV.EWMS_PILOT_STOP_LISTENING_ON_TASK_ERROR:
-        if any(type(e).__name__ not in ENV.EWMS_PILOT_OKAY_ERRORS for e in task_errors):
+    if task_error_type_names and ENV.EWMS_PILOT_STOP_LISTENING_ON_TASK_ERROR:
+        if any(n not in ENV.EWMS_PILOT_OKAY_ERRORS for n in task_error_type_names):
             # ^^^ equivalent to "if not all(name in ENV.EWMS_PILOT_OKAY_ERRORS ...):", but faster
             LOGGER.info("1+ Tasks Failed: no longer receiving incoming messages")
             return True
@@ -191,6 +376,7 @@ def listener_loop_exit(
 @htchirp_tools.async_htchirp_error_wrapper
 async def _consume_and_reply(
     task_runner: ContainerRunner,
+    worker_pool: TaskWorkerPool | None,
     #
     in_queue: mq.Queue,
     out_queue: mq.Queue,
@@ -199,20 +385,35 @@ async def _consume_and_reply(
     infile_ext: FileExtension,
     outfile_ext: FileExtension,
     #
+    prefetch: int,
     timeout_wait_for_first_message: int | None,
     timeout_incoming: int,
     #
     max_concurrent_tasks: int,
+    concurrency_controller: ConcurrencyController | None,
+    task_batch_size: int,
+    task_batch_wait_ms: int,
+    #
+    outbox: Outbox | None,
+    outbox_flush_timeout: int,
+    #
+    broker_reconnect_timeout: int,
+    #
+    result_cache: ResultCache | None,
     #
     housekeeper: Housekeeping,
+    #
+    prepare_for_tasks: Awaitable[dict[str, float]],
 ) -> None:
     """Consume and reply loop.
 
+    The queues are connected while `prepare_for_tasks` runs; then, tasks start.
+
     Raise an aggregated `RuntimeError` for errors of failed tasks.
     """
     await housekeeper.basic_housekeeping()
 
-    task_maps: list[TaskMapping] = []
+    task_maps = TaskLedger()
 
     # timeouts
     if (
@@ -231,123 +432,441 @@ async def _consume_and_reply(
     in_queue.timeout = REFRESH_INTERVAL
     msg_waittime_timeout = timeout_wait_for_first_message or timeout_incoming
 
-    # GO!
-    LOGGER.info(
-        "Listening for messages from server to process tasks then send results..."
-    )
     #
-    # open pub & sub
-    async with out_queue.open_pub() as pub, in_queue.open_sub_manual_acking() as sub:
+    # open pub & sub -- at the same time as the rest of the startup (keeping them alive, once open)
+    # NOTE: the loop's lag is logged at the end, to see if anything was blocking it
+    async with EventLoopLagMonitor(), contextlib.AsyncExitStack() as queues:
+        timings: dict[str, float] = {}
+        startup_start = time.time()
+        connect = asyncio.ensure_future(
+            _gather_or_cancel(
+                _timed_stage(
+                    "connect outgoing queue",
+                    queues.enter_async_context(
+                        open_pub(out_queue, broker_reconnect_timeout)
+                    ),
+                    timings,
+                ),
+                _timed_stage(
+                    "connect incoming queue",
+                    queues.enter_async_context(
+                        open_sub_manual_acking(in_queue, broker_reconnect_timeout)
+                    ),
+                    timings,
+                ),
+            )
+        )
+        (pub, sub), startup_timings = await _gather_or_cancel(
+            connect,
+            _keep_queues_alive_during(
+                prepare_for_tasks,
+                connect,
+                in_queue,
+                housekeeper,
+            ),
+        )
+        timings.update(startup_timings)
+        LOGGER.info(
+            f"Startup done after {time.time() - startup_start:.2f}s: "
+            + ", ".join(f"{k}={v:.2f}s" for k, v in timings.items())
+        )
+
+        # GO!
+        LOGGER.info(
+            "Listening for messages from server to process tasks then send results..."
+        )
         LOGGER.info(f"Processing up to {max_concurrent_tasks} tasks concurrently")
-        message_iterator = sub.iter_messages()
+        if concurrency_controller:
+            LOGGER.info(
+                f"Adapting task concurrency to the slot's load, "
+                f"starting at {concurrency_controller.limit}"
+            )
         await housekeeper.entered_listener_loop()
-        #
-        # "listener loop" -- get messages and do tasks
-        # intermittently halting to process housekeeping things
-        #
-        msg_waittime_current = 0.0
-        while not listener_loop_exit(
-            [tm.error for tm in task_maps if tm.error],
-            msg_waittime_current,
-            msg_waittime_timeout,
-        ):
-            await housekeeper.queue_housekeeping(in_queue, sub, pub)
-            #
-            # get messages/tasks
-            if TaskMapping.n_pending(task_maps) >= max_concurrent_tasks:
-                LOGGER.debug("At max task concurrency limit")
-            else:
-                LOGGER.debug("Listening for incoming message...")
-                #
-                # TRY TO GET A MESSAGE
-                try:  # StopAsyncIteration -> in_queue.timeout
-                    in_msg = await anext(message_iterator)
-                    msg_waittime_current = 0.0
-                    LOGGER.info(
-                        f"Got a task to process (#{len(task_maps)+1}): {in_msg}"
-                    )
-
-                    # after the first message, set the timeout to the "normal" amount
-                    msg_waittime_timeout = timeout_incoming
-
-                    # start task
-                    task = asyncio.create_task(
-                        process_msg_task(
-                            in_msg,
-                            task_runner,
-                            infile_ext,
-                            outfile_ext,
-                        )
-                    )
-                    task_maps.append(
-                        TaskMapping(
-                            message=in_msg,
-                            asyncio_task=task,
-                            start_time=time.time(),
-                        )
-                    )
-                    await housekeeper.message_received(len(task_maps))
 
-                    continue  # we got one message, let's see if there's another
-                #
-                # NO MESSAGE THIS ROUND
-                except StopAsyncIteration:
-                    #   incrementing by the timeout value allows us to
-                    #   not worry about time not spent waiting for a message
-                    msg_waittime_current += in_queue.timeout
-                    message_iterator = sub.iter_messages()
-
-            # WE GOT AS MANY CONCURRENT MESSAGES AS POSSIBLE (max concurrency or no message in in-queue)
-            # wait on finished task (or timeout)
-            await wait_on_tasks_with_ack(
+        # finished tasks are sent & acked/nacked in the background
+        # -- up to one finished task per message that can be running, then backpressure
+        publisher = OutputPublisher(
+            sub,
+            pub,
+            task_maps,
+            max_concurrent_tasks * task_batch_size,
+            housekeeper,
+            outbox,
+            outbox_flush_timeout,
+        )
+        publisher_task = publisher.start()
+        try:
+            #
+            # "listener loop" -- get messages and do tasks
+            # intermittently halting to process housekeeping things
+            #
+            await _listener_loop(
+                task_runner,
+                worker_pool,
+                in_queue,
                 sub,
                 pub,
+                infile_ext,
+                outfile_ext,
+                prefetch,
+                msg_waittime_timeout,
+                timeout_incoming,
+                max_concurrent_tasks,
+                concurrency_controller,
+                task_batch_size,
+                task_batch_wait_ms,
+                result_cache,
+                housekeeper,
                 task_maps,
-                timeout=REFRESH_INTERVAL,
-            )
-            await housekeeper.new_messages_done(
-                TaskMapping.n_successful(task_maps),
-                TaskMapping.n_failed(task_maps),
+                publisher,
+                publisher_task,
             )
 
-        LOGGER.info("Done listening for messages")
-        await housekeeper.exited_listener_loop()
-
-        #
-        # "clean up loop" -- wait for remaining tasks
-        # intermittently halting to process housekeeping things
-        #
-        if any(tm for tm in task_maps if tm.is_pending):
-            LOGGER.debug("Waiting for remaining tasks to finish...")
-            await housekeeper.pending_remaining_tasks()
-        while any(tm for tm in task_maps if tm.is_pending):
-            await housekeeper.queue_housekeeping(in_queue, sub, pub)
-            # wait on finished task (or timeout)
-            await wait_on_tasks_with_ack(
-                sub,
-                pub,
-                task_maps,
-                timeout=REFRESH_INTERVAL,
-            )
-            await housekeeper.new_messages_done(
-                TaskMapping.n_successful(task_maps),
-                TaskMapping.n_failed(task_maps),
-            )
+            LOGGER.info("Done listening for messages")
+            await housekeeper.exited_listener_loop()
+
+            #
+            # "clean up loop" -- wait for remaining tasks
+            # intermittently halting to process housekeeping things
+            #
+            if task_maps.n_pending:
+                LOGGER.debug("Waiting for remaining tasks to finish...")
+                await housekeeper.pending_remaining_tasks()
+            while task_maps.n_pending:
+                await housekeeper.queue_housekeeping(in_queue, sub, pub)
+                # wait on finished task (or timeout)
+                done, _ = await asyncio.wait(
+                    task_maps.pending_asyncio_tasks | {publisher_task},
+                    return_when=asyncio.FIRST_COMPLETED,
+                    timeout=REFRESH_INTERVAL,
+                )
+                if publisher_task in done:
+                    publisher_task.result()  # raises the publisher's error
+                await publisher.put(
+                    mark_finished_tasks(task_maps, done - {publisher_task})
+                )
+        finally:
+            # send & ack/nack whatever is left
+            await publisher.stop()
 
     # log/chirp
     await housekeeper.done_tasking()
+    if result_cache:
+        result_cache.log_summary()
     LOGGER.info(f"Done Tasking: completed {len(task_maps)} task(s)")
     # check if anything actually processed
     if not task_maps:
         LOGGER.warning("No Messages Were Received.")
 
     # done
-    if any(tm.error for tm in task_maps if tm.error):
-        raise RuntimeError(
-            all_task_errors_string([tm.error for tm in task_maps if tm.error])
-        )
+    if task_maps.errors:
+        raise RuntimeError(all_task_errors_string(task_maps.errors))
 
     # dumps about tasks
     dump_all_taskmaps(task_maps)
     dump_tallies(task_maps)
     dump_task_runtime_stats(task_maps)
+    dump_task_resource_stats(task_maps)
+
+
+async def _listener_loop(
+    task_runner: ContainerRunner,
+    worker_pool: TaskWorkerPool | None,
+    #
+    in_queue: mq.Queue,
+    sub: ReconnectingSubResource,
+    pub: ReconnectingPubResource,
+    #
+    # for subprocess
+    infile_ext: FileExtension,
+    outfile_ext: FileExtension,
+    #
+    prefetch: int,
+    msg_waittime_timeout: float,
+    timeout_incoming: int,
+    #
+    max_concurrent_tasks: int,
+    concurrency_controller: ConcurrencyController | None,
+    task_batch_size: int,
+    task_batch_wait_ms: int,
+    result_cache: ResultCache | None,
+    #
+    housekeeper: Housekeeping,
+    task_maps: TaskLedger,
+    #
+    publisher: OutputPublisher,
+    publisher_task: asyncio.Task,
+) -> None:
+    """Get messages and do tasks until there are no more messages (or a task fails).
+
+    Each of these wakes the loop independently, as soon as it happens:
+        - a prefetched message (if there is room for another task),
+        - a finished task (which is handed to the publisher, to send & ack/nack), and
+        - a housekeeping tick (every `REFRESH_INTERVAL` seconds).
+
+    If `task_batch_size > 1`, each container gets a batch of messages; then,
+    `max_concurrent_tasks` limits the no. of containers (not messages). The
+    `result_cache` (if any) is only used for single-message tasks.
+
+    If there's a `concurrency_controller`, its (changing) limit is used instead,
+    up to `max_concurrent_tasks`.
+    """
+    prefetcher = MessagePrefetcher(
+        sub,
+        prefetch,
+        _max_unsettled(prefetch, max_concurrent_tasks * task_batch_size),
+    )
+    prefetch_task = prefetcher.start()
+    msg_waittime_current = 0.0
+    next_msg_fut: asyncio.Future[Message] | None = None
+    running_batch_tasks: set[asyncio.Task] = set()
+
+    try:
+        while not listener_loop_exit(
+            task_maps.error_type_names,
+            msg_waittime_current,
+            msg_waittime_timeout,
+        ):
+            await housekeeper.queue_housekeeping(in_queue, sub, pub)
+            if concurrency_controller and (
+                change := concurrency_controller.update(task_maps.n_done)
+            ):
+                await housekeeper.concurrency_limit_changed(*change)
+            #
+            # get a message -- but only if there's room for another task
+            if next_msg_fut is None and _has_room_for_task(
+                task_maps,
+                running_batch_tasks,
+                task_batch_size,
+                max_concurrent_tasks,
+                concurrency_controller,
+            ):
+                LOGGER.debug("Listening for incoming message...")
+                next_msg_fut = asyncio.ensure_future(prefetcher.buffer.get())
+            #
+            # WAIT ON WHATEVER HAPPENS FIRST:
+            #   a new message, a finished task, or a housekeeping tick (timeout)
+            pending_tasks = task_maps.pending_asyncio_tasks
+            waitables: set[asyncio.Future] = pending_tasks | {
+                prefetch_task,
+                publisher_task,
+            }
+            if next_msg_fut:
+                waitables.add(next_msg_fut)
+            wait_start = time.time()
+            done, _ = await asyncio.wait(
+                waitables,
+                return_when=asyncio.FIRST_COMPLETED,
+                timeout=REFRESH_INTERVAL,
+            )
+            _raise_background_error(done, prefetch_task, publisher_task)
+            #
+            # GOT A MESSAGE?
+            if next_msg_fut and next_msg_fut in done:
+                in_msg, next_msg_fut = next_msg_fut.result(), None
+                msg_waittime_current = 0.0
+                # after the first message, set the timeout to the "normal" amount
+                msg_waittime_timeout = timeout_incoming
+                await _start_msg(
+                    in_msg,
+                    prefetcher,
+                    task_runner,
+                    worker_pool,
+                    infile_ext,
+                    outfile_ext,
+                    task_batch_size,
+                    task_batch_wait_ms,
+                    result_cache,
+                    task_maps,
+                    running_batch_tasks,
+                )
+                await housekeeper.message_received(len(task_maps))
+            elif next_msg_fut:
+                #   only counting while there was room for a task allows us to
+                #   not worry about time not spent waiting for a message
+                msg_waittime_current += time.time() - wait_start
+            #
+            # ANY FINISHED TASKS? -- hand them to the publisher right away
+            if newly_done := {t for t in done if t in pending_tasks}:
+                await publisher.put(mark_finished_tasks(task_maps, newly_done))
+    finally:
+        # stop listening -- and give back any messages that won't be started
+        if next_msg_fut and not next_msg_fut.cancel():
+            # already done, so it got a message that was never started
+            prefetcher.return_unstarted(next_msg_fut.result())
+        await prefetcher.stop()
+
+
+def _has_room_for_task(
+    task_maps: TaskLedger,
+    running_batch_tasks: set[asyncio.Task],
+    task_batch_size: int,
+    max_concurrent_tasks: int,
+    concurrency_controller: ConcurrencyController | None,
+) -> bool:
+    """Get whether there's room for another task (or batch) under the concurrency limit.
+
+    Finished batch tasks are removed from `running_batch_tasks`.
+    """
+    if task_batch_size > 1:
+        running_batch_tasks.difference_update(
+            [t for t in running_batch_tasks if t.done()]
+        )
+        n_running = len(running_batch_tasks)
+    else:
+        n_running = task_maps.n_pending
+    if concurrency_controller:
+        concurrency_controller.note_running(n_running)
+        limit = concurrency_controller.limit
+    else:
+        limit = max_concurrent_tasks
+    if n_running >= limit:
+        LOGGER.debug("At max task concurrency limit")
+        return False
+    return True
+
+
+def _raise_background_error(
+    done: Collection[asyncio.Future[Any]],
+    *background_tasks: asyncio.Task,
+) -> None:
+    """Raise the error of any finished background task (they only finish on error).
+
+    Ex: the prefetcher's or the publisher's.
+    """
+    for task in background_tasks:
+        if task in done:
+            task.result()
+
+
+async def _start_msg(
+    in_msg: Message,
+    prefetcher: MessagePrefetcher,
+    task_runner: ContainerRunner,
+    worker_pool: TaskWorkerPool | None,
+    infile_ext: FileExtension,
+    outfile_ext: FileExtension,
+    task_batch_size: int,
+    task_batch_wait_ms: int,
+    result_cache: ResultCache | None,
+    task_maps: TaskLedger,
+    running_batch_tasks: set[asyncio.Task],
+) -> None:
+    """Start the message's task--or if batching, a batch task, filled from the prefetcher."""
+    if task_batch_size > 1:
+        running_batch_tasks.add(
+            _start_batch_task(
+                await prefetcher.fill_batch(
+                    in_msg,
+                    task_batch_size,
+                    task_batch_wait_ms / 1000,
+                ),
+                task_runner,
+                infile_ext,
+                outfile_ext,
+                task_maps,
+            )
+        )
+    else:
+        _start_task(
+            in_msg,
+            task_runner,
+            worker_pool,
+            infile_ext,
+            outfile_ext,
+            task_maps,
+            result_cache,
+        )
+
+
+def _max_unsettled(prefetch: int, max_running: int) -> int:
+    """Get the most received-but-not-acked/nacked messages worth receiving.
+
+    That's one per running task, plus a full prefetch buffer.
+    """
+    return max_running + prefetch
+
+
+def _start_task(
+    in_msg: Message,
+    task_runner: ContainerRunner,
+    worker_pool: TaskWorkerPool | None,
+    infile_ext: FileExtension,
+    outfile_ext: FileExtension,
+    task_maps: TaskLedger,
+    result_cache: ResultCache | None,
+) -> None:
+    """Start processing the message's task in the background.
+
+    If there's a result cache, an identical task's result may be reused instead.
+    """
+    LOGGER.info(f"Got a task to process (#{len(task_maps)+1}): {in_msg}")
+    resource_usage = ResourceUsage()
+    if worker_pool:
+        run = functools.partial(
+            process_msg_task_on_worker,
+            in_msg,
+            worker_pool,
+            infile_ext,
+            outfile_ext,
+            resource_usage,
+        )
+    else:
+        run = functools.partial(
+            process_msg_task,
+            in_msg,
+            task_runner,
+            infile_ext,
+            outfile_ext,
+            resource_usage,
+        )
+    task = asyncio.create_task(
+        result_cache.get_or_run(in_msg, run) if result_cache else run()
+    )
+    task_maps.add(
+        TaskMapping(
+            message=in_msg,
+            asyncio_task=task,
+            start_time=time.time(),
+            resource_usage=resource_usage,
+        )
+    )
+
+
+def _start_batch_task(
+    in_msgs: list[Message],
+    task_runner: ContainerRunner,
+    infile_ext: FileExtension,
+    outfile_ext: FileExtension,
+    task_maps: TaskLedger,
+) -> asyncio.Task:
+    """Start processing the messages' tasks (in one container) in the background.
+
+    Each message still gets its own asyncio task, so each is acked/nacked on its own.
+    """
+    LOGGER.info(
+        f"Got a batch of {len(in_msgs)} tasks to process "
+        f"(#{len(task_maps)+1}-#{len(task_maps)+len(in_msgs)}): {in_msgs}"
+    )
+    resource_usages = {m.uuid: ResourceUsage() for m in in_msgs}
+    batch_task = asyncio.create_task(
+        process_msg_batch_task(
+            in_msgs,
+            task_runner,
+            infile_ext,
+            outfile_ext,
+            resource_usages,
+        )
+    )
+    for in_msg in in_msgs:
+        task_maps.add(
+            TaskMapping(
+                message=in_msg,
+                asyncio_task=asyncio.create_task(
+                    get_msg_result_from_batch(in_msg, batch_task)
+                ),
+                start_time=time.time(),
+                resource_usage=resource_usages[in_msg.uuid],
+            )
+        )
+    return batch_task
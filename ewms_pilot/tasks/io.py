@@ -1,12 +1,19 @@
 """Tools for controlling sub-processes' input/output."""
 
-import json
+import locale
 import logging
+import mmap
+import os
 from pathlib import Path
 from typing import Any
 
 from mqclient.broker_client_interface import Message
 
+from .passthrough import RawJSON, extract_raw_data
+from ..config import ENV
+from ..utils import json_codec
+from ..utils.offload import run_blocking
+
 LOGGER = logging.getLogger(__name__)
 
 
@@ -43,11 +50,24 @@ class InFileInterface:
         cls._write(in_msg, fpath)
         LOGGER.info(f"INFILE :: {fpath} ({fpath.stat().st_size} bytes)")
 
+    @classmethod
+    async def write_async(cls, in_msg: Message, fpath: Path) -> None:
+        """Write `in_msg` to `fpath`, without blocking the event loop."""
+        await run_blocking(cls.write, in_msg, fpath)
+
     @classmethod
     def _write(cls, in_msg: Message, fpath: Path) -> None:
         LOGGER.info(f"Writing to file: {fpath}")
         LOGGER.debug(in_msg)
 
+        # PASSTHROUGH -- the message's (json) data, as-is
+        if ENV.EWMS_PILOT_JSON_PASSTHROUGH and fpath.suffix == ".json":
+            if (raw := extract_raw_data(in_msg)) is not None:
+                with open(fpath, "wb") as f:
+                    f.write(raw)
+                return
+            # not json (ex: a string) -> fall back to the usual handling
+
         # PLAIN TEXT
         if isinstance(in_msg.data, str):  # ex: text, yaml string, json string
             with open(fpath, "w") as f:
@@ -61,10 +81,11 @@ class InFileInterface:
             # -> json infile
             if fpath.suffix == ".json":
                 try:
-                    with open(fpath, "w") as f:
-                        json.dump(in_msg.data, f)
+                    data = json_codec.codec().dumps(in_msg.data)
                 except TypeError as e:
                     raise InvalidDataForInfileException(str(e), fpath)
+                with open(fpath, "wb") as f:
+                    f.write(data)
             # -> *NOT* json infile
             else:
                 raise InvalidDataForInfileException(
@@ -84,35 +105,58 @@ class NoTaskResponseException(Exception):
 class OutFileInterface:
     """Support reading an outfile for use in a message."""
 
+    MMAP_THRESHOLD = 1024**2  # bytes -- map files at least this big, read smaller ones
+
     @classmethod
     def read(cls, fpath: Path) -> Any:
         """Read and return contents of `fpath`."""
-        if not fpath.exists():
+        try:
+            data = cls._read(fpath)
+        except FileNotFoundError:
             raise NoTaskResponseException(f"Outfile was not found: {fpath}")
-
-        LOGGER.info(f"OUTFILE :: {fpath} ({fpath.stat().st_size} bytes)")
-        data = cls._read(fpath)
         LOGGER.debug(data)
         return data
 
+    @classmethod
+    async def read_async(cls, fpath: Path) -> Any:
+        """Read and return contents of `fpath`, without blocking the event loop."""
+        return await run_blocking(cls.read, fpath)
+
     @classmethod
     def _read(cls, fpath: Path) -> Any:
         LOGGER.info(f"Reading from file: {fpath}")
 
+        # the file is read (or mapped) once, then decoded from that buffer
+        with open(fpath, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            LOGGER.info(f"OUTFILE :: {fpath} ({size} bytes)")
+            # PASSTHROUGH -- the outfile's bytes, as-is (no need to map these)
+            if ENV.EWMS_PILOT_JSON_PASSTHROUGH and fpath.suffix == ".json":
+                if not size:
+                    raise InvalidDataFromOutfileException("Empty JSON", fpath)
+                return RawJSON(f.read())
+            if size < cls.MMAP_THRESHOLD:
+                return cls._decode(f.read(), fpath)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                return cls._decode(buf, fpath)
+
+    @classmethod
+    def _decode(cls, buf: bytes | mmap.mmap, fpath: Path) -> Any:
         # json outfile -> OBJECT
         if fpath.suffix == ".json":
-            with open(fpath, "r") as f:  # plain text
-                try:
-                    return json.load(f)
-                except TypeError as e:
-                    raise InvalidDataFromOutfileException(str(e), fpath)
+            try:
+                return json_codec.codec().loads(buf)
+            except TypeError as e:
+                raise InvalidDataFromOutfileException(str(e), fpath)
         # non-json outfile...
         else:
-            # PLAIN TEXT
+            # PLAIN TEXT -- like reading in text mode: the locale's encoding & newlines
             try:
-                with open(fpath, "r") as f:  # plain text
-                    return f.read()
+                text = str(buf, locale.getpreferredencoding(False))
             # BYTES
             except UnicodeDecodeError:
-                with open(fpath, "rb") as f:  # bytes
-                    return f.read()
+                # no copy if it was read, one copy if it was mapped
+                return buf if isinstance(buf, bytes) else buf[:]
+            if "\r" in text:  # universal newlines
+                text = text.replace("\r\n", "\n").replace("\r", "\n")
+            return text
@@ -3,9 +3,13 @@
 import asyncio
 import dataclasses as dc
 import time
+from typing import Iterable, Iterator
 
 from mqclient.broker_client_interface import Message
 
+from ..utils.resources import ResourceUsage
+from ..utils.stats import RuntimeStats
+
 
 @dc.dataclass
 class TaskMapping:
@@ -23,6 +27,9 @@ class TaskMapping:
     # could be the asyncio task exception or an error from downstream handling
     error: BaseException | None = None
 
+    # filled in as the task's container runs
+    resource_usage: ResourceUsage | None = None
+
     def mark_done(self) -> None:
         """Mark the task done and update attrs."""
         if self.is_done:
@@ -38,31 +45,168 @@ class TaskMapping:
         """
         return not self.is_done
 
+    @property
+    def uuid(self) -> int:
+        """The message's uuid."""
+        return self.message.uuid
+
+
+class TaskRecord:
+    """A compact summary of a finished (acked/nacked) task.
+
+    Unlike a TaskMapping, this holds no message (payload) nor asyncio task (result).
+    """
+
+    __slots__ = ("uuid", "start_time", "end_time", "error", "resource_usage")
+
+    is_done = True
+    is_pending = False
+
+    def __init__(
+        self,
+        uuid: int,
+        start_time: float,
+        end_time: float,
+        error: str | None,  # the error's signature -- its repr
+        resource_usage: ResourceUsage | None = None,
+    ) -> None:
+        self.uuid = uuid
+        self.start_time = start_time
+        self.end_time = end_time
+        self.error = error
+        self.resource_usage = resource_usage
+
     @staticmethod
+    def from_taskmapping(tmap: TaskMapping) -> "TaskRecord":
+        """Make a TaskRecord from a done TaskMapping."""
+        if not tmap.is_done:
+            raise RuntimeError("Attempted to make a record of a pending task.")
+        return TaskRecord(
+            tmap.uuid,
+            tmap.start_time,
+            tmap.end_time,
+            repr(tmap.error) if tmap.error else None,
+            tmap.resource_usage,
+        )
+
+
+def _release_traceback(error: BaseException | None) -> None:
+    """Drop the traceback(s), which reference the task's frames (and its message)."""
+    while error is not None:
+        error.__traceback__ = None
+        error = error.__cause__ or error.__context__
+
+
+class TaskLedger:
+    """An indexed record of every task--as a TaskMapping or, once compacted, a TaskRecord.
+
+    Lookups (by asyncio task or by message uuid) and all tallies are O(1),
+    so bookkeeping does not slow down as the number of tasks grows.
+    """
+
+    def __init__(self, task_maps: Iterable[TaskMapping] = ()) -> None:
+        # NOTE: dicts keep insertion order, so this is in order of arrival (for dumps)
+        self._by_uuid: dict[int, TaskMapping | TaskRecord] = {}
+        self._by_asyncio_task: dict[asyncio.Task, TaskMapping] = {}
+        self._pending: dict[asyncio.Task, TaskMapping] = {}  # used as an ordered set
+
+        self.n_done = 0
+        self.n_failed = 0
+        self.errors: list[BaseException] = []
+        self.error_type_names: set[str] = set()
+
+        # runtimes of successful tasks -- these are added as tasks are compacted
+        self.runtime_stats = RuntimeStats()
+        # same, for each of ResourceUsage's (known) values
+        self.resource_stats: dict[str, RuntimeStats] = {}
+
+        for tmap in task_maps:
+            self.add(tmap)
+
+    def __len__(self) -> int:
+        return len(self._by_uuid)
+
+    def __iter__(self) -> Iterator[TaskMapping | TaskRecord]:
+        return iter(self._by_uuid.values())
+
+    def add(self, tmap: TaskMapping) -> None:
+        """Add a TaskMapping (pending or not) to the ledger."""
+        self._by_uuid[tmap.uuid] = tmap
+        self._by_asyncio_task[tmap.asyncio_task] = tmap
+
+        if tmap.is_pending:
+            self._pending[tmap.asyncio_task] = tmap
+        else:
+            self.n_done += 1
+            if tmap.error:
+                self._record_error(tmap.error)
+
     def get(
-        task_maps: list["TaskMapping"],
+        self,
         /,
         asyncio_task: asyncio.Task | None = None,
-    ) -> "TaskMapping":
-        """Retrieves the object mapped with the given asyncio task."""
-        return next(tm for tm in task_maps if tm.asyncio_task == asyncio_task)
+        uuid: int | None = None,
+    ) -> TaskMapping | TaskRecord:
+        """Retrieves the object mapped with the given asyncio task or message uuid.
 
-    @staticmethod
-    def n_pending(task_maps: list["TaskMapping"]) -> int:
-        """Returns the number of pending tasks."""
-        return len([tm for tm in task_maps if tm.is_pending])
+        NOTE: a compacted task can only be retrieved by its uuid.
+        """
+        if asyncio_task is not None:
+            return self._by_asyncio_task[asyncio_task]
+        if uuid is not None:
+            return self._by_uuid[uuid]
+        raise ValueError("Either 'asyncio_task' or 'uuid' must be given")
 
-    @staticmethod
-    def n_done(task_maps: list["TaskMapping"]) -> int:
-        """Returns the number of done tasks."""
-        return len([tm for tm in task_maps if tm.is_done])
+    def get_taskmapping(self, asyncio_task: asyncio.Task) -> TaskMapping:
+        """Retrieves the (not-yet-compacted) object mapped with the given asyncio task."""
+        return self._by_asyncio_task[asyncio_task]
 
-    @staticmethod
-    def n_successful(task_maps: list["TaskMapping"]) -> int:
-        """Returns the number of successful tasks."""
-        return len([tm for tm in task_maps if tm.is_done and not tm.error])
+    def compact(self, tmap: TaskMapping) -> None:
+        """Replace a done TaskMapping with a TaskRecord, releasing its message and asyncio task.
 
-    @staticmethod
-    def n_failed(task_maps: list["TaskMapping"]) -> int:
-        """Returns the number of failed tasks."""
-        return len([tm for tm in task_maps if tm.is_done and tm.error])
+        Call this once the task's message has been acked/nacked.
+        """
+        self._by_uuid[tmap.uuid] = TaskRecord.from_taskmapping(tmap)
+        del self._by_asyncio_task[tmap.asyncio_task]
+        _release_traceback(tmap.error)
+
+        if not tmap.error:
+            self.runtime_stats.add(tmap.end_time - tmap.start_time)
+            if tmap.resource_usage:
+                for name, value in tmap.resource_usage.to_dict().items():
+                    self.resource_stats.setdefault(name, RuntimeStats()).add(value)
+
+    def mark_done(self, tmap: TaskMapping) -> None:
+        """Mark the task done and update tallies."""
+        tmap.mark_done()
+        del self._pending[tmap.asyncio_task]
+        self.n_done += 1
+
+    def mark_failed(self, tmap: TaskMapping, error: BaseException) -> None:
+        """Record the error for an already-done task and update tallies."""
+        if not tmap.is_done:
+            raise RuntimeError("Attempted to mark a pending task as failed.")
+        if tmap.error:
+            raise RuntimeError("Attempted to mark an already-failed task as failed.")
+        tmap.error = error
+        self._record_error(error)
+
+    def _record_error(self, error: BaseException) -> None:
+        self.n_failed += 1
+        self.errors.append(error)
+        self.error_type_names.add(type(error).__name__)
+
+    @property
+    def pending_asyncio_tasks(self) -> set[asyncio.Task]:
+        """Returns the asyncio tasks of all pending tasks."""
+        return set(self._pending)
+
+    @property
+    def n_pending(self) -> int:
+        """Returns the number of pending tasks."""
+        return len(self._pending)
+
+    @property
+    def n_successful(self) -> int:
+        """Returns the number of successful tasks."""
+        return self.n_done - self.n_failed
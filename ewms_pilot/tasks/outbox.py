@@ -0,0 +1,159 @@
+"""A durable, on-disk outbox for output-events that couldn't be sent (yet)."""
+
+import contextlib
+import dataclasses as dc
+import logging
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Iterator
+
+from mqclient.broker_client_interface import Message
+from mqclient.telemetry import inject_links_carrier
+
+from . import passthrough
+from .map import TaskMapping
+from ..utils.lifecycle import current_owner, owner_is_alive
+from ..utils.offload import run_blocking
+
+LOGGER = logging.getLogger(__name__)
+
+OUTBOX_FILE_NAME = "outbox.sqlite"
+
+
+def serialize_output(output_event: Any) -> bytes:
+    """Get the message bytes for the output-event, like `QueuePubResource.send()`."""
+    if isinstance(output_event, passthrough.RawJSON):
+        return passthrough.serialize(output_event, inject_links_carrier())
+    return Message.serialize(output_event, headers=inject_links_carrier())
+
+
+@dc.dataclass(eq=False)
+class OutboxEntry:
+    """An output-event (as message bytes) waiting to be sent."""
+
+    id: int
+    msg_bytes: bytes
+    # the finished task, whose message is acked once this is sent
+    # -- None if left by an earlier pilot (its message was already given back)
+    tmap: TaskMapping | None
+
+    n_attempts: int = 0
+    next_attempt: float = 0.0
+
+
+class Outbox:
+    """Output-events that couldn't be sent (yet), kept in a SQLite file until they are.
+
+    The file is shared by the pilots on a node: each entry is owned by the
+    pilot that added it (see `current_owner()`). When a pilot starts, it takes
+    over the entries of any pilot that has died (see `adopt_leftovers()`).
+
+    The disk I/O runs on the I/O thread pool, except when the outbox is created.
+    """
+
+    RETRY_DELAY_MIN = 1.0  # sec -- doubled after each failed attempt...
+    RETRY_DELAY_MAX = 60.0  # sec -- up to this
+
+    def __init__(self, fpath: Path) -> None:
+        self.fpath = fpath
+        self.owner = current_owner()
+        self.pending: list[OutboxEntry] = []
+
+        fpath.parent.mkdir(parents=True, exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "owner TEXT NOT NULL, "
+                "created REAL NOT NULL, "
+                "msg_bytes BLOB NOT NULL)"
+            )
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # NOTE: a connection per transaction, so any thread can use this
+        conn = sqlite3.connect(self.fpath, timeout=60, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")  # lock out other pilots' writes
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    async def add(self, msg_bytes: bytes, tmap: TaskMapping | None) -> OutboxEntry:
+        """Store the output-event, to be sent later."""
+        entry_id = await run_blocking(self._insert, msg_bytes)
+        entry = OutboxEntry(entry_id, msg_bytes, tmap)
+        self.reschedule(entry)
+        self.pending.append(entry)
+        return entry
+
+    async def remove(self, entry: OutboxEntry) -> None:
+        """Delete the (now sent) output-event."""
+        await run_blocking(self._delete, entry.id)
+        self.pending.remove(entry)
+
+    def abandon(self, entry: OutboxEntry) -> None:
+        """Stop sending the output-event, but keep it for the next pilot on this node."""
+        self.pending.remove(entry)
+
+    async def adopt_leftovers(self) -> int:
+        """Take over the entries of pilots that have died. Return how many."""
+        adopted = [
+            OutboxEntry(entry_id, msg_bytes, None)
+            for entry_id, msg_bytes in await run_blocking(self._adopt)
+        ]
+        self.pending.extend(adopted)
+        return len(adopted)
+
+    def _insert(self, msg_bytes: bytes) -> int:
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO outbox (owner, created, msg_bytes) VALUES (?, ?, ?)",
+                (self.owner, time.time(), msg_bytes),
+            )
+        return cursor.lastrowid or 0
+
+    def _delete(self, entry_id: int) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM outbox WHERE id = ?", (entry_id,))
+
+    def _adopt(self) -> list[tuple[int, bytes]]:
+        with self._transaction() as conn:
+            owners = [
+                row[0]
+                for row in conn.execute(
+                    "SELECT DISTINCT owner FROM outbox WHERE owner != ?", (self.owner,)
+                )
+            ]
+            adopted: list[tuple[int, bytes]] = []
+            for owner in owners:
+                if owner_is_alive(owner):
+                    continue
+                adopted.extend(
+                    conn.execute(
+                        "SELECT id, msg_bytes FROM outbox WHERE owner = ?", (owner,)
+                    )
+                )
+                conn.execute(
+                    "UPDATE outbox SET owner = ? WHERE owner = ?", (self.owner, owner)
+                )
+        return sorted(adopted)  # in order of when they were added
+
+    def due(self) -> list[OutboxEntry]:
+        """Get the entries that are due for another attempt."""
+        now = time.time()
+        return [e for e in self.pending if e.next_attempt <= now]
+
+    def reschedule(self, entry: OutboxEntry) -> None:
+        """Schedule the entry's next attempt, backing off exponentially."""
+        entry.next_attempt = time.time() + min(
+            self.RETRY_DELAY_MAX,
+            self.RETRY_DELAY_MIN * 2**entry.n_attempts,
+        )
+        entry.n_attempts += 1
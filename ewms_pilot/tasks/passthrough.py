@@ -0,0 +1,105 @@
+"""Passing JSON between the queues and task files without (re)serializing it.
+
+mqclient sends a message as a zstd-compressed JSON envelope:
+
+    {"headers": {...}, "data": <the data>}
+
+In passthrough mode (`EWMS_PILOT_JSON_PASSTHROUGH`), for '.json' task files,
+the data is sliced out of (inbound), or spliced into (outbound), the envelope
+as bytes: the pilot never decodes or re-encodes it.
+"""
+
+import dataclasses as dc
+import json
+import logging
+
+import zstd  # type: ignore[import-not-found]  # a dependency of mqclient
+from mqclient.broker_client_interface import Message
+from mqclient.telemetry import inject_links_carrier
+
+from .reconnect import ReconnectingPubResource, send_message_bytes
+from ..utils.offload import run_blocking
+
+LOGGER = logging.getLogger(__name__)
+
+# mqclient's envelope, as written by `Message.serialize()`
+_ENVELOPE_START = b'{"headers": '
+_DATA_KEY = b', "data": '
+_ENVELOPE_END = b"}"
+# same as `Message.serialize()`
+_ZSTD_LEVEL = 3
+_ZSTD_THREADS = 1
+
+
+@dc.dataclass(frozen=True)
+class RawJSON:
+    """Pre-serialized JSON (ex: an outfile's contents), to be sent as-is."""
+
+    data: bytes
+
+    def __repr__(self) -> str:
+        return f"RawJSON({len(self.data)} bytes)"
+
+
+def serialize(raw: RawJSON, headers: dict | None = None) -> bytes:
+    """Get the message bytes for `raw`, like `Message.serialize()` would for an object."""
+    return zstd.compress(
+        b"".join(
+            [
+                _ENVELOPE_START,
+                json.dumps(headers or {}).encode(),
+                _DATA_KEY,
+                raw.data,
+                _ENVELOPE_END,
+            ]
+        ),
+        _ZSTD_LEVEL,
+        _ZSTD_THREADS,
+    )
+
+
+def _find_data_start(envelope: bytes) -> int | None:
+    """Get where the data starts in the envelope, decoding only the headers.
+
+    The headers end at the first `_DATA_KEY` that comes right after a whole
+    JSON object (a `_DATA_KEY` inside a header string can't), so each
+    candidate's prefix is tried--the data, which may be many MB, is not
+    decoded or copied.
+    """
+    if not envelope.startswith(_ENVELOPE_START):
+        return None
+    end = envelope.find(_DATA_KEY, len(_ENVELOPE_START))
+    while end != -1:
+        try:
+            json.loads(envelope[len(_ENVELOPE_START) : end])
+            return end + len(_DATA_KEY)
+        except ValueError:  # incl. UnicodeDecodeError
+            end = envelope.find(_DATA_KEY, end + 1)
+    return None
+
+
+def extract_raw_data(in_msg: Message) -> memoryview | None:
+    """Get the message's data as serialized JSON, without decoding it.
+
+    Return None if the payload isn't in mqclient's envelope format, or if the
+    data is a string (strings are written as-is, not as JSON).
+    """
+    try:
+        envelope = zstd.decompress(in_msg.payload)
+    except zstd.Error:
+        return None
+
+    start = _find_data_start(envelope)
+    if start is None or not envelope.endswith(_ENVELOPE_END):
+        return None
+    data = memoryview(envelope)[start : -len(_ENVELOPE_END)]
+    if data[:1] == b'"':
+        return None
+    return data
+
+
+async def send_raw(pub: ReconnectingPubResource, raw: RawJSON) -> None:
+    """Send `raw` as a message, like `QueuePubResource.send()` would for an object."""
+    msg_bytes = await run_blocking(serialize, raw, inject_links_carrier())
+    LOGGER.info(f"Sending Message (passthrough): {len(msg_bytes)} bytes")
+    await send_message_bytes(pub, msg_bytes)
@@ -0,0 +1,137 @@
+"""Logic for receiving incoming messages ahead of time."""
+
+import asyncio
+import contextlib
+import logging
+import time
+
+from mqclient.broker_client_interface import Message
+
+from .reconnect import ReconnectingSubResource
+
+LOGGER = logging.getLogger(__name__)
+
+
+class MessagePrefetcher:
+    """Receive messages in the background, keeping them in a bounded local buffer.
+
+    A buffered message has been received, but its task has not been started.
+    This way, a new task can start the moment a slot frees up--without waiting
+    on a round trip to the broker.
+
+    A receive blocks the event loop (the broker clients are synchronous), so
+    there's only a receive when the broker could deliver: when the buffer has
+    room and there are fewer than `max_unsettled` received messages that are
+    not yet acked/nacked (see `ReconnectingSubResource.n_unsettled`).
+    """
+
+    POLL_INTERVAL = 0.05  # sec -- how often to check if there's room for a message
+
+    def __init__(
+        self,
+        sub: ReconnectingSubResource,
+        buffer_size: int,
+        max_unsettled: int,
+    ) -> None:
+        self.sub = sub
+        self.buffer: asyncio.Queue[Message] = asyncio.Queue(maxsize=max(buffer_size, 1))
+        self.max_unsettled = max(max_unsettled, 1)
+
+        self._task: asyncio.Task | None = None
+        # received messages that will never be started (ex: were in hand when stopped)
+        self._unstarted: list[Message] = []
+
+        sub.reconnector.on_reconnect.append(self._drop_buffered)
+
+    def start(self) -> asyncio.Task:
+        """Start receiving messages in the background.
+
+        The returned task only finishes if there's an error (ex: a broker error).
+        """
+        LOGGER.info(f"Prefetching up to {self.buffer.maxsize} message(s)")
+        self._task = asyncio.create_task(self._consume())
+        return self._task
+
+    def _has_room(self) -> bool:
+        return (
+            not self.buffer.full() and self.sub.n_unsettled < self.max_unsettled
+        )
+
+    async def _consume(self) -> None:
+        while True:
+            while not self._has_room():
+                await asyncio.sleep(self.POLL_INTERVAL)
+            async with contextlib.aclosing(self.sub.iter_messages()) as msgs:
+                async for msg in msgs:
+                    try:
+                        await self.buffer.put(msg)
+                    except asyncio.CancelledError:
+                        self._unstarted.append(msg)
+                        raise
+                    if not self._has_room():
+                        break
+                else:
+                    # the iterator timed out -- there's no need to throw anything away, just keep listening
+                    LOGGER.debug(
+                        "No incoming message (yet), prefetcher is still listening..."
+                    )
+
+    def _drop_buffered(self) -> None:
+        """Throw away the buffered messages, since their connection was lost.
+
+        They can't be acked anymore, and the broker redelivers them anyway.
+        """
+        n_dropped = 0
+        while not self.buffer.empty():
+            self.sub.discard(self.buffer.get_nowait())
+            n_dropped += 1
+        if n_dropped:
+            LOGGER.warning(f"Dropped {n_dropped} prefetched message(s) from the lost connection")
+
+    async def fill_batch(self, first: Message, size: int, wait: float) -> list[Message]:
+        """Get a batch of up to `size` messages, waiting up to `wait` seconds in total to fill it."""
+        msgs = [first]
+        deadline = time.monotonic() + wait
+        try:
+            while len(msgs) < size:
+                if not self.buffer.empty():
+                    msgs.append(self.buffer.get_nowait())
+                    continue
+                if (remaining := deadline - time.monotonic()) <= 0:
+                    break
+                try:
+                    msgs.append(await asyncio.wait_for(self.buffer.get(), remaining))
+                except (TimeoutError, asyncio.exceptions.TimeoutError):
+                    break
+        except asyncio.CancelledError:
+            self._unstarted.extend(msgs)
+            raise
+        return msgs
+
+    def return_unstarted(self, msg: Message) -> None:
+        """Hand back a message whose task will never be started."""
+        self._unstarted.append(msg)
+
+    async def stop(self) -> None:
+        """Stop receiving messages, then nack all unstarted messages.
+
+        Nacking lets the broker redeliver these right away, instead of after
+        this pilot's connection is closed.
+        """
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass  # any error was already raised by the listener loop
+
+        while not self.buffer.empty():
+            self._unstarted.append(self.buffer.get_nowait())
+        if self._unstarted:
+            LOGGER.info(f"Nacking {len(self._unstarted)} unstarted message(s)...")
+        for msg in self._unstarted:
+            try:
+                await self.sub.nack(msg)
+            except Exception as e:
+                LOGGER.error(f"Could not nack unstarted message: {repr(e)}")
+        self._unstarted = []
@@ -0,0 +1,172 @@
+"""Logic for sending finished tasks' outputs in the background."""
+
+import asyncio
+import logging
+import time
+
+from .map import TaskLedger, TaskMapping
+from .outbox import Outbox
+from .reconnect import ReconnectingPubResource, ReconnectingSubResource
+from .wait_on_tasks import abandon_outbox, handle_finished_tasks, retry_outbox
+from ..housekeeping import Housekeeping
+from ..utils.stats import RuntimeStats
+
+LOGGER = logging.getLogger(__name__)
+
+
+class OutputPublisher:
+    """Send finished tasks' outputs, then ack/nack their messages, in the background.
+
+    Finished tasks are handed over through a bounded queue, so a slow broker
+    only holds up the listener loop once the queue is full (backpressure).
+    Everything in the queue is handled as one batch (see `handle_finished_tasks()`).
+
+    If there's an `outbox`, output-events that can't be sent are kept there,
+    and retried in the background (along with any left by earlier pilots).
+    """
+
+    def __init__(
+        self,
+        sub: ReconnectingSubResource,
+        pub: ReconnectingPubResource,
+        task_maps: TaskLedger,
+        queue_size: int,
+        housekeeper: Housekeeping,
+        outbox: Outbox | None = None,
+        outbox_flush_timeout: float = 0,
+    ) -> None:
+        self.sub = sub
+        self.pub = pub
+        self.task_maps = task_maps
+        self.housekeeper = housekeeper
+        self.outbox = outbox
+        self.outbox_flush_timeout = outbox_flush_timeout
+        self.queue: asyncio.Queue[TaskMapping] = asyncio.Queue(maxsize=max(queue_size, 1))
+
+        self._task: asyncio.Task | None = None
+
+        # metrics
+        self.send_latency = RuntimeStats()  # sec, per output-event
+        self.queue_depth = RuntimeStats()  # no. of finished tasks waiting, per batch
+
+    def start(self) -> asyncio.Task:
+        """Start sending in the background.
+
+        The returned task only finishes if there's an error (ex: a broker error).
+        """
+        LOGGER.info(f"Queueing up to {self.queue.maxsize} finished task(s) to send")
+        self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def put(self, finished: list[TaskMapping]) -> None:
+        """Hand over finished tasks--this waits while the queue is full."""
+        for tmap in finished:
+            if self.queue.full():
+                LOGGER.warning(
+                    f"Finished-task queue is full ({self.queue.maxsize}), "
+                    f"waiting on the broker..."
+                )
+            await self.queue.put(tmap)
+
+    async def _run(self) -> None:
+        if not self.outbox:
+            await self._publish()
+            return
+        if n := await self.outbox.adopt_leftovers():
+            LOGGER.warning(f"Found {n} output-event(s) left in the outbox, sending...")
+        await asyncio.gather(self._publish(), self._retry_outbox(self.outbox))
+
+    async def _retry_outbox(self, outbox: Outbox) -> None:
+        while True:
+            await asyncio.sleep(outbox.RETRY_DELAY_MIN)
+            await retry_outbox(self.sub, self.pub, self.task_maps, outbox)
+
+    async def _publish(self) -> None:
+        while True:
+            batch = [await self.queue.get()]
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            self.queue_depth.add(len(batch))
+            try:
+                await handle_finished_tasks(
+                    self.sub,
+                    self.pub,
+                    self.task_maps,
+                    batch,
+                    self.send_latency,
+                    self.outbox,
+                )
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+            await self.housekeeper.new_messages_done(
+                self.task_maps.n_successful,
+                self.task_maps.n_failed,
+                self.task_maps.resource_stats,
+            )
+            await self.housekeeper.outputs_published(
+                self.queue.qsize(),
+                self.send_latency,
+            )
+
+    async def stop(self) -> None:
+        """Wait for every queued task to be handled, then stop.
+
+        If there's an outbox, keep retrying it for up to `outbox_flush_timeout`
+        seconds; then, fail the tasks of any output-events left in it.
+
+        Raise the background task's error if it failed while doing so.
+        """
+        if not self._task:
+            return
+        if not self._task.done():  # else, any error was already raised by the loop
+            flushed = asyncio.create_task(self._flush())
+            await asyncio.wait(
+                [flushed, self._task],
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            flushed.cancel()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self.outbox and self.outbox.pending:
+            LOGGER.warning(
+                f"Leaving {len(self.outbox.pending)} output-event(s) in the outbox"
+                f" ({self.outbox.fpath}), for the next pilot on this node"
+            )
+            await abandon_outbox(self.sub, self.task_maps, self.outbox)
+        self.log_summary()
+
+    async def _flush(self) -> None:
+        await self.queue.join()
+        if not self.outbox or not self.outbox.pending:
+            return
+        LOGGER.info(
+            f"Waiting up to {self.outbox_flush_timeout}s to send the"
+            f" {len(self.outbox.pending)} output-event(s) in the outbox..."
+        )
+        deadline = time.time() + self.outbox_flush_timeout
+        while self.outbox.pending and time.time() < deadline:
+            await asyncio.sleep(self.outbox.RETRY_DELAY_MIN)
+
+    def log_summary(self) -> None:
+        """Log the queue's depth and the send latency."""
+        if not self.queue_depth.count:
+            return
+        msg = (
+            f"Finished-task queue: "
+            f"(batches: {self.queue_depth.count}) "
+            f"(mean depth: {self.queue_depth.mean:.1f}) "
+            f"(max depth: {self.queue_depth.max:.0f})"
+        )
+        if self.send_latency.count:
+            msg += (
+                f" -- Send latency: "
+                f"(sends: {self.send_latency.count}) "
+                f"(mean: {self.send_latency.mean * 1000:.1f}ms) "
+                f"(99th percentile: {self.send_latency.quantile(0.99) * 1000:.1f}ms) "
+                f"(max: {self.send_latency.max * 1000:.1f}ms)"
+            )
+        LOGGER.info(msg)
@@ -0,0 +1,279 @@
+"""Broker connections that reconnect, instead of failing the pilot, when they drop."""
+
+import asyncio
+import contextlib
+import logging
+import time
+from typing import Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, TypeVar
+
+import mqclient as mq
+from mqclient.broker_client_interface import Message
+
+LOGGER = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class Reconnector:
+    """Reopens a broker connection when it drops, backing off exponentially.
+
+    Each reconnect starts a new "generation" of the connection. If the
+    connection can't be reopened within `timeout` seconds (or `timeout` is 0),
+    the original error is raised.
+    """
+
+    DELAY_MIN = 1.0  # sec -- doubled after each failed attempt...
+    DELAY_MAX = 60.0  # sec -- up to this
+
+    def __init__(
+        self,
+        name: str,
+        connect: Callable[[], Awaitable[None]],
+        close: Callable[[], Awaitable[None]],
+        timeout: float,
+    ) -> None:
+        self.name = name
+        self._connect = connect
+        self._close = close
+        self.timeout = timeout
+
+        self.generation = 0
+        self.on_reconnect: list[Callable[[], None]] = []
+        self._lock = asyncio.Lock()
+
+    async def reconnect(self, generation: int, error: Exception) -> None:
+        """Reconnect--unless that was already done since `generation`."""
+        async with self._lock:
+            if generation != self.generation:
+                return  # another caller already reconnected
+            if not self.timeout:
+                raise error
+            LOGGER.warning(f"Lost connection to {self.name} ({repr(error)}), reconnecting...")
+
+            deadline = time.time() + self.timeout
+            delay = self.DELAY_MIN
+            while True:
+                with contextlib.suppress(Exception):  # ex: it's already closed
+                    await self._close()
+                try:
+                    await self._connect()
+                    break
+                except Exception as e:
+                    if time.time() + delay > deadline:
+                        LOGGER.error(f"Could not reconnect to {self.name}: {repr(e)}")
+                        raise error from e
+                    LOGGER.warning(
+                        f"Could not reconnect to {self.name} ({repr(e)}), "
+                        f"trying again in {delay:.0f}s..."
+                    )
+                    await asyncio.sleep(delay)
+                    delay = min(self.DELAY_MAX, delay * 2)
+
+            self.generation += 1
+            LOGGER.info(f"Reconnected to {self.name} (connection #{self.generation + 1})")
+            for callback in self.on_reconnect:
+                callback()
+
+    async def call(self, func: Callable[[], Awaitable[T]]) -> T:
+        """Call `func`. If it fails, reconnect and call it once more."""
+        generation = self.generation
+        try:
+            return await func()
+        except Exception as e:
+            await self.reconnect(generation, e)
+        return await func()
+
+
+class ReconnectingPubResource:
+    """A `Queue.open_pub()` resource that's reopened when its connection drops.
+
+    A send that fails is tried once more after reconnecting.
+    """
+
+    def __init__(self, queue: mq.Queue, reconnect_timeout: float) -> None:
+        self.queue = queue
+        self.reconnector = Reconnector(
+            "outgoing queue",
+            self.connect,
+            self.close,
+            reconnect_timeout,
+        )
+        self.resource: mq.queue.QueuePubResource | None = None
+        self._stack = contextlib.AsyncExitStack()
+
+    @property
+    def pub(self) -> Any:
+        """The current connection's broker-client pub (see `QueuePubResource.pub`)."""
+        return self.resource.pub if self.resource else None
+
+    async def connect(self) -> None:
+        """Open the connection."""
+        self._stack = contextlib.AsyncExitStack()
+        self.resource = await self._stack.enter_async_context(self.queue.open_pub())
+
+    async def close(self) -> None:
+        """Close the connection."""
+        await self._stack.aclose()
+
+    async def send(self, data: object) -> None:
+        """Send a message (see `QueuePubResource.send()`)."""
+        await self.reconnector.call(lambda: self._resource().send(data))
+
+    async def send_bytes(self, msg_bytes: bytes) -> None:
+        """Send an already-serialized message (see `Message.serialize()`)."""
+        await self.reconnector.call(
+            lambda: self._resource().pub.send_message(
+                msg_bytes,
+                retries=self.queue.retries,
+                retry_delay=self.queue.retry_delay,
+            )
+        )
+
+    def _resource(self) -> mq.queue.QueuePubResource:
+        if not self.resource:
+            raise RuntimeError("the outgoing queue is not connected")
+        return self.resource
+
+
+async def send_message_bytes(
+    pub: ReconnectingPubResource | mq.queue.QueuePubResource, msg_bytes: bytes
+) -> None:
+    """Send an already-serialized message, reconnecting if needed (and possible)."""
+    if isinstance(pub, ReconnectingPubResource):
+        await pub.send_bytes(msg_bytes)
+    else:  # ex: a plain `QueuePubResource`
+        await pub.pub.send_message(
+            msg_bytes,
+            retries=pub.retries,
+            retry_delay=pub.retry_delay,
+        )
+
+
+class ReconnectingSubResource:
+    """A `Queue.open_sub_manual_acking()` resource that's reopened when its connection drops.
+
+    A message can only be acked/nacked on the connection it came from: once
+    that's gone, the broker redelivers the message on its own. So, acking or
+    nacking a message from an earlier connection is skipped (with a warning).
+    """
+
+    def __init__(self, queue: mq.Queue, reconnect_timeout: float) -> None:
+        self.queue = queue
+        self.reconnector = Reconnector(
+            "incoming queue",
+            self.connect,
+            self.close,
+            reconnect_timeout,
+        )
+        self.reconnector.on_reconnect.append(self._reset_unsettled)
+        self.resource: mq.queue.ManualQueueSubResource | None = None
+        self._stack = contextlib.AsyncExitStack()
+
+        # message uuid -> the connection generation it came from
+        self._generations: dict[int, int] = {}
+        self._n_unsettled = 0  # the no. of `_generations` from the current connection
+
+    async def connect(self) -> None:
+        """Open the connection."""
+        self._stack = contextlib.AsyncExitStack()
+        self.resource = await self._stack.enter_async_context(
+            self.queue.open_sub_manual_acking()
+        )
+
+    async def close(self) -> None:
+        """Close the connection."""
+        await self._stack.aclose()
+
+    def _resource(self) -> mq.queue.ManualQueueSubResource:
+        if not self.resource:
+            raise RuntimeError("the incoming queue is not connected")
+        return self.resource
+
+    async def iter_messages(self) -> AsyncGenerator[Message, None]:
+        """Yield a message--reconnecting if the connection drops."""
+        while True:
+            generation = self.reconnector.generation
+            try:
+                async for msg in self._resource().iter_messages():
+                    self._generations[msg.uuid] = generation
+                    self._n_unsettled += 1
+                    yield msg
+                return  # timed out
+            except Exception as e:
+                await self.reconnector.reconnect(generation, e)
+
+    @property
+    def n_unsettled(self) -> int:
+        """The no. of messages from this connection that are not yet acked/nacked."""
+        return self._n_unsettled
+
+    def _reset_unsettled(self) -> None:
+        self._n_unsettled = 0  # all are from an earlier connection now
+
+    def is_stale(self, msg: Message) -> bool:
+        """Get whether the message came from an earlier (dropped) connection."""
+        return self._generations.get(msg.uuid, self.reconnector.generation) != (
+            self.reconnector.generation
+        )
+
+    def discard(self, msg: Message) -> None:
+        """Stop tracking the message--it won't be acked/nacked (ex: it was dropped)."""
+        if (generation := self._generations.pop(msg.uuid, None)) is None:
+            return
+        if generation == self.reconnector.generation:
+            self._n_unsettled -= 1
+
+    def _skip_stale(self, msg: Message, action: str) -> bool:
+        if not self.is_stale(msg):
+            return False
+        self.discard(msg)
+        LOGGER.warning(
+            f"Not {action} message (uuid={msg.uuid}) since its connection was lost"
+            " -- the broker will redeliver it (so if its output-event was sent, the"
+            " outgoing queue may eventually get a duplicate)"
+        )
+        return True
+
+    async def ack(self, msg: Message) -> None:
+        """Acknowledge the message--if its connection is still open."""
+        if self._skip_stale(msg, "acking"):
+            return
+        try:
+            await self._resource().ack(msg)
+        finally:  # even if it failed, it won't be tried again
+            self.discard(msg)
+
+    async def nack(self, msg: Message) -> None:
+        """Reject/nack the message--if its connection is still open."""
+        if self._skip_stale(msg, "nacking"):
+            return
+        try:
+            await self._resource().nack(msg)
+        finally:  # even if it failed, it won't be tried again
+            self.discard(msg)
+
+
+@contextlib.asynccontextmanager
+async def open_pub(
+    queue: mq.Queue, reconnect_timeout: float
+) -> AsyncIterator[ReconnectingPubResource]:
+    """Like `Queue.open_pub()`, but it reconnects when the connection drops."""
+    pub = ReconnectingPubResource(queue, reconnect_timeout)
+    await pub.connect()
+    try:
+        yield pub
+    finally:
+        await pub.close()
+
+
+@contextlib.asynccontextmanager
+async def open_sub_manual_acking(
+    queue: mq.Queue, reconnect_timeout: float
+) -> AsyncIterator[ReconnectingSubResource]:
+    """Like `Queue.open_sub_manual_acking()`, but it reconnects when the connection drops."""
+    sub = ReconnectingSubResource(queue, reconnect_timeout)
+    await sub.connect()
+    try:
+        yield sub
+    finally:
+        await sub.close()
@@ -0,0 +1,200 @@
+"""A local cache of task results, keyed by what the task is (image, args & input)."""
+
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Iterator
+
+from mqclient.broker_client_interface import Message
+
+from .io import FileExtension, OutFileInterface
+from .passthrough import extract_raw_data
+from ..config import ENV
+from ..utils.offload import run_blocking
+
+LOGGER = logging.getLogger(__name__)
+
+RESULT_CACHE_DIR_NAME = "result-cache"
+PARTIAL_INFIX = ".partial-"
+
+
+class ResultCache:
+    """Outfiles of finished tasks, kept on local disk to reuse for identical tasks.
+
+    An entry is keyed by a hash of everything that goes into a task's output:
+    the task image, its args & env, the init container (which fills the data
+    hub), the external directories, the in/out file types (and how the infile
+    is written), and the message's data. So, a retried or re-submitted message
+    (or any duplicate input) reuses the outfile instead of running a
+    container--even on another pilot sharing the cache. Only tasks that made
+    an outfile are cached.
+
+    Each entry is a file, `<key>.<outfile ext>`, whose mtime is its last use.
+    When the cache is over its disk budget, the least-recently-used entries are
+    removed. An entry is written atomically, so it's never read half-written.
+
+    While a task runs, identical tasks wait for it, then reuse its result--or
+    its error--instead of starting their own container ("single-flight").
+    """
+
+    EVICT_TO = 0.9  # fraction of the budget -- so not every new entry evicts
+
+    def __init__(
+        self,
+        root: Path,
+        max_bytes: int,
+        task_image: str,
+        task_args: str,
+        task_env: dict,
+        infile_ext: FileExtension,
+        outfile_ext: FileExtension,
+        init_image: str = "",
+        init_args: str = "",
+        init_env: dict | None = None,
+    ) -> None:
+        """`max_bytes` is the disk budget for all entries (0 -> unlimited)."""
+        self.root = root
+        self.max_bytes = max_bytes
+        self.outfile_ext = outfile_ext
+
+        # NOTE: an image is keyed by its name, so a re-pushed tag is not noticed
+        #       (nor are changed files in the external directories)
+        task = {
+            "task": [task_image, task_args, task_env],
+            "init": [init_image, init_args, init_env or {}] if init_image else None,
+            "external_dirs": ENV.EWMS_PILOT_EXTERNAL_DIRECTORIES,
+            "files": [str(infile_ext), str(outfile_ext)],
+            # how the infile is written
+            "json": [ENV.EWMS_PILOT_JSON_PASSTHROUGH, ENV._EWMS_PILOT_JSON_CODEC],
+        }
+        self._task_hash = hashlib.sha256(json.dumps(task, sort_keys=True).encode())
+        # key -> the result of the task that's running
+        self._in_flight: dict[str, asyncio.Future[Any]] = {}
+
+        # the size is only re-tallied when evicting (entries are added from threads)
+        self._lock = threading.Lock()
+        root.mkdir(parents=True, exist_ok=True)
+        self._size = sum(size for _, _, size in self._entries())
+
+        # metrics
+        self.n_hits = 0
+        self.n_coalesced = 0
+        self.n_misses = 0
+
+    def key(self, in_msg: Message) -> str:
+        """Get the cache key for the message's task."""
+        h = self._task_hash.copy()
+        raw = extract_raw_data(in_msg)  # no need to re-encode
+        h.update(raw if raw is not None else json.dumps(in_msg.data).encode())
+        return h.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}.{self.outfile_ext}"
+
+    async def get_or_run(
+        self,
+        in_msg: Message,
+        run: Callable[..., Awaitable[Any]],
+    ) -> Any:
+        """Get the task's result from the cache (or an identical running task), else `run()`.
+
+        `run(store_outfile=...)` must call `store_outfile(fpath)` on its outfile.
+        """
+        key = await run_blocking(self.key, in_msg)
+
+        if in_flight := self._in_flight.get(key):
+            self.n_coalesced += 1
+            LOGGER.info(f"Waiting on an identical task, to reuse its result (key={key})")
+            return await asyncio.shield(in_flight)  # if cancelled, the other task goes on
+
+        future: asyncio.Future[Any] = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await self._get_or_run(key, run)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark as retrieved, in case nothing waits on it
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._in_flight[key]
+
+    async def _get_or_run(self, key: str, run: Callable[..., Awaitable[Any]]) -> Any:
+        try:
+            result = await run_blocking(self._read, key)
+        except FileNotFoundError:
+            self.n_misses += 1
+            return await run(store_outfile=functools.partial(self._store, key))
+        self.n_hits += 1
+        LOGGER.info(f"Reusing cached result (key={key})")
+        return result
+
+    def _read(self, key: str) -> Any:
+        os.utime(self._path(key))  # LRU -- raises FileNotFoundError on a miss
+        return OutFileInterface.read(self._path(key))
+
+    async def _store(self, key: str, outfile: Path) -> None:
+        try:
+            await run_blocking(self._put, key, outfile)
+        except OSError as e:  # the task still succeeded
+            LOGGER.warning(f"Could not cache result (key={key}): {repr(e)}")
+
+    def _put(self, key: str, outfile: Path) -> None:
+        size = outfile.stat().st_size
+        if self.max_bytes and size > self.max_bytes:
+            LOGGER.info(f"Not caching result (key={key}), it's larger than the cache")
+            return
+
+        partial = self.root / f".{key}{PARTIAL_INFIX}{uuid.uuid4().hex}"
+        try:
+            shutil.copyfile(outfile, partial)
+            partial.replace(self._path(key))
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+
+        with self._lock:
+            self._size += size
+            if self.max_bytes and self._size > self.max_bytes:
+                self.evict()
+
+    def _entries(self) -> Iterator[tuple[float, Path, int]]:
+        for path in self.root.glob(f"*.{self.outfile_ext}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:  # ex: evicted by another pilot
+                continue
+            yield stat.st_mtime, path, stat.st_size
+
+    def evict(self) -> None:
+        """Remove the least-recently-used entries until the cache is within budget."""
+        entries = sorted(self._entries())
+        total = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if total <= self.max_bytes * self.EVICT_TO:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+        LOGGER.info(f"Evicted cached results, down to {total}/{self.max_bytes} bytes")
+        self._size = total
+
+    def log_summary(self) -> None:
+        """Log how often a result was reused."""
+        LOGGER.info(
+            f"Result cache: "
+            f"(hits: {self.n_hits}) "
+            f"(waited on an identical task: {self.n_coalesced}) "
+            f"(misses: {self.n_misses})"
+        )
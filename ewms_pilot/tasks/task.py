@@ -1,7 +1,11 @@
 """Single task logic."""
 
+import asyncio
+import json
 import logging
-from typing import Any
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable
 
 from mqclient.broker_client_interface import Message
 
@@ -15,10 +19,15 @@ from ..config import (
     ENV,
     InTaskContainerEnvVarNames,
 )
+from .worker import TaskWorkerPool
+from ..utils.offload import run_blocking
+from ..utils.resources import ResourceUsage
 from ..utils.runner import ContainerRunner, DirectoryCatalog
 
 LOGGER = logging.getLogger(__name__)
 
+MANIFEST_FILE_NAME = "manifest.json"
+
 
 async def process_msg_task(
     in_msg: Message,
@@ -27,44 +36,230 @@ async def process_msg_task(
     #
     infile_ext: FileExtension,
     outfile_ext: FileExtension,
+    #
+    resource_usage: ResourceUsage | None = None,
+    store_outfile: Callable[[Path], Awaitable[None]] | None = None,
+) -> Any:
+    """Process the message's task in a subprocess using `cmd` & respond.
+
+    If given, `store_outfile()` gets the outfile before it's cleaned up.
+    """
+
+    async with task_runner.acquire_instance() as instance:
+        # staging-dir logic -- includes stderr/stdout files (see below)
+        dirs = DirectoryCatalog(
+            str(in_msg.uuid),
+            include_task_io_directory=True,
+            # in an apptainer instance, only dirs inside the mounted parent are visible
+            task_io_parent=instance.task_io_parent if instance else None,
+        )
+        if dirs.task_io is None:  # this is just for mypy :)
+            raise RuntimeError("DirectoryCatalog did not assign task_io dir")
+
+        # create in/out file *names* -- piggy-back the uuid since it's unique and trackable
+        infile_name = f"infile-{in_msg.uuid}.{infile_ext}"
+        outfile_name = f"outfile-{in_msg.uuid}.{outfile_ext}"
+
+        # do task
+        await InFileInterface.write_async(in_msg, dirs.task_io.on_pilot / infile_name)
+        in_container_infile = str(dirs.task_io.in_task_container / infile_name)
+        in_container_outfile = str(dirs.task_io.in_task_container / outfile_name)
+        await task_runner.run_container(
+            "task",
+            dirs.outputs_on_pilot / "stderrfile",
+            dirs.outputs_on_pilot / "stdoutfile",
+            dirs.assemble_bind_mounts(include_external_directories=True),
+            {
+                InTaskContainerEnvVarNames.EWMS_TASK_DATA_HUB_DIR.name: dirs.pilot_data_hub.in_task_container,
+                InTaskContainerEnvVarNames.EWMS_TASK_INFILE.name: in_container_infile,
+                InTaskContainerEnvVarNames.EWMS_TASK_OUTFILE.name: in_container_outfile,
+            },
+            infile_arg_replacement=in_container_infile,
+            outfile_arg_replacement=in_container_outfile,
+            datahub_arg_replacement=str(dirs.pilot_data_hub.in_task_container),
+            resource_usage=resource_usage,
+            instance=instance,
+        )
+
+        # get outfile response
+        try:
+            output = await OutFileInterface.read_async(dirs.task_io.on_pilot / outfile_name)
+            if store_outfile:
+                await store_outfile(dirs.task_io.on_pilot / outfile_name)
+            return output
+        except NoTaskResponseException as e:
+            LOGGER.info(str(e))
+            raise  # don't return `None` b/c that could be a valid response value
+        # cleanup
+        finally:
+            if not ENV.EWMS_PILOT_KEEP_ALL_TASK_FILES:
+                await run_blocking(dirs.rm_unique_dirs)
+            elif instance:  # so the instance's next runs can't see it
+                await run_blocking(dirs.detach_task_io)
+
+
+async def process_msg_task_on_worker(
+    in_msg: Message,
+    #
+    worker_pool: TaskWorkerPool,
+    #
+    infile_ext: FileExtension,
+    outfile_ext: FileExtension,
+    #
+    resource_usage: ResourceUsage | None = None,
+    store_outfile: Callable[[Path], Awaitable[None]] | None = None,
 ) -> Any:
-    """Process the message's task in a subprocess using `cmd` & respond."""
+    """Process the message's task on a persistent task container & respond.
 
-    # staging-dir logic -- includes stderr/stdout files (see below)
-    dirs = DirectoryCatalog(str(in_msg.uuid), include_task_io_directory=True)
-    if dirs.task_io is None:  # this is just for mypy :)
-        raise RuntimeError("DirectoryCatalog did not assign task_io dir")
+    If given, `store_outfile()` gets the outfile before it's cleaned up.
+    """
 
     # create in/out file *names* -- piggy-back the uuid since it's unique and trackable
     infile_name = f"infile-{in_msg.uuid}.{infile_ext}"
     outfile_name = f"outfile-{in_msg.uuid}.{outfile_ext}"
 
-    # do task
-    InFileInterface.write(in_msg, dirs.task_io.on_pilot / infile_name)
-    in_container_infile = str(dirs.task_io.in_task_container / infile_name)
-    in_container_outfile = str(dirs.task_io.in_task_container / outfile_name)
-    await task_runner.run_container(
-        "task",
-        dirs.outputs_on_pilot / "stderrfile",
-        dirs.outputs_on_pilot / "stdoutfile",
-        dirs.assemble_bind_mounts(include_external_directories=True),
-        {
-            InTaskContainerEnvVarNames.EWMS_TASK_DATA_HUB_DIR.name: dirs.pilot_data_hub.in_task_container,
-            InTaskContainerEnvVarNames.EWMS_TASK_INFILE.name: in_container_infile,
-            InTaskContainerEnvVarNames.EWMS_TASK_OUTFILE.name: in_container_outfile,
-        },
-        infile_arg_replacement=in_container_infile,
-        outfile_arg_replacement=in_container_outfile,
-        datahub_arg_replacement=str(dirs.pilot_data_hub.in_task_container),
-    )
-
-    # get outfile response
-    try:
-        return OutFileInterface.read(dirs.task_io.on_pilot / outfile_name)
-    except NoTaskResponseException as e:
-        LOGGER.info(str(e))
-        raise  # don't return `None` b/c that could be a valid response value
-    # cleanup
-    finally:
-        if not ENV.EWMS_PILOT_KEEP_ALL_TASK_FILES:
-            dirs.rm_unique_dirs()
+    async with worker_pool.acquire() as worker:
+        # the worker's task-io dir is shared by all its tasks (one at a time)
+        task_io = worker.task_io
+
+        # do task
+        await InFileInterface.write_async(in_msg, task_io.on_pilot / infile_name)
+        try:
+            await worker.run_task(
+                str(task_io.in_task_container / infile_name),
+                str(task_io.in_task_container / outfile_name),
+                resource_usage,
+            )
+
+            # get outfile response
+            try:
+                output = await OutFileInterface.read_async(
+                    task_io.on_pilot / outfile_name
+                )
+                if store_outfile:
+                    await store_outfile(task_io.on_pilot / outfile_name)
+                return output
+            except NoTaskResponseException as e:
+                LOGGER.info(str(e))
+                raise  # don't return `None` b/c that could be a valid response value
+        # cleanup -- NOTE: the dir itself is removed if the worker was stopped
+        finally:
+            if not ENV.EWMS_PILOT_KEEP_ALL_TASK_FILES:
+                for fname in [infile_name, outfile_name]:
+                    await run_blocking((task_io.on_pilot / fname).unlink, missing_ok=True)
+
+
+async def process_msg_batch_task(
+    in_msgs: list[Message],
+    #
+    task_runner: ContainerRunner,
+    #
+    infile_ext: FileExtension,
+    outfile_ext: FileExtension,
+    #
+    resource_usages: dict[int, ResourceUsage] | None = None,
+) -> dict[int, Any]:
+    """Process all the messages' tasks in one container & get each message's result.
+
+    The container gets a manifest (json) of all the infile/outfile pairs. Each
+    message's result is its outfile's contents, or an exception:
+        - `NoTaskResponseException` if the container succeeded without an outfile
+        - the container's error if it failed without an outfile
+
+    If `resource_usages` is given, each message in the container gets an equal
+    share of the container's usage.
+    """
+    async with task_runner.acquire_instance() as instance:
+        dirs = DirectoryCatalog(
+            f"batch-{uuid.uuid4().hex}",
+            include_task_io_directory=True,
+            # in an apptainer instance, only dirs inside the mounted parent are visible
+            task_io_parent=instance.task_io_parent if instance else None,
+        )
+        if dirs.task_io is None:  # this is just for mypy :)
+            raise RuntimeError("DirectoryCatalog did not assign task_io dir")
+
+        results: dict[int, Any] = {}
+        manifest: list[dict[str, str]] = []
+        outfile_names: dict[int, str] = {}
+        try:
+            for in_msg in in_msgs:
+                # create in/out file *names* -- piggy-back the uuid since it's unique and trackable
+                infile_name = f"infile-{in_msg.uuid}.{infile_ext}"
+                outfile_name = f"outfile-{in_msg.uuid}.{outfile_ext}"
+                try:
+                    await InFileInterface.write_async(
+                        in_msg, dirs.task_io.on_pilot / infile_name
+                    )
+                except Exception as e:
+                    results[in_msg.uuid] = e  # only this message fails
+                    continue
+                manifest.append(
+                    {
+                        "infile": str(dirs.task_io.in_task_container / infile_name),
+                        "outfile": str(dirs.task_io.in_task_container / outfile_name),
+                    }
+                )
+                outfile_names[in_msg.uuid] = outfile_name
+            await run_blocking(
+                (dirs.task_io.on_pilot / MANIFEST_FILE_NAME).write_text,
+                json.dumps(manifest),
+            )
+            in_container_manifest = str(dirs.task_io.in_task_container / MANIFEST_FILE_NAME)
+
+            # do task(s)
+            container_usage = ResourceUsage() if resource_usages is not None else None
+            try:
+                await task_runner.run_container(
+                    f"task-batch ({len(manifest)} messages)",
+                    dirs.outputs_on_pilot / "stderrfile",
+                    dirs.outputs_on_pilot / "stdoutfile",
+                    dirs.assemble_bind_mounts(include_external_directories=True),
+                    {
+                        InTaskContainerEnvVarNames.EWMS_TASK_DATA_HUB_DIR.name: dirs.pilot_data_hub.in_task_container,
+                        InTaskContainerEnvVarNames.EWMS_TASK_MANIFEST.name: in_container_manifest,
+                    },
+                    manifest_arg_replacement=in_container_manifest,
+                    datahub_arg_replacement=str(dirs.pilot_data_hub.in_task_container),
+                    resource_usage=container_usage,
+                    instance=instance,
+                )
+                container_error: Exception | None = None
+            except Exception as e:
+                container_error = e  # still, any outfiles that were made are good
+            finally:
+                if resource_usages is not None and container_usage is not None:
+                    for msg_uuid in outfile_names:
+                        resource_usages[msg_uuid].update(
+                            container_usage.share(len(outfile_names))
+                        )
+
+            # get each outfile response
+            for msg_uuid, outfile_name in outfile_names.items():
+                try:
+                    results[msg_uuid] = await OutFileInterface.read_async(
+                        dirs.task_io.on_pilot / outfile_name
+                    )
+                except NoTaskResponseException as e:
+                    LOGGER.info(str(e))
+                    results[msg_uuid] = container_error or e
+                except Exception as e:
+                    results[msg_uuid] = e
+            return results
+        # cleanup
+        finally:
+            if not ENV.EWMS_PILOT_KEEP_ALL_TASK_FILES:
+                await run_blocking(dirs.rm_unique_dirs)
+            elif instance:  # so the instance's next runs can't see it
+                await run_blocking(dirs.detach_task_io)
+
+
+async def get_msg_result_from_batch(
+    in_msg: Message,
+    batch_task: "asyncio.Task[dict[int, Any]]",
+) -> Any:
+    """Wait for the batch's container, then return (or raise) this message's result."""
+    result = (await batch_task)[in_msg.uuid]
+    if isinstance(result, BaseException):
+        raise result
+    return result
@@ -1,24 +1,39 @@
-"""Logic for waiting on task set."""
+"""Logic for handling finished tasks: sending their outputs & acking/nacking."""
 
 import asyncio
 import logging
+import time
+from typing import Any
 
 import mqclient as mq
 from mqclient.broker_client_interface import Message
 
 from .io import NoTaskResponseException
-from .map import TaskMapping
-from ..utils.utils import dump_all_taskmaps, dump_tallies, dump_task_runtime_stats
+from .map import TaskLedger, TaskMapping
+from .outbox import Outbox, serialize_output
+from .passthrough import RawJSON, send_raw
+from .reconnect import (
+    ReconnectingPubResource,
+    ReconnectingSubResource,
+    send_message_bytes,
+)
+from ..utils.stats import RuntimeStats
+from ..utils.utils import (
+    dump_all_taskmaps,
+    dump_tallies,
+    dump_task_resource_stats,
+    dump_task_runtime_stats,
+)
 
 LOGGER = logging.getLogger(__name__)
 
 
 async def _nack(
     exception: BaseException,
-    sub: mq.queue.ManualQueueSubResource,
+    sub: ReconnectingSubResource,
     msg: Message,
 ) -> None:  # type: ignore[type-arg]
-    LOGGER.exception(exception)
+    LOGGER.exception(exception, exc_info=exception)  # may be outside an 'except'
     LOGGER.error(
         f"TASK FAILED ({repr(exception)}) -- attempting to nack input-event message..."
     )
@@ -31,94 +46,220 @@ async def _nack(
         LOGGER.info("-> task nack done.")
 
 
-async def wait_on_tasks_with_ack(
-    sub: mq.queue.ManualQueueSubResource,
-    pub: mq.queue.QueuePubResource,
-    task_maps: list[TaskMapping],
-    timeout: int,
+async def _send(
+    pub: ReconnectingPubResource,
+    output_event: Any,
+    send_latency: RuntimeStats | None,
 ) -> None:
-    """Get finished tasks and ack/nack their messages."""
-    if not any(tm for tm in task_maps if tm.is_pending):
-        return
+    start = time.time()
+    if isinstance(output_event, RawJSON):
+        await send_raw(pub, output_event)
+    else:
+        await pub.send(output_event)
+    if send_latency is not None:
+        send_latency.add(time.time() - start)
+
+
+async def _ack(sub: ReconnectingSubResource, tmap: TaskMapping) -> None:
+    try:
+        LOGGER.info(f"-> attempting to ack input-event message (uuid={tmap.uuid})...")
+        await sub.ack(tmap.message)
+    except mq.broker_client_interface.AckException as e:
+        # -> task finished -> ack failed = that's okay!
+        LOGGER.error(
+            f"Could not ack ({repr(e)}) -- not counted as a failed task"
+            " since task's output-event was sent successfully "
+            "(if there was an output, check logs to guarantee that). "
+            "NOTE: outgoing queue may eventually get"
+            " duplicate output-event when original message is"
+            " re-delivered by broker to another pilot"
+            " & the new output-event is sent."
+        )
+    else:
+        LOGGER.info(f"-> input-event ack done (uuid={tmap.uuid}).")
+
+    # final log
+    LOGGER.info(f"-> 100% done handling successful task (uuid={tmap.uuid}).")
+
 
-    # wait for next task
-    LOGGER.debug("Waiting on tasks to finish...")
-    newly_done, _ = await asyncio.wait(
-        [tm.asyncio_task for tm in task_maps if tm.is_pending],
-        return_when=asyncio.FIRST_COMPLETED,
-        timeout=timeout,
+async def _put_in_outbox(
+    outbox: Outbox,
+    tmap: TaskMapping,
+    output_event: Any,
+    send_error: BaseException,
+) -> bool:
+    """Store the output-event in the outbox. Return whether it was."""
+    try:
+        await outbox.add(serialize_output(output_event), tmap)
+    except Exception as e:
+        LOGGER.error(f"Could not put output-event in the outbox: {repr(e)}")
+        return False
+    LOGGER.warning(
+        f"Failed to send finished task's output-event (uuid={tmap.uuid}):"
+        f" {repr(send_error)} -- it's now in the outbox, to be sent later"
+        f" (then, its input-event message will be acked)."
     )
+    return True
+
+
+async def retry_outbox(
+    sub: ReconnectingSubResource,
+    pub: ReconnectingPubResource,
+    task_maps: TaskLedger,
+    outbox: Outbox,
+) -> None:
+    """Try again to send the outbox's output-events that are due.
+
+    Once an output-event is sent, its task's message is acked (if it's from this pilot).
+    """
+    for entry in outbox.due():
+        try:
+            await send_message_bytes(pub, entry.msg_bytes)
+        except Exception as e:
+            outbox.reschedule(entry)
+            LOGGER.warning(
+                f"Failed to send output-event from the outbox"
+                f" (attempt #{entry.n_attempts}): {repr(e)}"
+            )
+            continue
+        await outbox.remove(entry)
+        if not entry.tmap:  # left by an earlier pilot
+            LOGGER.info("-> output-event (left by an earlier pilot) sent from the outbox.")
+            continue
+        LOGGER.info(f"-> output-event sent from the outbox (uuid={entry.tmap.uuid}).")
+        await _ack(sub, entry.tmap)
+        task_maps.compact(entry.tmap)
+
+
+async def abandon_outbox(
+    sub: ReconnectingSubResource,
+    task_maps: TaskLedger,
+    outbox: Outbox,
+) -> None:
+    """Stop sending the outbox's output-events, and fail (nack) their tasks.
 
-    # HANDLE FINISHED TASK(S)
-    # fyi, most likely one task in here, but 2+ could finish at same time
+    The output-events stay on disk, for the next pilot on this node to send.
+    """
+    for entry in list(outbox.pending):
+        outbox.abandon(entry)
+        if not entry.tmap:
+            continue
+        error = RuntimeError(
+            "Could not send the output-event (it's left in the outbox for "
+            "the next pilot on this node)"
+        )
+        task_maps.mark_failed(entry.tmap, error)
+        await _nack(error, sub, entry.tmap.message)
+        task_maps.compact(entry.tmap)
+
+
+def mark_finished_tasks(
+    task_maps: TaskLedger,
+    newly_done: set[asyncio.Task],
+) -> list[TaskMapping]:
+    """Mark the already-finished tasks as done, so they're no longer pending."""
+    finished = []
     for asyncio_task in newly_done:
-        tmap = TaskMapping.get(task_maps, asyncio_task=asyncio_task)
-        tmap.mark_done()
-        LOGGER.info(f"TASK FINISHED (uuid={tmap.message.uuid})")
+        tmap = task_maps.get_taskmapping(asyncio_task)
+        task_maps.mark_done(tmap)
+        finished.append(tmap)
+        LOGGER.info(f"TASK FINISHED (uuid={tmap.uuid})")
+    return finished
+
 
+async def handle_finished_tasks(
+    sub: ReconnectingSubResource,
+    pub: ReconnectingPubResource,
+    task_maps: TaskLedger,
+    finished: list[TaskMapping],
+    send_latency: RuntimeStats | None = None,
+    outbox: Outbox | None = None,
+) -> None:
+    """Handle finished tasks: send their output and ack/nack their messages.
+
+    The tasks are handled as one batch: first, all the outputs are sent
+    (concurrently), then all the messages are acked/nacked (concurrently).
+    A message is only acked once its own task's output was sent.
+
+    NOTE: each ack/nack is still its own broker call--they're only concurrent.
+    A broker's grouped ack (RabbitMQ's `multiple=True`, Pulsar's cumulative
+    ack) acks *every* earlier message, including those of tasks that are still
+    running or whose output wasn't sent, since tasks finish out of order. Also,
+    mqclient doesn't expose it.
+
+    If `send_latency` is given, each send's duration is added to it.
+
+    If there's an `outbox`, an output-event that can't be sent is stored there
+    instead of failing its task--its message is acked once it's sent (see
+    `retry_outbox()`).
+    """
+    to_send: list[tuple[TaskMapping, Any]] = []
+    to_ack: list[TaskMapping] = []
+    to_nack: list[tuple[TaskMapping, BaseException]] = []
+    in_outbox: set[int] = set()  # message uuids
+    for tmap in finished:
         # Investigate task...
         try:
-            output_event = await asyncio_task
+            output_event = await tmap.asyncio_task
         # SUCCESSFUL TASK W/O OUTPUT -> is ok, but nothing to send...
         except NoTaskResponseException:
-            LOGGER.info("-> no output-event to send (this is ok).")
-            # input-event will be acked below...
+            LOGGER.info(f"-> no output-event to send (uuid={tmap.uuid}) (this is ok).")
+            to_ack.append(tmap)
         # FAILED TASK! -> nack input message
         except Exception as e:
-            tmap.error = e  # already marked as done, see above
-            await _nack(e, sub, tmap.message)
-            continue
+            task_maps.mark_failed(tmap, e)  # already marked as done
+            to_nack.append((tmap, e))
         # SUCCESSFUL TASK W/ OUTPUT -> send...
         else:
-            try:
-                LOGGER.info("-> attempting to send output-event...")
-                await pub.send(output_event)
-            except Exception as e:
-                tmap.error = e  # already marked as done, see above
+            to_send.append((tmap, output_event))
+
+    # send outputs -- all at once
+    if to_send:
+        LOGGER.info(f"Attempting to send {len(to_send)} output-event(s)...")
+        results = await asyncio.gather(
+            *(_send(pub, output_event, send_latency) for _, output_event in to_send),
+            return_exceptions=True,
+        )
+        for (tmap, output_event), result in zip(to_send, results):
+            if isinstance(result, BaseException):
+                # -> keep the output-event, to send later
+                if outbox and await _put_in_outbox(outbox, tmap, output_event, result):
+                    in_outbox.add(tmap.uuid)
+                    continue
+                task_maps.mark_failed(tmap, result)  # already marked as done
                 # -> failed to send = FAILED TASK! -> nack input-event message
                 LOGGER.error(
-                    f"Failed to send finished task's output-event: {repr(e)}"
-                    f" -- the task is now considered failed."
+                    f"Failed to send finished task's output-event (uuid={tmap.uuid}):"
+                    f" {repr(result)} -- the task is now considered failed."
                 )
-                await _nack(e, sub, tmap.message)
-                continue
+                to_nack.append((tmap, result))
             else:
-                LOGGER.info("-> output-event sent.")
+                LOGGER.info(f"-> output-event sent (uuid={tmap.uuid}).")
+                to_ack.append(tmap)
 
-        # now, ack input-event message
-        try:
-            LOGGER.info("-> now, attempting to ack input-event message...")
-            await sub.ack(tmap.message)
-        except mq.broker_client_interface.AckException as e:
-            # -> task finished -> ack failed = that's okay!
-            LOGGER.error(
-                f"Could not ack ({repr(e)}) -- not counted as a failed task"
-                " since task's output-event was sent successfully "
-                "(if there was an output, check logs to guarantee that). "
-                "NOTE: outgoing queue may eventually get"
-                " duplicate output-event when original message is"
-                " re-delivered by broker to another pilot"
-                " & the new output-event is sent."
-            )
-        else:
-            LOGGER.info("-> input-event ack done.")
+    # now, ack/nack input-event messages -- all at once
+    await asyncio.gather(
+        *(_ack(sub, tmap) for tmap in to_ack),
+        *(_nack(e, sub, tmap.message) for tmap, e in to_nack),
+    )
 
-        # final log
-        LOGGER.info(
-            f"-> 100% done handling successful task (uuid={tmap.message.uuid})."
-        )
+    if not finished:
+        return
 
-    # log
-    if newly_done:
-        # new tallies
-        LOGGER.info("Update (just now):")
-        dump_all_taskmaps([tm for tm in task_maps if tm.asyncio_task in newly_done])
-        dump_tallies(
-            [tm for tm in task_maps if tm.asyncio_task in newly_done],
-            dump_n_pending=False,
-        )
+    # all acked/nacked -- release the messages & asyncio tasks (and their results)
+    just_now = TaskLedger(finished)
+    for tmap in finished:
+        # NOTE: by uuid, since comparing TaskMappings compares (decodes) their messages
+        if tmap.uuid not in in_outbox:  # these are acked/nacked later
+            task_maps.compact(tmap)
 
-        # overall tallies
-        LOGGER.info("Overall:")
-        dump_tallies(task_maps)
-        dump_task_runtime_stats(task_maps)
+    # log
+    # -> new tallies
+    LOGGER.info("Update (just now):")
+    dump_all_taskmaps(just_now)
+    dump_tallies(just_now, dump_n_pending=False)
+    # -> overall tallies
+    LOGGER.info("Overall:")
+    dump_tallies(task_maps)
+    dump_task_runtime_stats(task_maps)
+    dump_task_resource_stats(task_maps)
@@ -0,0 +1,303 @@
+"""Logic for running tasks on persistent ("warm") task containers."""
+
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import sys
+import uuid
+from typing import AsyncIterator
+
+from ..config import ENV, InTaskContainerEnvVarNames
+from ..utils.lifecycle import TrackedContainer
+from ..utils.offload import run_blocking
+from ..utils.resources import ResourceMonitor, ResourceUsage
+from ..utils.runner import (
+    INFILE_ARG_TOKENS,
+    OUTFILE_ARG_TOKENS,
+    ContainerBindMount,
+    ContainerRunError,
+    ContainerRunner,
+    ContainerSetupError,
+    DirectoryCatalog,
+    dump_binary_file,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+
+class TaskWorker:
+    """A long-lived task container that processes one task at a time.
+
+    The protocol:
+        1. for each task, the pilot writes one line of JSON to the container's stdin:
+            {"id": <str>, "infile": <path>, "outfile": <path>}
+        2. when the task is done, the container writes one line of JSON to
+           the FIFO at `$EWMS_TASK_WORKER_FIFO`:
+            {"id": <same str>, "exit_code": <int>, "error": <str, optional>}
+        3. when stdin is closed (EOF), the container exits.
+
+    If the container exits or a task times out, the worker is stopped--then,
+    restarted before its next task.
+    """
+
+    FIFO_NAME = "worker.fifo"
+    STOP_GRACE_PERIOD = 10  # sec
+
+    def __init__(self, name: str, task_runner: ContainerRunner) -> None:
+        self.name = name
+        self.task_runner = task_runner
+
+        self.n_starts = 0
+        self.dirs: DirectoryCatalog | None = None
+        self._container: TrackedContainer | None = None
+        self._monitor: ResourceMonitor | None = None
+        self._proc: asyncio.subprocess.Process | None = None
+        self._fifo_reader: asyncio.StreamReader | None = None
+        self._fifo_transport: asyncio.ReadTransport | None = None
+
+    @property
+    def is_alive(self) -> bool:
+        """Whether the worker's container is running."""
+        return self._proc is not None and self._proc.returncode is None
+
+    @property
+    def task_io(self) -> ContainerBindMount:
+        """The task i/o directory for the worker's current container."""
+        if not self.dirs or not self.dirs.task_io:
+            raise RuntimeError(f"{self.name} has not been started")
+        return self.dirs.task_io
+
+    async def ensure_started(self) -> None:
+        """Start the container, if it's not already running."""
+        if self.is_alive:
+            return
+        if self._proc:  # it died
+            await self.stop(dump_output=True)
+        await self._start()
+
+    async def _start(self) -> None:
+        self.n_starts += 1
+        LOGGER.info(f"Starting {self.name} (start #{self.n_starts})...")
+
+        self.dirs = DirectoryCatalog(
+            f"{self.name}-{uuid.uuid4().hex}", include_task_io_directory=True
+        )
+        fifo = self.task_io.on_pilot / self.FIFO_NAME
+        os.mkfifo(fifo)
+
+        # open for read *and* write, so there's never an EOF when no writer is attached
+        fd = os.open(fifo, os.O_RDWR | os.O_NONBLOCK)
+        self._fifo_reader = asyncio.StreamReader()
+        self._fifo_transport, _ = await asyncio.get_running_loop().connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(self._fifo_reader),  # type: ignore[arg-type]
+            os.fdopen(fd, "rb", buffering=0),
+        )
+
+        self._container = await self.task_runner.start_container(
+            self.name,
+            self.dirs.outputs_on_pilot / "stdoutfile",
+            self.dirs.outputs_on_pilot / "stderrfile",
+            self.dirs.assemble_bind_mounts(include_external_directories=True),
+            {
+                InTaskContainerEnvVarNames.EWMS_TASK_DATA_HUB_DIR.name: self.dirs.pilot_data_hub.in_task_container,
+                InTaskContainerEnvVarNames.EWMS_TASK_WORKER_FIFO.name: self.task_io.in_task_container
+                / self.FIFO_NAME,
+            },
+            datahub_arg_replacement=str(self.dirs.pilot_data_hub.in_task_container),
+        )
+        self._proc = self._container.proc
+        self._monitor = await self.task_runner.resource_monitor(
+            self._container
+        ).__aenter__()
+
+    async def run_task(
+        self,
+        infile: str,
+        outfile: str,
+        resource_usage: ResourceUsage | None = None,
+    ) -> None:
+        """Send the task to the (already started) container and wait for it to finish.
+
+        `infile` and `outfile` are paths in the container. If `resource_usage` is
+        given, it's filled in with the container's usage during the task (its peaks
+        are the container's, since it started).
+        """
+        if not self._proc or not self._proc.stdin or not self._fifo_reader:
+            raise RuntimeError(f"{self.name} has not been started")
+        # NOTE: the container may be stopped mid-task, but its monitor still has its usage
+        if (monitor := self._monitor) and resource_usage is not None:
+            before = monitor.sample_now()
+            try:
+                await self._run_task(infile, outfile)
+            finally:
+                resource_usage.update(monitor.sample_now().since(before))
+        else:
+            await self._run_task(infile, outfile)
+
+    async def _run_task(self, infile: str, outfile: str) -> None:
+        assert self._proc and self._proc.stdin  # for mypy
+
+        task_id = uuid.uuid4().hex
+        request = {"id": task_id, "infile": infile, "outfile": outfile}
+        LOGGER.info(f"Sending task to {self.name}: {request}")
+
+        try:
+            try:
+                self._proc.stdin.write(json.dumps(request).encode() + b"\n")
+                await self._proc.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the container exited -- this is handled below
+            record = await self._wait_for_record()
+        except asyncio.CancelledError:
+            # the task may still be running, so this container can't be reused
+            await self.stop(graceful=False)
+            raise
+
+        # is this the record for this task?
+        if not isinstance(record, dict) or record.get("id") != task_id:
+            await self.stop(graceful=False, dump_output=True)
+            raise ContainerRunError(
+                self.name,
+                f"[Worker-Error] invalid completion record: {record}",
+            )
+
+        # did the task fail? -- the worker is still good, though
+        if exit_code := record.get("exit_code", 0):
+            raise ContainerRunError(
+                self.name,
+                str(record.get("error") or "<no error message>"),
+                exit_code=exit_code,
+            )
+
+    async def _wait_for_record(self) -> object:
+        """Wait for the next completion record, or for the container to exit."""
+        assert self._proc and self._fifo_reader  # for mypy
+
+        readline = asyncio.create_task(self._fifo_reader.readline())
+        exited = asyncio.create_task(self._proc.wait())
+        done, _ = await asyncio.wait(
+            {readline, exited},
+            return_when=asyncio.FIRST_COMPLETED,
+            timeout=self.task_runner.timeout,
+        )
+        exited.cancel()
+
+        # TIMEOUT?
+        if not done:
+            readline.cancel()
+            await self.stop(graceful=False, dump_output=True)
+            raise ContainerRunError(
+                self.name,
+                f"[Timeout-Error] timed out after {self.task_runner.timeout}s",
+            )
+        # CONTAINER EXITED?
+        if readline not in done:
+            readline.cancel()
+            returncode = self._proc.returncode
+            assert self.dirs  # for mypy
+            error = await run_blocking(
+                self.task_runner.extract_error,
+                self.dirs.outputs_on_pilot / "stderrfile",
+            )
+            await self.stop(dump_output=True)
+            raise ContainerRunError(
+                self.name,
+                f"[Worker-Error] container exited mid-task: {error}",
+                exit_code=returncode,
+            )
+        # GOT A RECORD!
+        line = readline.result()
+        try:
+            return json.loads(line)
+        except json.JSONDecodeError:
+            return line.decode(errors="replace").rstrip("\n")
+
+    async def stop(self, graceful: bool = True, dump_output: bool = False) -> None:
+        """Stop the container and clean up.
+
+        If `graceful`, close its stdin and give it a chance to exit on its own.
+        """
+        if self._proc and self._container:
+            proc, self._proc = self._proc, None
+            container, self._container = self._container, None
+            if proc.returncode is None:
+                LOGGER.info(f"Stopping {self.name}...")
+                if graceful and proc.stdin:
+                    proc.stdin.close()  # EOF -> the container exits
+                    try:
+                        await asyncio.wait_for(
+                            proc.wait(), timeout=self.STOP_GRACE_PERIOD
+                        )
+                    except (TimeoutError, asyncio.exceptions.TimeoutError):
+                        # < 3.11 -> asyncio.exceptions.TimeoutError
+                        LOGGER.warning(f"{self.name} did not stop in time")
+                if proc.returncode is None:
+                    await self.task_runner.lifecycle.stop(container)
+            await self.task_runner.lifecycle.forget(container)
+            LOGGER.info(f"{self.name} return code: {proc.returncode}")
+
+        if self._monitor:
+            await self._monitor.__aexit__(None, None, None)
+            self._monitor = None
+
+        if self._fifo_transport:
+            self._fifo_transport.close()
+            self._fifo_transport = None
+            self._fifo_reader = None
+
+        if self.dirs:
+            if dump_output or ENV.EWMS_PILOT_DUMP_TASK_OUTPUT:
+                await run_blocking(
+                    dump_binary_file,
+                    self.dirs.outputs_on_pilot / "stdoutfile",
+                    sys.stdout,
+                    self.name,
+                )
+                await run_blocking(
+                    dump_binary_file,
+                    self.dirs.outputs_on_pilot / "stderrfile",
+                    sys.stderr,
+                    self.name,
+                )
+            if not ENV.EWMS_PILOT_KEEP_ALL_TASK_FILES:
+                await run_blocking(self.dirs.rm_unique_dirs)
+            self.dirs = None
+
+
+class TaskWorkerPool:
+    """A fixed set of TaskWorkers--each task borrows an idle worker."""
+
+    def __init__(self, task_runner: ContainerRunner, size: int) -> None:
+        # a long-lived container's args can't change from task to task
+        if any(t in task_runner.args for t in INFILE_ARG_TOKENS + OUTFILE_ARG_TOKENS):
+            raise ContainerSetupError(
+                "Worker mode cannot use infile/outfile arg placeholders"
+                " (use the per-task request instead)",
+                task_runner.image,
+            )
+
+        self.workers = [TaskWorker(f"worker-{i}", task_runner) for i in range(size)]
+        self._idle: asyncio.Queue[TaskWorker] = asyncio.Queue()
+        for worker in self.workers:
+            self._idle.put_nowait(worker)
+
+    async def start(self) -> None:
+        """Start all the workers' containers (without waiting for them to be ready)."""
+        LOGGER.info(f"Starting {len(self.workers)} task worker(s)...")
+        await asyncio.gather(*(w.ensure_started() for w in self.workers))
+
+    @contextlib.asynccontextmanager
+    async def acquire(self) -> AsyncIterator[TaskWorker]:
+        """Borrow an idle, running worker."""
+        worker = await self._idle.get()
+        try:
+            await worker.ensure_started()
+            yield worker
+        finally:
+            self._idle.put_nowait(worker)
+
+    async def stop(self) -> None:
+        """Stop all the workers."""
+        await asyncio.gather(*(w.stop() for w in self.workers))
@@ -0,0 +1,206 @@
+"""Adapting the no. of concurrent tasks to how the slot is holding up."""
+
+import contextlib
+import dataclasses as dc
+import logging
+import os
+import time
+from pathlib import Path
+
+from .resources import cgroup_of
+from .slots import read_cgroup_limit
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _read_psi(fpath: Path) -> float | None:
+    """Get the 'some avg10' pressure (% of time stalled), ex: from '/proc/pressure/cpu'."""
+    with contextlib.suppress(OSError, ValueError, IndexError):
+        for line in fpath.read_text().splitlines():
+            if line.startswith("some "):
+                # ex: "some avg10=1.23 avg60=0.50 avg300=0.10 total=12345"
+                return float(line.split()[1].partition("=")[2])
+    return None
+
+
+def _percent(fraction: float | None) -> str:
+    return "unknown" if fraction is None else f"{fraction:.0%}"
+
+
+@dc.dataclass(frozen=True)
+class LoadSample:
+    """A snapshot of the slot's load--any unknown value is None."""
+
+    time: float
+    n_done: int  # total no. of finished tasks
+    cpu_usec: float | None  # total cpu time used (cumulative)
+    memory_headroom: float | None  # fraction of memory still available
+    cpu_pressure: float | None  # PSI: % of time stalled
+    memory_pressure: float | None
+    io_pressure: float | None
+
+
+def sample_load(n_done: int, use_cgroup: bool = True) -> LoadSample:
+    """Sample the pilot's cgroup (v2), or the whole machine if there's no cgroup.
+
+    Use `use_cgroup=False` if the tasks are not in the pilot's cgroup (ex: docker).
+    """
+    cgroup = cgroup_of(os.getpid()) if use_cgroup else None
+
+    cpu_usec = None
+    with contextlib.suppress(OSError, ValueError, TypeError):
+        if cgroup:
+            for line in (cgroup / "cpu.stat").read_text().splitlines():
+                if line.startswith("usage_usec "):
+                    cpu_usec = float(line.split()[1])
+        else:  # ex: "cpu  user nice system idle iowait irq softirq steal ..."
+            fields = Path("/proc/stat").read_text().splitlines()[0].split()[1:]
+            busy = sum(int(f) for i, f in enumerate(fields[:8]) if i not in (3, 4))
+            cpu_usec = busy / os.sysconf("SC_CLK_TCK") * 1e6
+
+    memory_headroom = None
+    with contextlib.suppress(OSError, ValueError, KeyError, ZeroDivisionError):
+        meminfo = {
+            k: int(v.split()[0])
+            for k, _, v in (
+                line.partition(":")
+                for line in Path("/proc/meminfo").read_text().splitlines()
+            )
+        }
+        available, total = meminfo["MemAvailable"] * 1024, meminfo["MemTotal"] * 1024
+        if cgroup and (limit := read_cgroup_limit(cgroup, "memory.max")):
+            current = int((cgroup / "memory.current").read_text())
+            available, total = min(available, limit - current), min(total, limit)
+        memory_headroom = max(0.0, available / total)
+
+    def psi(name: str) -> float | None:
+        # the cgroup's own pressure is more relevant than the machine's
+        if cgroup and (value := _read_psi(cgroup / f"{name}.pressure")) is not None:
+            return value
+        return _read_psi(Path("/proc/pressure") / name)
+
+    return LoadSample(
+        time=time.time(),
+        n_done=n_done,
+        cpu_usec=cpu_usec,
+        memory_headroom=memory_headroom,
+        cpu_pressure=psi("cpu"),
+        memory_pressure=psi("memory"),
+        io_pressure=psi("io"),
+    )
+
+
+class ConcurrencyController:
+    """Raises or lowers the limit on concurrent tasks, up to `max_limit` (AIMD).
+
+    Every `INTERVAL` seconds, the slot's load is sampled, then the limit is:
+        - cut in half (multiplicative decrease): if memory is running out
+          (low headroom or high memory pressure)
+        - lowered by 1: if the last raise made the throughput (tasks/sec) drop,
+          or if the CPU or IO are saturated (high pressure)
+        - raised by 1 (additive increase): if the tasks were held back by the
+          limit, and the CPUs are not fully utilized
+        - otherwise, kept
+
+    If the tasks are not in the pilot's cgroup (ex: docker), use `use_cgroup=False`
+    to measure the whole machine instead.
+    """
+
+    INTERVAL = 30.0  # sec -- long enough for a few tasks to finish
+
+    MEMORY_HEADROOM_MIN = 0.10  # fraction of memory
+    MEMORY_PRESSURE_MAX = 10.0  # % of time stalled
+    CPU_PRESSURE_MAX = 50.0  # ''
+    IO_PRESSURE_MAX = 50.0  # ''
+    CPU_UTILIZATION_TARGET = 0.90  # fraction of the cpus
+    THROUGHPUT_DROP = 0.90  # a raise "failed" if the throughput fell below this fraction
+
+    def __init__(self, max_limit: int, use_cgroup: bool = True) -> None:
+        self.max_limit = max_limit
+        self.use_cgroup = use_cgroup
+        self.n_cpus = (
+            len(os.sched_getaffinity(0)) if use_cgroup else (os.cpu_count() or 1)
+        )
+        # start at one task per cpu -- the controller finds the rest
+        self.limit = max(1, min(max_limit, self.n_cpus))
+
+        self._last: LoadSample | None = None
+        self._last_throughput: float | None = None
+        self._last_change = 0  # +1, -1, ...
+        self._was_held_back = False  # did the limit hold back a task?
+
+    def note_running(self, n_running: int) -> None:
+        """Note the current no. of running tasks (call this often)."""
+        if n_running >= self.limit:
+            self._was_held_back = True
+
+    def update(self, n_done: int) -> tuple[int, str] | None:
+        """Adjust the limit if it's time. Return the (new limit, reason) if it changed."""
+        now = time.time()
+        if self._last and now - self._last.time < self.INTERVAL:
+            return None
+        sample = sample_load(n_done, self.use_cgroup)
+        if not self._last:
+            self._last = sample
+            return None
+        last, self._last = self._last, sample
+
+        elapsed = sample.time - last.time
+        throughput = (sample.n_done - last.n_done) / elapsed
+        utilization = None
+        if sample.cpu_usec is not None and last.cpu_usec is not None:
+            utilization = (sample.cpu_usec - last.cpu_usec) / 1e6 / elapsed / self.n_cpus
+
+        new_limit, reason = self._decide(sample, throughput, utilization)
+        new_limit = max(1, min(self.max_limit, new_limit))
+
+        self._last_throughput = throughput
+        self._was_held_back = False
+        self._last_change = new_limit - self.limit
+        if not self._last_change:
+            return None
+        self.limit = new_limit
+        return new_limit, (
+            f"{reason} (throughput={throughput:.3f} tasks/s, "
+            f"cpu utilization={_percent(utilization)}, "
+            f"memory headroom={_percent(sample.memory_headroom)}, "
+            f"pressure: cpu={sample.cpu_pressure} memory={sample.memory_pressure} "
+            f"io={sample.io_pressure})"
+        )
+
+    def _decide(
+        self,
+        sample: LoadSample,
+        throughput: float,
+        utilization: float | None,
+    ) -> tuple[int, str]:
+        # running out of memory -> back off, fast
+        if (
+            sample.memory_headroom is not None
+            and sample.memory_headroom < self.MEMORY_HEADROOM_MIN
+        ):
+            return self.limit // 2, "low memory headroom"
+        if (sample.memory_pressure or 0) > self.MEMORY_PRESSURE_MAX:
+            return self.limit // 2, "high memory pressure"
+
+        # did the last raise hurt?
+        if (
+            self._last_change > 0
+            and self._last_throughput
+            and throughput < self._last_throughput * self.THROUGHPUT_DROP
+        ):
+            return self.limit - 1, "throughput dropped after the last raise"
+
+        # saturated
+        if (sample.cpu_pressure or 0) > self.CPU_PRESSURE_MAX:
+            return self.limit - 1, "high cpu pressure"
+        if (sample.io_pressure or 0) > self.IO_PRESSURE_MAX:
+            return self.limit - 1, "high io pressure"
+
+        # room to grow?
+        if self._was_held_back and (
+            utilization is None or utilization < self.CPU_UTILIZATION_TARGET
+        ):
+            return self.limit + 1, "tasks were held back and cpus are not saturated"
+
+        return self.limit, "steady"
@@ -0,0 +1,289 @@
+"""A minimal client for the Docker Engine API, over its Unix socket."""
+
+import asyncio
+import contextlib
+import http.client
+import json
+import logging
+import socket
+from typing import Any, AsyncIterator, BinaryIO
+from urllib.parse import quote, urlencode
+
+LOGGER = logging.getLogger(__name__)
+
+API_VERSION = "v1.41"  # docker engine 20.10+
+
+
+class DockerAPIError(Exception):
+    """Raised when the Docker Engine API responds with an error."""
+
+    def __init__(self, method: str, path: str, status: int, message: str):
+        super().__init__(f"{method} {path} -> {status}: {message}")
+        self.status = status
+
+
+def _error_message(data: bytes) -> str:
+    try:
+        return json.loads(data)["message"]
+    except (ValueError, KeyError, TypeError):
+        return data.decode(errors="replace").strip()
+
+
+def image_path(image: str) -> str:
+    """Get the url path segment for an image name."""
+    return quote(image, safe="/:@")
+
+
+def split_image_tag(image: str) -> tuple[str, str]:
+    """Split the image name into its repository and tag (or digest)."""
+    if "@" in image:  # ex: foo/bar@sha256:abc...
+        repo, digest = image.split("@", maxsplit=1)
+        return repo, digest
+    # NOTE: a ':' before the last '/' is a registry's port, ex: localhost:5000/foo
+    repo, _, tag = image.rpartition(":")
+    if not repo or "/" in tag:
+        return image, "latest"
+    return repo, tag
+
+
+# --------------------------------------------------------------------------------------
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """An HTTPConnection over a Unix socket."""
+
+    def __init__(self, socket_path: str) -> None:
+        super().__init__("localhost")
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+def pull_image_sync(socket_path: str, image: str) -> None:
+    """Pull the image, if it's not already present (blocking)."""
+    conn = _UnixHTTPConnection(socket_path)
+    try:
+        # First, check if the image already exists locally.
+        path = f"/{API_VERSION}/images/{image_path(image)}/json"
+        conn.request("GET", path)
+        resp = conn.getresponse()
+        data = resp.read()
+        if resp.status == 200:
+            LOGGER.info(f"Image {image} found locally, skipping pull.")
+            return
+        elif resp.status != 404:
+            raise DockerAPIError("GET", path, resp.status, _error_message(data))
+
+        # Now, pull the remote image -- the response is a stream of json progress lines
+        LOGGER.info(f"Image {image} not found locally, pulling...")
+        repo, tag = split_image_tag(image)
+        path = f"/{API_VERSION}/images/create?{urlencode({'fromImage': repo, 'tag': tag})}"
+        conn.request("POST", path)
+        resp = conn.getresponse()
+        if resp.status != 200:
+            raise DockerAPIError("POST", path, resp.status, _error_message(resp.read()))
+        for line in resp:
+            if not line.strip():
+                continue
+            progress = json.loads(line)
+            if "error" in progress:
+                raise DockerAPIError("POST", path, resp.status, progress["error"])
+            LOGGER.debug(progress)
+    finally:
+        conn.close()
+
+
+# --------------------------------------------------------------------------------------
+
+
+_Connection = tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+class DockerEngineClient:
+    """An async client for the Docker Engine API, with a pool of keep-alive connections."""
+
+    def __init__(self, socket_path: str, max_idle_connections: int = 8) -> None:
+        self.socket_path = socket_path
+        self.max_idle_connections = max_idle_connections
+        self._idle: list[_Connection] = []
+
+    async def close(self) -> None:
+        """Close all idle connections."""
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+
+    #
+    # HTTP
+    #
+
+    async def _send(
+        self,
+        conn: _Connection,
+        method: str,
+        path: str,
+        body: dict | None,
+    ) -> tuple[int, dict[str, str]]:
+        """Send the request, then read & return the response's status and headers."""
+        reader, writer = conn
+        data = json.dumps(body).encode() if body is not None else b""
+        head = (
+            f"{method} /{API_VERSION}{path} HTTP/1.1\r\n"
+            f"Host: docker\r\n"
+            f"Content-Length: {len(data)}\r\n"
+        )
+        if body is not None:
+            head += "Content-Type: application/json\r\n"
+        writer.write(head.encode() + b"\r\n" + data)
+        await writer.drain()
+
+        status_line = await reader.readline()  # ex: b"HTTP/1.1 200 OK\r\n"
+        if not status_line:
+            raise ConnectionResetError("Docker Engine API connection was closed")
+        status = int(status_line.split()[1])
+        headers: dict[str, str] = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return status, headers
+
+    @staticmethod
+    async def _iter_body(
+        reader: asyncio.StreamReader,
+        status: int,
+        headers: dict[str, str],
+    ) -> AsyncIterator[bytes]:
+        if status in (204, 304):  # never a body
+            return
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            while size := int((await reader.readline()).split(b";")[0], 16):
+                yield await reader.readexactly(size)
+                await reader.readexactly(2)  # CRLF
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass  # trailers
+        elif "content-length" in headers:
+            if length := int(headers["content-length"]):
+                yield await reader.readexactly(length)
+        else:  # read until closed
+            while chunk := await reader.read(2**16):
+                yield chunk
+
+    @contextlib.asynccontextmanager
+    async def stream(
+        self,
+        method: str,
+        path: str,
+        body: dict | None = None,
+    ) -> AsyncIterator[AsyncIterator[bytes]]:
+        """Make a request, then yield an iterator of the response body's chunks.
+
+        Raises `DockerAPIError` for an error response.
+        """
+        if self._idle:
+            conn = self._idle.pop()
+            try:
+                status, headers = await self._send(conn, method, path, body)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # the daemon closed this idle connection -- use a new one
+                conn[1].close()
+                conn = await asyncio.open_unix_connection(self.socket_path)
+                status, headers = await self._send(conn, method, path, body)
+        else:
+            conn = await asyncio.open_unix_connection(self.socket_path)
+            status, headers = await self._send(conn, method, path, body)
+
+        reusable = False
+        try:
+            chunks = self._iter_body(conn[0], status, headers)
+            if status >= 400:
+                data = b"".join([c async for c in chunks])
+                raise DockerAPIError(method, path, status, _error_message(data))
+            yield chunks
+            async for _ in chunks:
+                pass  # anything left over
+            reusable = headers.get("connection", "").lower() != "close" and (
+                status in (204, 304)
+                or "content-length" in headers
+                or "transfer-encoding" in headers
+            )
+        finally:
+            if reusable and len(self._idle) < self.max_idle_connections:
+                self._idle.append(conn)
+            else:
+                conn[1].close()
+
+    async def request(self, method: str, path: str, body: dict | None = None) -> Any:
+        """Make a request and return the response's json (or None if empty)."""
+        async with self.stream(method, path, body) as chunks:
+            data = b"".join([c async for c in chunks])
+        return json.loads(data) if data else None
+
+    #
+    # containers
+    #
+
+    async def create_container(self, config: dict, name: str = "") -> str:
+        """Create a container and return its id."""
+        path = "/containers/create"
+        if name:
+            path += f"?{urlencode({'name': name})}"
+        resp = await self.request("POST", path, config)
+        for warning in resp.get("Warnings") or []:
+            LOGGER.warning(warning)
+        return resp["Id"]
+
+    async def inspect_container(self, container_id: str) -> dict:
+        """Get the container's details."""
+        return await self.request("GET", f"/containers/{container_id}/json")
+
+    async def start_container(self, container_id: str) -> None:
+        """Start the container."""
+        await self.request("POST", f"/containers/{container_id}/start")
+
+    async def wait_container(self, container_id: str) -> int:
+        """Wait for the container to exit and return its exit code."""
+        resp = await self.request("POST", f"/containers/{container_id}/wait")
+        if error := (resp.get("Error") or {}).get("Message"):
+            LOGGER.error(f"Error waiting on container {container_id}: {error}")
+        return resp["StatusCode"]
+
+    async def kill_container(self, container_id: str, signal: str = "SIGKILL") -> None:
+        """Send the signal to the container's main process."""
+        path = f"/containers/{container_id}/kill?{urlencode({'signal': signal})}"
+        await self.request("POST", path)
+
+    async def remove_container(self, container_id: str) -> None:
+        """Remove the container (even if it's still running)."""
+        await self.request("DELETE", f"/containers/{container_id}?force=1")
+
+    async def list_containers(self, label: str) -> list[dict]:
+        """List all the containers (running or not) that have the label."""
+        filters = json.dumps({"label": [label]})
+        return await self.request(
+            "GET", f"/containers/json?{urlencode({'all': 1, 'filters': filters})}"
+        )
+
+    async def stream_logs(
+        self,
+        container_id: str,
+        stdout: BinaryIO,
+        stderr: BinaryIO,
+    ) -> None:
+        """Write the container's stdout & stderr to the files, until it exits.
+
+        NOTE: the container must not have a TTY, so its logs are multiplexed.
+        """
+        path = f"/containers/{container_id}/logs?follow=1&stdout=1&stderr=1"
+        async with self.stream("GET", path) as chunks:
+            # each frame: [stream type (1 byte), 0, 0, 0, size (4 bytes)] + payload
+            buf = bytearray()
+            async for chunk in chunks:
+                buf += chunk
+                while len(buf) >= 8:
+                    size = int.from_bytes(buf[4:8], "big")
+                    if len(buf) < 8 + size:
+                        break
+                    (stderr if buf[0] == 2 else stdout).write(buf[8 : 8 + size])
+                    del buf[: 8 + size]
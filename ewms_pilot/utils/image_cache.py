@@ -0,0 +1,199 @@
+"""A node-local cache of Apptainer sandbox images, shared by all pilots on the node."""
+
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Callable
+
+LOGGER = logging.getLogger(__name__)
+
+COMPLETE_SUFFIX = ".complete"
+LOCK_SUFFIX = ".lock"
+PARTIAL_INFIX = ".partial-"
+EVICT_LOCK_NAME = ".evict.lock"
+
+
+def image_key(image: str) -> str:
+    """Get the cache key for the image.
+
+    A local image file is keyed by its contents, a pinned image (`...@sha256:...`)
+    by its digest, and anything else (ex: `docker://foo:1.0`) by its name.
+    """
+    if Path(image).is_file():  # ex: a .sif file
+        h = hashlib.sha256()
+        with open(image, "rb") as f:
+            while chunk := f.read(2**20):
+                h.update(chunk)
+        return h.hexdigest()
+    if "@sha256:" in image:
+        return image.rsplit("@sha256:", maxsplit=1)[1]
+    return hashlib.sha256(image.encode()).hexdigest()
+
+
+def _dir_size(path: Path) -> int:
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in dirs + files:
+            with contextlib.suppress(OSError):
+                total += os.lstat(os.path.join(root, name)).st_size
+    return total
+
+
+class ImageLease:
+    """A claim on a cached image--it won't be evicted until released."""
+
+    def __init__(self, path: Path, lock_fd: int) -> None:
+        self.path = path
+        self._lock_fd: int | None = lock_fd
+
+    def release(self) -> None:
+        """Release the claim (closing the fd drops its shared lock)."""
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+
+class ApptainerImageCache:
+    """A directory of built sandbox images, coordinated by `flock`s.
+
+    For each image, in `root`:
+        <key>/              the sandbox--only used if its marker exists
+        <key>.complete      the completion marker (json); its mtime is the last use
+        <key>.lock          shared while the image is in use,
+                            exclusive while it's being built or evicted
+        <key>.partial-<id>  a build in progress (or an abandoned one)
+
+    The first pilot to check out an image builds it, the others wait for
+    it, then all use the same sandbox.
+    """
+
+    def __init__(self, root: Path, max_bytes: int) -> None:
+        """`max_bytes` is the disk budget for all images (0 -> unlimited)."""
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def _paths(self, key: str) -> tuple[Path, Path, Path]:
+        return (
+            self.root / key,
+            self.root / f"{key}{COMPLETE_SUFFIX}",
+            self.root / f"{key}{LOCK_SUFFIX}",
+        )
+
+    def checkout(self, image: str, build: Callable[[Path], None]) -> ImageLease:
+        """Get the image's sandbox, building it first if needed (blocking).
+
+        `build(dest)` must build the sandbox at `dest`.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        key = image_key(image)
+        sandbox, marker, lockfile = self._paths(key)
+
+        fd = os.open(lockfile, os.O_RDWR | os.O_CREAT, 0o666)
+        built = False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            if not marker.exists():
+                # only one pilot builds it -- the others wait here
+                # NOTE: converting a flock isn't atomic, so check again
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                if not marker.exists():
+                    self._build(image, key, build)
+                    built = True
+                fcntl.flock(fd, fcntl.LOCK_SH)
+            if not built:
+                LOGGER.info(f"Using cached image for {image}: {sandbox}")
+            os.utime(marker)  # LRU
+        except BaseException:
+            os.close(fd)
+            raise
+
+        if built:
+            self.evict()
+        return ImageLease(sandbox, fd)
+
+    def _build(self, image: str, key: str, build: Callable[[Path], None]) -> None:
+        """Build the image--the caller must hold the image's exclusive lock."""
+        sandbox, marker, _ = self._paths(key)
+
+        # clear out leftovers: an abandoned build, or a sandbox w/o its marker
+        for path in self.root.glob(f"{key}{PARTIAL_INFIX}*"):
+            shutil.rmtree(path, ignore_errors=True)
+        shutil.rmtree(sandbox, ignore_errors=True)
+
+        LOGGER.info(f"Building cached image for {image}: {sandbox}")
+        start = time.time()
+        partial = self.root / f"{key}{PARTIAL_INFIX}{uuid.uuid4().hex}"
+        try:
+            build(partial)
+            partial.rename(sandbox)
+        except BaseException:
+            shutil.rmtree(partial, ignore_errors=True)
+            raise
+
+        # the marker is written last, so a partial build is never used
+        tmp = marker.with_name(f"{marker.name}{PARTIAL_INFIX}{uuid.uuid4().hex}")
+        tmp.write_text(
+            json.dumps(
+                {
+                    "image": image,
+                    "size": _dir_size(sandbox),
+                    "build_time": time.time() - start,
+                }
+            )
+        )
+        tmp.replace(marker)
+
+    def evict(self) -> None:
+        """Remove the least-recently-used images until the cache is within budget.
+
+        Images in use (by any pilot on the node) are never removed.
+        """
+        if not self.max_bytes:
+            return
+
+        with open(self.root / EVICT_LOCK_NAME, "a") as evict_lock:
+            fcntl.flock(evict_lock, fcntl.LOCK_EX)
+
+            entries = []
+            for marker in self.root.glob(f"*{COMPLETE_SUFFIX}"):
+                try:
+                    size = json.loads(marker.read_text())["size"]
+                    last_used = marker.stat().st_mtime
+                except (OSError, ValueError, KeyError):
+                    continue
+                entries.append((last_used, marker.name[: -len(COMPLETE_SUFFIX)], size))
+
+            total = sum(e[2] for e in entries)
+            for _, key, size in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if self._remove_if_unused(key):
+                    total -= size
+
+            if total > self.max_bytes:
+                LOGGER.warning(
+                    f"Image cache is over budget ({total}/{self.max_bytes} bytes),"
+                    f" but the remaining images are in use"
+                )
+
+    def _remove_if_unused(self, key: str) -> bool:
+        sandbox, marker, lockfile = self._paths(key)
+        fd = os.open(lockfile, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False  # in use
+            LOGGER.info(f"Evicting cached image: {sandbox}")
+            marker.unlink(missing_ok=True)  # first, so it's never half-there
+            shutil.rmtree(sandbox, ignore_errors=True)
+            return True
+        finally:
+            os.close(fd)
@@ -0,0 +1,116 @@
+"""JSON encoding/decoding for task files -- with a faster library, if chosen.
+
+Codecs: 'stdlib' (the default, always available), 'orjson', and 'msgspec'.
+A faster codec is opt-in, by name (`_EWMS_PILOT_JSON_CODEC`), since its
+output differs from 'stdlib':
+    - output is compact (no spaces) and UTF-8 (not ASCII-escaped)
+    - non-finite floats (NaN, Infinity) are encoded as `null`
+    - anything they can't handle (ex: ints over 64 bits) falls back to 'stdlib'
+"""
+
+import dataclasses as dc
+import json
+import logging
+import mmap
+from typing import Any, Callable
+
+from ..config import ENV
+
+LOGGER = logging.getLogger(__name__)
+
+Buffer = bytes | mmap.mmap
+
+
+@dc.dataclass(frozen=True)
+class JSONCodec:
+    """A JSON codec: bytes in, bytes out."""
+
+    name: str
+    dumps: Callable[[Any], bytes]  # raises TypeError if `obj` can't be encoded
+    loads: Callable[[Buffer], Any]  # raises ValueError if the data isn't valid
+
+
+def _stdlib_codec() -> JSONCodec:
+    return JSONCodec(
+        "stdlib",
+        lambda obj: json.dumps(obj).encode(),
+        # NOTE: `json.loads()` needs bytes/str, not a buffer
+        lambda buf: json.loads(buf if isinstance(buf, bytes) else buf[:]),
+    )
+
+
+def _with_fallback(codec: JSONCodec, errors: tuple[type[Exception], ...]) -> JSONCodec:
+    """Fall back to 'stdlib' for anything the codec can't handle."""
+    stdlib = _stdlib_codec()
+
+    def dumps(obj: Any) -> bytes:
+        try:
+            return codec.dumps(obj)
+        except errors:
+            return stdlib.dumps(obj)
+
+    def loads(buf: Buffer) -> Any:
+        try:
+            return codec.loads(buf)
+        except errors:
+            return stdlib.loads(buf)
+
+    return JSONCodec(codec.name, dumps, loads)
+
+
+def _orjson_codec() -> JSONCodec:
+    import orjson  # type: ignore[import-not-found]
+
+    return _with_fallback(
+        JSONCodec(
+            "orjson",
+            lambda obj: orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS),
+            lambda buf: orjson.loads(memoryview(buf)),  # no copy
+        ),
+        (TypeError, ValueError),  # orjson's errors subclass these
+    )
+
+
+def _msgspec_codec() -> JSONCodec:
+    import msgspec  # type: ignore[import-not-found]
+
+    encoder = msgspec.json.Encoder()
+    return _with_fallback(
+        JSONCodec(
+            "msgspec",
+            encoder.encode,
+            msgspec.json.decode,  # takes any buffer -- no copy
+        ),
+        (TypeError, ValueError, msgspec.MsgspecError),
+    )
+
+
+CODECS: dict[str, Callable[[], JSONCodec]] = {
+    "orjson": _orjson_codec,
+    "msgspec": _msgspec_codec,
+    "stdlib": _stdlib_codec,
+}
+
+
+def get_codec(name: str = "auto") -> JSONCodec:
+    """Get the named codec -- 'auto' is 'stdlib', so the output is never changed.
+
+    A faster codec must be chosen by name (see above for how its output differs).
+    """
+    if name == "auto":
+        name = "stdlib"
+    if name not in CODECS:
+        raise ValueError(f"Unknown JSON codec: {name} (choose from {list(CODECS)})")
+    return CODECS[name]()  # raises ImportError if not installed
+
+
+_codec: JSONCodec | None = None
+
+
+def codec() -> JSONCodec:
+    """Get the configured codec (see `_EWMS_PILOT_JSON_CODEC`)."""
+    global _codec
+    if _codec is None:
+        _codec = get_codec(ENV._EWMS_PILOT_JSON_CODEC)
+        LOGGER.info(f"Using JSON codec: {_codec.name}")
+    return _codec
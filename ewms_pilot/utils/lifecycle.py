@@ -0,0 +1,403 @@
+"""Keep track of the pilot's containers, so none outlive their task (or pilot)."""
+
+import asyncio
+import contextlib
+import dataclasses as dc
+import fcntl
+import json
+import logging
+import os
+import shlex
+import signal
+import uuid
+from pathlib import Path
+
+from .docker_api import DockerAPIError, DockerEngineClient
+from .offload import run_blocking
+from .slots import ResourceSlot
+from ..config import ENV
+
+LOGGER = logging.getLogger(__name__)
+
+OWNER_LABEL = "ewms-pilot.owner"
+STOP_GRACE_PERIOD = 10  # sec -- between SIGTERM and SIGKILL
+LEASE_SUFFIX = ".lease"
+
+# this pilot's owner id & the fd of its (locked) lease file -- there's one per
+# pilot process, held for its whole life (see `current_owner()`)
+_lease: tuple[str, int] | None = None
+
+
+def _process_start_time(pid: int) -> str | None:
+    """Get when the process started (clock ticks since boot), or None if it's gone.
+
+    Pids get reused, so a process is identified by its pid *and* start time.
+    """
+    try:
+        stat = Path(f"/proc/{pid}/stat").read_text()
+    except FileNotFoundError:
+        return None
+    except OSError:  # ex: no procfs -- fall back to only the pid
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return None
+        except PermissionError:
+            pass
+        return "?"
+    # the command name (2nd field) can have spaces, so split after it
+    return stat.rsplit(")", maxsplit=1)[1].split()[19]
+
+
+def _pid_namespace() -> str:
+    """Get the id of this process's pid namespace ("" if unknown)."""
+    try:
+        return os.readlink("/proc/self/ns/pid")
+    except OSError:
+        return ""
+
+
+def _lease_dir() -> Path:
+    return Path(ENV._EWMS_PILOT_APPTAINER_BUILD_WORKDIR) / "ewms-pilot-leases"
+
+
+def _dir_id(path: Path) -> str:
+    stat = path.stat()
+    return f"{stat.st_dev}-{stat.st_ino}"
+
+
+def _is_locked(lease: Path) -> bool:
+    """Get whether the lease file is locked (raises FileNotFoundError if it's gone)."""
+    fd = os.open(lease, os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)  # also, releases the lock (if it was taken)
+    return False
+
+
+def _acquire_lease(lease_dir: Path) -> tuple[str, int]:
+    """Create & lock a new lease file, clearing out dead pilots' leases first."""
+    lease_dir.mkdir(parents=True, exist_ok=True)
+    for lease in lease_dir.glob(f"*{LEASE_SUFFIX}"):
+        with contextlib.suppress(OSError):  # ex: just removed by another pilot
+            if not _is_locked(lease):
+                lease.unlink()
+
+    name = uuid.uuid4().hex
+    tmp = lease_dir / f".{name}.tmp"
+    fd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    tmp.rename(lease_dir / f"{name}{LEASE_SUFFIX}")  # only visible once it's locked
+    return f"{_dir_id(lease_dir)}:{name}", fd
+
+
+def current_owner() -> str:
+    """Get the id of this pilot process: '<lease dir id>:<lease name>'.
+
+    The lease is made on the first call; every later call (ex: by each
+    `ContainerRunner`) gets the same one. The pilot holds a `flock` on its
+    lease file for as long as it runs, so other pilots that share the lease
+    dir can tell if it's alive--unlike a pid or hostname, this works across
+    pid namespaces and containers (ex: separate apptainer jobs, or pilots in
+    docker containers on the same node).
+    """
+    global _lease
+    if _lease is None:
+        _lease = _acquire_lease(_lease_dir())
+    return _lease[0]
+
+
+def owner_is_alive(owner: str) -> bool:
+    """Get whether the pilot (see `current_owner()`) is still running.
+
+    That's when its lease file is locked. A pilot whose lease dir is not this
+    one (ex: on another host), or an unknown owner, is assumed to be alive.
+    """
+    try:
+        dir_id, name = owner.split(":")
+    except ValueError:
+        return True
+    if not name.isalnum():
+        return True
+    try:
+        if _dir_id(_lease_dir()) != dir_id:
+            return True
+    except OSError:
+        return True
+    try:
+        return _is_locked(_lease_dir() / f"{name}{LEASE_SUFFIX}")
+    except FileNotFoundError:
+        return False  # it was cleared out, so it was dead
+    except OSError:
+        return True
+
+
+@dc.dataclass(eq=False)
+class TrackedContainer:
+    """A container started by the pilot."""
+
+    name: str
+    proc: asyncio.subprocess.Process | None = None  # the docker/apptainer cli
+    docker_api_id: str = ""  # if started with the Docker Engine API
+    slot: ResourceSlot | None = None  # its share of the pilot's resources, if any
+
+
+class ContainerLifecycleManager:
+    """Tracks the containers started by a `ContainerRunner`, to stop them when needed.
+
+    A container is stopped with SIGTERM, then SIGKILL after a grace period:
+        - docker: via the daemon (`docker stop` or the api)--the cli process
+          is only a client, so signaling it does not reliably stop the container
+        - apptainer: via the process group--each container gets its own
+
+    Containers left behind by a dead pilot on this node (ex: it was killed)
+    are found by their owner: a label for docker, a state file for apptainer
+    (see `reap_orphans()`).
+    """
+
+    def __init__(self, docker_api: DockerEngineClient | None = None) -> None:
+        self.docker_api = docker_api
+        self.owner = current_owner()
+        self.containers: set[TrackedContainer] = set()
+        self.instances: set[str] = set()  # apptainer instance names
+        self._state_lock = asyncio.Lock()  # so the state is saved in order
+
+        self.state_dir = (
+            Path(ENV._EWMS_PILOT_APPTAINER_BUILD_WORKDIR) / "ewms-pilot-containers"
+        )
+        self._state_file = self.state_dir / f"{uuid.uuid4().hex}.json"
+
+    @property
+    def _is_docker(self) -> bool:
+        return ENV._EWMS_PILOT_CONTAINER_PLATFORM.lower() == "docker"
+
+    @staticmethod
+    def new_name() -> str:
+        """Get a unique container name."""
+        return f"ewms-pilot-{uuid.uuid4().hex}"
+
+    async def track(self, container: TrackedContainer) -> TrackedContainer:
+        """Start tracking the (just-started) container."""
+        self.containers.add(container)
+        await self._save_state()
+        return container
+
+    async def forget(self, container: TrackedContainer) -> None:
+        """Stop tracking the container--it's done."""
+        if container.slot:
+            container.slot.release()
+        if container in self.containers:
+            self.containers.discard(container)
+            await self._save_state()
+
+    async def track_instance(self, name: str) -> None:
+        """Start tracking the (just-started) apptainer instance."""
+        self.instances.add(name)
+        await self._save_state()
+
+    async def forget_instance(self, name: str) -> None:
+        """Stop tracking the apptainer instance--it's stopped."""
+        self.instances.discard(name)
+        await self._save_state()
+
+    async def _save_state(self) -> None:
+        """Record the running apptainer processes & instances (see `reap_orphans()`)."""
+        if self._is_docker:  # the containers are labeled instead
+            return
+        pgids = [
+            c.proc.pid
+            for c in self.containers
+            if c.proc and c.proc.returncode is None
+        ]
+        instances = sorted(self.instances)
+        async with self._state_lock:
+            await run_blocking(self._write_state, pgids, instances)
+
+    def _write_state(self, pgids: list[int], instances: list[str]) -> None:
+        procs = [
+            {
+                "pgid": pgid,
+                "start_time": _process_start_time(pgid),
+                "pid_namespace": _pid_namespace(),
+            }
+            for pgid in pgids
+        ]
+        if not procs and not instances:
+            self._state_file.unlink(missing_ok=True)
+            return
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self._state_file.with_suffix(".tmp")
+        tmp.write_text(
+            json.dumps(
+                {
+                    "owner": self.owner,
+                    "procs": procs,
+                    "instances": instances,
+                }
+            )
+        )
+        tmp.replace(self._state_file)
+
+    #
+    # stopping
+    #
+
+    async def stop(
+        self,
+        container: TrackedContainer,
+        grace: float = STOP_GRACE_PERIOD,
+    ) -> None:
+        """Stop (and remove) the container: SIGTERM, then SIGKILL after `grace` secs."""
+        LOGGER.info(f"Stopping container {container.name}...")
+        try:
+            if container.docker_api_id:
+                await self._stop_docker_api_container(container.docker_api_id, grace)
+            elif self._is_docker:
+                await _run_quietly(
+                    f"docker stop --time={int(grace)} {shlex.quote(container.name)}"
+                )
+            if container.proc:
+                await _stop_process_group(container.proc, grace)
+            if self._is_docker and not container.docker_api_id:
+                # ex: the container was created after the 'docker stop'
+                await _run_quietly(f"docker rm --force {shlex.quote(container.name)}")
+        finally:
+            await self.forget(container)
+
+    async def _stop_docker_api_container(self, container_id: str, grace: float) -> None:
+        assert self.docker_api  # for mypy
+        with contextlib.suppress(DockerAPIError):  # ex: it already exited
+            await self.docker_api.kill_container(container_id, "SIGTERM")
+            try:
+                await asyncio.wait_for(
+                    self.docker_api.wait_container(container_id),
+                    timeout=grace,
+                )
+            except (TimeoutError, asyncio.exceptions.TimeoutError):
+                # < 3.11 -> asyncio.exceptions.TimeoutError
+                LOGGER.warning(f"Container {container_id} did not stop in time, killing...")
+                await self.docker_api.kill_container(container_id)
+        with contextlib.suppress(DockerAPIError):
+            await self.docker_api.remove_container(container_id)
+
+    async def stop_all(self) -> None:
+        """Stop all the tracked containers (ex: at shutdown)."""
+        if self.containers:
+            LOGGER.warning(
+                f"Stopping {len(self.containers)} container(s) that are still running..."
+            )
+        await asyncio.gather(*(self.stop(c) for c in list(self.containers)))
+
+    #
+    # orphans
+    #
+
+    async def reap_orphans(self) -> None:
+        """Stop & remove the containers left behind by dead pilots on this node."""
+        try:
+            if self._is_docker:
+                await self._reap_docker_orphans()
+            else:
+                await self._reap_apptainer_orphans()
+        except (OSError, DockerAPIError) as e:
+            LOGGER.error(f"Could not reap orphaned containers: {repr(e)}")
+
+    async def _reap_docker_orphans(self) -> None:
+        found: list[tuple[str, str]] = []  # (id, owner)
+        if self.docker_api:
+            for c in await self.docker_api.list_containers(OWNER_LABEL):
+                found.append((c["Id"], (c.get("Labels") or {}).get(OWNER_LABEL, "")))
+        else:
+            fmt = '{{.ID}} {{.Label "%s"}}' % OWNER_LABEL
+            proc = await asyncio.create_subprocess_shell(
+                f"docker ps --all --no-trunc --filter label={OWNER_LABEL} "
+                f"--format {shlex.quote(fmt)}",
+                stdout=asyncio.subprocess.PIPE,
+            )
+            stdout, _ = await proc.communicate()
+            if proc.returncode:
+                LOGGER.error("Could not list containers to reap orphans")
+                return
+            for line in stdout.decode().splitlines():
+                cid, _, owner = line.partition(" ")
+                found.append((cid, owner))
+
+        for cid, owner in found:
+            if owner_is_alive(owner):
+                continue
+            LOGGER.warning(f"Removing orphaned container {cid} (owner: {owner})")
+            if self.docker_api:
+                with contextlib.suppress(DockerAPIError):  # ex: just removed
+                    await self.docker_api.remove_container(cid)
+            else:
+                await _run_quietly(f"docker rm --force {shlex.quote(cid)}")
+
+    async def _reap_apptainer_orphans(self) -> None:
+        if not self.state_dir.exists():
+            return
+        for state_file in self.state_dir.glob("*.json"):
+            try:
+                state = json.loads(state_file.read_text())
+            except (OSError, ValueError):
+                continue
+            if owner_is_alive(state.get("owner", "")):
+                continue
+
+            for p in state.get("procs", []):
+                # is it the same process group (pids get reused, and are
+                # only meaningful in their own pid namespace)?
+                if (
+                    p.get("pid_namespace") != _pid_namespace()
+                    or _process_start_time(p["pgid"]) != p["start_time"]
+                ):
+                    continue
+                LOGGER.warning(
+                    f"Killing orphaned container process group {p['pgid']}"
+                    f" (owner: {state['owner']})"
+                )
+                with contextlib.suppress(ProcessLookupError, PermissionError):
+                    os.killpg(p["pgid"], signal.SIGKILL)
+            for name in state.get("instances", []):
+                LOGGER.warning(
+                    f"Stopping orphaned apptainer instance {name}"
+                    f" (owner: {state['owner']})"
+                )
+                await _run_quietly(f"apptainer instance stop {shlex.quote(name)}")
+
+            state_file.unlink(missing_ok=True)
+
+
+async def _run_quietly(cmd: str) -> int:
+    """Run the command and return its return code (ignoring its output)."""
+    LOGGER.debug(f"Running command: {cmd}")
+    proc = await asyncio.create_subprocess_shell(
+        cmd,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    return await proc.wait()
+
+
+async def _stop_process_group(
+    proc: asyncio.subprocess.Process,
+    grace: float,
+) -> None:
+    """SIGTERM the process's group, then SIGKILL it after `grace` secs.
+
+    The process must lead its own group (`start_new_session=True`).
+    """
+    if proc.returncode is None:
+        with contextlib.suppress(ProcessLookupError, PermissionError):
+            os.killpg(proc.pid, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(proc.wait(), timeout=grace)
+        except (TimeoutError, asyncio.exceptions.TimeoutError):
+            # < 3.11 -> asyncio.exceptions.TimeoutError
+            LOGGER.warning(f"Process {proc.pid} did not stop in time, killing...")
+    # also, get any stragglers
+    with contextlib.suppress(ProcessLookupError, PermissionError):
+        os.killpg(proc.pid, signal.SIGKILL)
+    await proc.wait()
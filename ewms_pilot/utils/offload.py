@@ -0,0 +1,93 @@
+"""Keeping blocking work (file I/O, serialization) off of the event loop.
+
+The pilot has one event loop for everything: starting tasks, acking messages,
+heartbeats, etc. While it's blocked, none of that happens.
+"""
+
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from typing_extensions import ParamSpec
+
+from .stats import RuntimeStats
+from ..config import ENV
+
+LOGGER = logging.getLogger(__name__)
+
+T = TypeVar("T")
+P = ParamSpec("P")
+
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=ENV._EWMS_PILOT_FILE_IO_THREADS,
+            thread_name_prefix="ewms-pilot-io",
+        )
+    return _executor
+
+
+async def run_blocking(func: Callable[P, T], *args: P.args, **kwargs: P.kwargs) -> T:
+    """Run `func` on the (bounded) I/O thread pool and await its result.
+
+    NOTE: if this is cancelled, `func` still runs to completion in its thread.
+    """
+    return await asyncio.get_running_loop().run_in_executor(
+        _get_executor(),
+        functools.partial(func, *args, **kwargs),
+    )
+
+
+class EventLoopLagMonitor:
+    """Measures how long the event loop is blocked, in the background.
+
+    A task asks to wake up every `INTERVAL` secs; any extra delay is time that
+    the loop was blocked (by synchronous work). Use as an async context manager.
+    """
+
+    INTERVAL = 0.1  # sec
+    WARN_THRESHOLD = 0.5  # sec -- log each block that is longer than this
+
+    def __init__(self) -> None:
+        self.stats = RuntimeStats()
+        self._task: asyncio.Task | None = None
+
+    async def __aenter__(self) -> "EventLoopLagMonitor":
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, *args: object) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.wait([self._task])  # doesn't raise
+        self.log_summary()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.INTERVAL)
+            lag = max(0.0, loop.time() - start - self.INTERVAL)
+            self.stats.add(lag)
+            if lag > self.WARN_THRESHOLD:
+                LOGGER.warning(f"The event loop was blocked for {lag:.2f}s")
+
+    def log_summary(self) -> None:
+        """Log how much the event loop was blocked."""
+        if not self.stats.count:
+            return
+        LOGGER.info(
+            f"Event loop lag: "
+            f"(samples: {self.stats.count}) "
+            f"(mean: {self.stats.mean * 1000:.1f}ms) "
+            f"(99th percentile: {self.stats.quantile(0.99) * 1000:.1f}ms) "
+            f"(max: {self.stats.max * 1000:.1f}ms) "
+            f"(total: {self.stats.total:.2f}s)"
+        )
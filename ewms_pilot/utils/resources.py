@@ -0,0 +1,241 @@
+"""Measuring containers' resource usage: CPU, memory, IO, and PIDs."""
+
+import asyncio
+import contextlib
+import dataclasses as dc
+import logging
+import os
+from pathlib import Path
+from typing import Awaitable, Callable
+
+LOGGER = logging.getLogger(__name__)
+
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+
+_CLK_TCK = os.sysconf("SC_CLK_TCK")
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+@dc.dataclass
+class ResourceUsage:
+    """A container's resource usage--any unknown value is None."""
+
+    # counters
+    cpu_user_sec: float | None = None
+    cpu_system_sec: float | None = None
+    io_read_bytes: int | None = None
+    io_write_bytes: int | None = None
+    # high-water marks
+    peak_memory_bytes: int | None = None
+    peak_pids: int | None = None
+
+    COUNTERS = ("cpu_user_sec", "cpu_system_sec", "io_read_bytes", "io_write_bytes")
+
+    def to_dict(self) -> dict[str, float]:
+        """Get the known values."""
+        return {k: v for k, v in dc.asdict(self).items() if v is not None}
+
+    def _combine(self, other: "ResourceUsage", func: Callable, counters_only: bool):
+        for field in dc.fields(self):
+            if counters_only and field.name not in self.COUNTERS:
+                continue
+            mine, theirs = getattr(self, field.name), getattr(other, field.name)
+            if theirs is None:
+                continue
+            setattr(self, field.name, theirs if mine is None else func(mine, theirs))
+
+    def update(self, sample: "ResourceUsage") -> None:
+        """Update with a newer sample of the same container."""
+        # NOTE: counters may dip when sampled from short-lived processes, so use max
+        self._combine(sample, max, counters_only=False)
+
+    def add(self, other: "ResourceUsage") -> None:
+        """Add another container's usage: counters are summed, peaks are maxed."""
+        self._combine(other, lambda a, b: a + b, counters_only=True)
+        for name in ("peak_memory_bytes", "peak_pids"):
+            if (theirs := getattr(other, name)) is not None:
+                setattr(self, name, max(getattr(self, name) or 0, theirs))
+
+    def since(self, before: "ResourceUsage") -> "ResourceUsage":
+        """Get the usage since the earlier sample (peaks are not reset)."""
+        diff = dc.replace(self)
+        for name in self.COUNTERS:
+            now, then = getattr(self, name), getattr(before, name)
+            if now is not None:
+                setattr(diff, name, now - (then or 0))
+        return diff
+
+    def share(self, n: int) -> "ResourceUsage":
+        """Get a 1/n share (ex: of a container that processed n messages)."""
+        part = dc.replace(self)
+        for name in self.COUNTERS:
+            if (value := getattr(self, name)) is not None:
+                setattr(part, name, type(value)(value / n))
+        return part
+
+
+# --------------------------------------------------------------------------------------
+
+
+def _read_keyed(fpath: Path) -> dict[str, int]:
+    """Read a file of 'key value' (or 'key: value') lines."""
+    out = {}
+    for line in fpath.read_text().splitlines():
+        key, _, value = line.partition(" ")
+        out[key.rstrip(":")] = int(value)
+    return out
+
+
+def cgroup_of(pid: int) -> Path | None:
+    """Get the process's cgroup (v2) directory, or None if unknown."""
+    with contextlib.suppress(OSError):
+        for line in Path(f"/proc/{pid}/cgroup").read_text().splitlines():
+            if line.startswith("0::"):
+                return CGROUP_ROOT / line[3:].lstrip("/")
+    return None
+
+
+def read_cgroup(cgroup_dir: Path) -> ResourceUsage:
+    """Read the cgroup's (v2) usage--once a container exits, it may be gone."""
+    usage = ResourceUsage()
+    with contextlib.suppress(OSError, ValueError, KeyError):
+        cpu = _read_keyed(cgroup_dir / "cpu.stat")
+        usage.cpu_user_sec = cpu["user_usec"] / 1e6
+        usage.cpu_system_sec = cpu["system_usec"] / 1e6
+    with contextlib.suppress(OSError, ValueError):
+        # ex: "8:0 rbytes=1 wbytes=2 rios=3 wios=4 dbytes=0 dios=0"
+        rbytes = wbytes = 0
+        for line in (cgroup_dir / "io.stat").read_text().splitlines():
+            stats = dict(kv.split("=") for kv in line.split()[1:])
+            rbytes += int(stats.get("rbytes", 0))
+            wbytes += int(stats.get("wbytes", 0))
+        usage.io_read_bytes, usage.io_write_bytes = rbytes, wbytes
+    for fname in ("memory.peak", "memory.current"):  # memory.peak is linux 5.19+
+        with contextlib.suppress(OSError, ValueError):
+            usage.peak_memory_bytes = int((cgroup_dir / fname).read_text())
+            break
+    for fname in ("pids.peak", "pids.current"):  # pids.peak is linux 6.1+
+        with contextlib.suppress(OSError, ValueError):
+            usage.peak_pids = int((cgroup_dir / fname).read_text())
+            break
+    return usage
+
+
+def _descendants(pid: int) -> list[int]:
+    """Get the process's living descendants."""
+    found: list[int] = []
+    parents = [pid]
+    while parents:
+        parent = parents.pop()
+        with contextlib.suppress(OSError, ValueError):
+            for task in Path(f"/proc/{parent}/task").iterdir():
+                children = [int(c) for c in (task / "children").read_text().split()]
+                found.extend(children)
+                parents.extend(children)
+    return found
+
+
+def read_process_tree(pid: int) -> ResourceUsage:
+    """Read the summed usage of the process and its living descendants.
+
+    A process's CPU time includes that of its exited children, once they're waited on.
+    """
+    cpu_user = cpu_system = 0.0
+    rss = rbytes = wbytes = n_procs = 0
+    for p in [pid] + _descendants(pid):
+        try:
+            stat = Path(f"/proc/{p}/stat").read_text()
+        except OSError:
+            continue
+        # the command name (2nd field) can have spaces, so split after it
+        fields = stat.rsplit(")", maxsplit=1)[1].split()
+        cpu_user += (int(fields[11]) + int(fields[13])) / _CLK_TCK  # utime + cutime
+        cpu_system += (int(fields[12]) + int(fields[14])) / _CLK_TCK  # stime + cstime
+        rss += int(fields[21]) * _PAGE_SIZE
+        n_procs += 1
+        with contextlib.suppress(OSError, ValueError, KeyError):
+            io = _read_keyed(Path(f"/proc/{p}/io"))
+            rbytes += io["read_bytes"]
+            wbytes += io["write_bytes"]
+
+    if not n_procs:
+        return ResourceUsage()
+    return ResourceUsage(
+        cpu_user_sec=cpu_user,
+        cpu_system_sec=cpu_system,
+        io_read_bytes=rbytes,
+        io_write_bytes=wbytes,
+        peak_memory_bytes=rss,
+        peak_pids=n_procs,
+    )
+
+
+def process_sampler(pid: int) -> Callable[[], ResourceUsage]:
+    """Get a sampler for the process: its cgroup if it has its own, else its process tree."""
+    cgroup = cgroup_of(pid)
+    if cgroup and cgroup != cgroup_of(os.getpid()):
+        return lambda: read_cgroup(cgroup)
+    return lambda: read_process_tree(pid)
+
+
+def docker_sampler(container_id: str, pid: int) -> Callable[[], ResourceUsage]:
+    """Get a sampler for the docker container, given its main process's (host) pid."""
+    cgroup = cgroup_of(pid)
+    # is the pid in our pid namespace? -- every docker cgroup is named by the id
+    if cgroup and container_id in cgroup.name:
+        return lambda: read_cgroup(cgroup)
+    LOGGER.debug(f"Cannot find cgroup of docker container {container_id}")
+    return ResourceUsage  # always unknown
+
+
+# --------------------------------------------------------------------------------------
+
+
+class ResourceMonitor:
+    """Samples a running container's resource usage in the background.
+
+    Use as an async context manager around the container's run. The usage is
+    best-effort: between samples, a container may exit (taking its cgroup
+    with it), so its final moments may not be counted.
+    """
+
+    INTERVAL = 1.0  # sec
+
+    def __init__(
+        self,
+        locate: Callable[[], Awaitable[Callable[[], ResourceUsage] | None]],
+        usage: ResourceUsage | None = None,
+    ) -> None:
+        """`locate()` returns the container's sampler, or None if it's not up yet."""
+        self.usage = usage if usage is not None else ResourceUsage()
+        self._locate = locate
+        self._sample: Callable[[], ResourceUsage] | None = None
+        self._task: asyncio.Task | None = None
+
+    async def __aenter__(self) -> "ResourceMonitor":
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, *args: object) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.wait([self._task])  # doesn't raise
+        self.sample_now()
+
+    def sample_now(self) -> ResourceUsage:
+        """Take a sample (if the container was found) and return the usage so far."""
+        if self._sample:
+            self.usage.update(self._sample())
+        return dc.replace(self.usage)
+
+    async def _run(self) -> None:
+        try:
+            while not self._sample:
+                self._sample = await self._locate()
+                if not self._sample:
+                    await asyncio.sleep(self.INTERVAL)
+            while True:
+                self.sample_now()
+                await asyncio.sleep(self.INTERVAL)
+        except Exception as e:
+            LOGGER.warning(f"Could not monitor container resource usage: {repr(e)}")
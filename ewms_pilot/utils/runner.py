@@ -1,6 +1,7 @@
 """Logic for running a subprocess."""
 
 import asyncio
+import contextlib
 import dataclasses as dc
 import json
 import logging
@@ -9,9 +10,22 @@ import shlex
 import shutil
 import subprocess
 import sys
+import threading
+import uuid
 from pathlib import Path
-from typing import TextIO
+from typing import AsyncIterator, Callable, TextIO
 
+from .docker_api import DockerAPIError, DockerEngineClient, pull_image_sync
+from .image_cache import ApptainerImageCache, ImageLease
+from .lifecycle import OWNER_LABEL, ContainerLifecycleManager, TrackedContainer
+from .offload import run_blocking
+from .resources import (
+    ResourceMonitor,
+    ResourceUsage,
+    docker_sampler,
+    process_sampler,
+)
+from .slots import ResourceSlot, ResourceSlotPool, SlotResources
 from .utils import LogParser
 from ..config import (
     BIND_MOUNT_IN_CONTAINER_READONLY_DIRS,
@@ -26,6 +40,12 @@ LOGGER = logging.getLogger(__name__)
 
 ENV_VAR_NAME_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
 
+# arg placeholders -- there's an alternative for each
+INFILE_ARG_TOKENS = ["{{INFILE}}", "{{IN_FILE}}"]
+OUTFILE_ARG_TOKENS = ["{{OUTFILE}}", "{{OUT_FILE}}"]
+DATAHUB_ARG_TOKENS = ["{{DATA_HUB}}", "{{DATAHUB}}"]
+MANIFEST_ARG_TOKENS = ["{{MANIFEST}}"]
+
 
 # --------------------------------------------------------------------------------------
 
@@ -103,8 +123,17 @@ class ContainerBindMount:
 class DirectoryCatalog:
     """Handles the naming and mapping logic for a task's directories."""
 
-    def __init__(self, name: str, include_task_io_directory: bool):
-        """All directories are auto-created (task_io dir cannot already exist)."""
+    def __init__(
+        self,
+        name: str,
+        include_task_io_directory: bool,
+        task_io_parent: ContainerBindMount | None = None,
+    ):
+        """All directories are auto-created (task_io dir cannot already exist).
+
+        If `task_io_parent` is given, the task_io dir is made inside of it
+        (ex: an already-mounted dir) instead of inside this catalog's own dir.
+        """
         self.name = name
         self._namebased_dir = PILOT_DATA_DIR / self.name
 
@@ -122,8 +151,13 @@ class DirectoryCatalog:
         self.outputs_on_pilot = _mkdir(self._namebased_dir / "outputs")
 
         # for message-based task i/o
-        if include_task_io_directory:
+        if include_task_io_directory and task_io_parent:
             self.task_io: ContainerBindMount | None = ContainerBindMount(
+                _mkdir(task_io_parent.on_pilot / self.name, exist_ok=False),
+                task_io_parent.in_task_container / self.name,
+            )
+        elif include_task_io_directory:
+            self.task_io = ContainerBindMount(
                 _mkdir(self._namebased_dir / "task-io", exist_ok=False),
                 Path(f"/{PILOT_DATA_DIR.name}/task-io"),
             )
@@ -158,34 +192,105 @@ class DirectoryCatalog:
 
         return bind_mounts
 
+    def detach_task_io(self) -> None:
+        """Move a task_io dir made elsewhere (see `task_io_parent`) into this catalog's own dir.
+
+        Ex: so a kept task_io dir is no longer visible in an apptainer instance.
+        """
+        if self.task_io and not self.task_io.on_pilot.is_relative_to(self._namebased_dir):
+            shutil.move(self.task_io.on_pilot, self._namebased_dir / "task-io")
+
     def rm_unique_dirs(self) -> None:
         """Remove all directories (on host) created for use only by this container."""
         shutil.rmtree(self._namebased_dir)  # rm -r
+        # was the task_io dir made elsewhere? (see `task_io_parent`)
+        if self.task_io and self.task_io.on_pilot.exists():
+            shutil.rmtree(self.task_io.on_pilot)
 
 
 # --------------------------------------------------------------------------------------
 
 
-def _dump_binary_file(fpath: Path, stream: TextIO, name: str) -> None:
+def _to_bytes(size: str) -> int:
+    """Convert a docker-style size string (ex: '64m', '2gb') to bytes."""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([bkmgt]?)b?", size.strip().lower())
+    if not match:
+        raise ValueError(f"Invalid size: {size}")
+    return int(float(match.group(1)) * 1024 ** "bkmgt".index(match.group(2) or "b"))
+
+
+_DUMP_LOCK = threading.Lock()  # dumps may run in threads (see `run_blocking()`)
+
+
+def dump_binary_file(fpath: Path, stream: TextIO, name: str) -> None:
     start_line = f"--- start: {name} ({stream.name}) "
     end_line = f"--- end: {name} ({stream.name}) "
     try:
-        stream.write(start_line.ljust(60, "-") + "\n")
-        stream.flush()
-        with open(fpath, "rb") as file:
-            while True:
-                chunk = file.read(4096)
-                if not chunk:
-                    break
-                stream.buffer.write(chunk)
-        stream.write(end_line.ljust(60, "-") + "\n")
-        stream.flush()
+        with _DUMP_LOCK:  # don't interleave dumps
+            stream.write(start_line.ljust(60, "-") + "\n")
+            stream.flush()
+            with open(fpath, "rb") as file:
+                while True:
+                    chunk = file.read(4096)
+                    if not chunk:
+                        break
+                    stream.buffer.write(chunk)
+            stream.write(end_line.ljust(60, "-") + "\n")
+            stream.flush()
     except Exception as e:
         LOGGER.error(f"Error dumping container output ({stream.name}): {e}")
 
 
+class ApptainerInstance:
+    """A long-running apptainer instance, started once then reused by many runs.
+
+    Mounts can't be added to a running instance, so everything is mounted at
+    start: the data hub, the external directories, and a parent directory for
+    each run's task-io directory (see `DirectoryCatalog`'s `task_io_parent`).
+    So, an instance only runs one run at a time (see `ContainerRunner.acquire_instance()`),
+    and a run can't see another's task-io directory.
+    """
+
+    def __init__(self) -> None:
+        self.name = f"ewms-pilot-{uuid.uuid4().hex}"
+        self.dirs = DirectoryCatalog(
+            f"instance-{uuid.uuid4().hex}", include_task_io_directory=True
+        )
+        self.bind_mounts = self.dirs.assemble_bind_mounts(
+            include_external_directories=True
+        )
+
+    @property
+    def task_io_parent(self) -> ContainerBindMount:
+        """The mounted parent directory for every run's task-io directory."""
+        if not self.dirs.task_io:  # this is just for mypy :)
+            raise RuntimeError("DirectoryCatalog did not assign task_io dir")
+        return self.dirs.task_io
+
+    def check_bind_mounts(self, bind_mounts: list[ContainerBindMount]) -> None:
+        """Make sure the instance already has each of the run's wanted bind mounts."""
+        for m in bind_mounts:
+            if m in self.bind_mounts:
+                continue
+            # a run's own task-io dir is inside the mounted parent
+            if (
+                not m.is_readonly
+                and m.on_pilot.parent == self.task_io_parent.on_pilot
+                and m.in_task_container
+                == self.task_io_parent.in_task_container / m.on_pilot.name
+            ):
+                continue
+            raise ContainerSetupError(
+                f"Bind mount is not available in apptainer instance ({m})",
+                self.name,
+            )
+
+
 class ContainerRunner:
-    """A utility class to run a container."""
+    """A utility class to run a container.
+
+    Call `prepare_image()` before running anything.
+    """
 
     def __init__(
         self,
@@ -193,10 +298,13 @@ class ContainerRunner:
         args: str,
         timeout: int | None,
         env_json: str,
+        n_resource_slots: int | None = None,
     ) -> None:
+        """If `n_resource_slots` is given, the pilot's slot (CPUs, memory, PIDs)
+        is split into that many parts, one per concurrent container."""
         self.args = args
         self.timeout = timeout
-        self.image = self._prepull_image(image)
+        self.image = image  # see prepare_image()
 
         if env := json.loads(env_json):
             LOGGER.debug(f"Validating env: {env}")
@@ -213,8 +321,47 @@ class ContainerRunner:
             env = {}
         self.env = env
 
-    @staticmethod
-    def _prepull_image(image: str) -> str:
+        # if set, each run borrows an apptainer instance (see `start_instance()`)
+        self.instance_mode = False
+        self.instances: list[ApptainerInstance] = []
+        self._idle_instances: list[ApptainerInstance] = []
+
+        # if set, docker runs use the Docker Engine API instead of the CLI
+        self.docker_api: DockerEngineClient | None = None
+        if (
+            ENV._EWMS_PILOT_CONTAINER_PLATFORM.lower() == "docker"
+            and ENV._EWMS_PILOT_DOCKER_ENGINE_API
+        ):
+            self.docker_api = DockerEngineClient(ENV._EWMS_PILOT_DOCKER_SOCKET)
+
+        # every started container is tracked, so it can be stopped if needed
+        self.lifecycle = ContainerLifecycleManager(self.docker_api)
+
+        # if set, the image is from the node's image cache (see `prepare_image()`)
+        self._image_lease: ImageLease | None = None
+
+        # if set, each container gets its own part of the pilot's slot
+        self.slots: ResourceSlotPool | None = None
+        if n_resource_slots:
+            self.slots = ResourceSlotPool(SlotResources.detect(), n_resource_slots)
+
+    async def close(self) -> None:
+        """Stop any running containers, then release connections and cached images."""
+        await self.lifecycle.stop_all()
+        if self.docker_api:
+            await self.docker_api.close()
+        if self._image_lease:
+            self._image_lease.release()
+            self._image_lease = None
+
+    async def prepare_image(self) -> None:
+        """Pull (or convert) the image so it can be used in many runs.
+
+        This is done in a thread, so other startup work can go on in the meantime.
+        """
+        self.image = await asyncio.to_thread(self._prepull_image, self.image)
+
+    def _prepull_image(self, image: str) -> str:
         """Pull the image so it can be used in many tasks.
 
         Return the fully-qualified image name.
@@ -241,6 +388,13 @@ class ContainerRunner:
 
         match ENV._EWMS_PILOT_CONTAINER_PLATFORM.lower():
 
+            case "docker" if ENV._EWMS_PILOT_DOCKER_ENGINE_API:
+                try:
+                    pull_image_sync(ENV._EWMS_PILOT_DOCKER_SOCKET, image)
+                except (DockerAPIError, OSError) as e:
+                    raise ContainerSetupError(repr(e), image)
+                return image
+
             case "docker":
                 # First, check if the image already exists locally.
                 try:
@@ -281,30 +435,36 @@ class ContainerRunner:
                 if "." not in image and "://" not in image:
                     # is not a blah.sif file (or other) and doesn't point to a registry
                     image = f"docker://{image}"
-                # name it something that is recognizable -- and put it where there is enough space
-                dir_image = (
-                    f"{ENV._EWMS_PILOT_APPTAINER_BUILD_WORKDIR}/"
-                    f"{image.replace('://', '_').replace('/', '_')}/"
-                )
-                # build (convert)
-                _run(
-                    #
-                    # NOTE: validate & sanitize values HERE--this is the point of no return!
-                    #       (making calls here makes it very clear what is checked)
-                    #
-                    # cd b/c want to *build* in a directory w/ enough space (intermediate files)
-                    f"cd {ENV._EWMS_PILOT_APPTAINER_BUILD_WORKDIR} && "
-                    f"apptainer "
-                    f"{'--debug ' if ENV.EWMS_PILOT_CONTAINER_DEBUG else ''}"
-                    f"build "
-                    f"--fix-perms "
-                    f"--sandbox {shlex.quote(dir_image)} "
-                    f"{shlex.quote(image)}"
+                # build (convert) -- or reuse the build from another pilot on this node
+                cache = ApptainerImageCache(
+                    Path(ENV._EWMS_PILOT_APPTAINER_BUILD_WORKDIR) / "ewms-pilot-images",
+                    int(ENV._EWMS_PILOT_APPTAINER_IMAGE_CACHE_MAX_GB * 1024**3),
                 )
+
+                def _build(dest: Path) -> None:
+                    _run(
+                        #
+                        # NOTE: validate & sanitize values HERE--this is the point of no return!
+                        #       (making calls here makes it very clear what is checked)
+                        #
+                        # cd b/c want to *build* in a directory w/ enough space (intermediate files)
+                        f"cd {ENV._EWMS_PILOT_APPTAINER_BUILD_WORKDIR} && "
+                        f"apptainer "
+                        f"{'--debug ' if ENV.EWMS_PILOT_CONTAINER_DEBUG else ''}"
+                        f"build "
+                        f"--fix-perms "
+                        f"--sandbox {shlex.quote(str(dest))} "
+                        f"{shlex.quote(image)}"
+                    )
+
+                try:
+                    self._image_lease = cache.checkout(image, _build)
+                except OSError as e:
+                    raise ContainerSetupError(repr(e), image)
                 LOGGER.info(
-                    f"Image has been converted to Apptainer directory format: {dir_image}"
+                    f"Image is in Apptainer directory format: {self._image_lease.path}"
                 )
-                return dir_image
+                return str(self._image_lease.path)
 
             # ???
             case other:
@@ -328,46 +488,62 @@ class ContainerRunner:
             )
         return str(value)
 
-    async def run_container(
+    def _replace_arg_placeholders(
         self,
-        logging_alias: str,  # what to call this container for logging and error-reporting
-        stdoutfile: Path,
-        stderrfile: Path,
-        bind_mounts: list[ContainerBindMount],
-        env_as_dict: dict,
         infile_arg_replacement: str = "",
         outfile_arg_replacement: str = "",
         datahub_arg_replacement: str = "",
-    ) -> None:
-        """Run the container and dump outputs."""
-        dump_output = ENV.EWMS_PILOT_DUMP_TASK_OUTPUT
-
+        manifest_arg_replacement: str = "",
+    ) -> str:
         # insert arg placeholder replacements
         # -> give an alternative for each token replacement b/c it'd be a shame if
         #    things broke this late in the game
         inst_args = self.args
         if infile_arg_replacement:
-            for token in ["{{INFILE}}", "{{IN_FILE}}"]:
+            for token in INFILE_ARG_TOKENS:
                 inst_args = inst_args.replace(token, infile_arg_replacement)
         if outfile_arg_replacement:
-            for token in ["{{OUTFILE}}", "{{OUT_FILE}}"]:
+            for token in OUTFILE_ARG_TOKENS:
                 inst_args = inst_args.replace(token, outfile_arg_replacement)
         if datahub_arg_replacement:
-            for token in ["{{DATA_HUB}}", "{{DATAHUB}}"]:
+            for token in DATAHUB_ARG_TOKENS:
                 inst_args = inst_args.replace(token, datahub_arg_replacement)
+        if manifest_arg_replacement:
+            for token in MANIFEST_ARG_TOKENS:
+                inst_args = inst_args.replace(token, manifest_arg_replacement)
+        return inst_args
 
-        # assemble command
+    def _assemble_cmd(
+        self,
+        logging_alias: str,
+        bind_mounts: list[ContainerBindMount],
+        env_as_dict: dict,
+        inst_args: str,
+        container_name: str,
+        keep_stdin_open: bool = False,
+        slot: ResourceSlot | None = None,
+        instance: ApptainerInstance | None = None,
+    ) -> str:
         # NOTE: don't add to bind_mounts (WYSIWYG); also avoid intermediate structures
         match ENV._EWMS_PILOT_CONTAINER_PLATFORM.lower():
             case "docker":
-                cmd = (
+                return (
                     #
                     # NOTE: validate & sanitize values HERE--this is the point of no return!
                     #       (making calls here makes it very clear what is checked)
                     #
                     f"docker run --rm "
+                    # always add these -- see ContainerLifecycleManager
+                    f"--name {shlex.quote(container_name)} "
+                    f"--label {OWNER_LABEL}={shlex.quote(self.lifecycle.owner)} "
                     # optional
+                    f"{'--interactive ' if keep_stdin_open else ''}"
                     f"{f'--shm-size={ENV._EWMS_PILOT_DOCKER_SHM_SIZE} ' if ENV._EWMS_PILOT_DOCKER_SHM_SIZE else ''}"
+                    # resource limits -- see ResourceSlotPool
+                    f"{f'--cpuset-cpus={slot.cpuset} ' if slot and slot.cpus else ''}"
+                    f"{f'--cpus={slot.cpu_quota:.2f} ' if slot and slot.cpu_quota else ''}"
+                    f"{f'--memory={slot.memory_bytes}b ' if slot and slot.memory_bytes else ''}"
+                    f"{f'--pids-limit={slot.pids} ' if slot and slot.pids else ''}"
                     # bind mounts
                     f"{" ".join(
                         f"--mount type=bind,"
@@ -388,8 +564,34 @@ class ContainerRunner:
                     f"{shlex.quote(self.image)} "
                     f"{' '.join(shlex.quote(a) for a in shlex.split(inst_args))}"
                 )
+            case "apptainer" if instance:
+                instance.check_bind_mounts(bind_mounts)
+                return (
+                    #
+                    # NOTE: validate & sanitize values HERE--this is the point of no return!
+                    #       (making calls here makes it very clear what is checked)
+                    #
+                    f"apptainer "
+                    f"{'--debug ' if ENV.EWMS_PILOT_CONTAINER_DEBUG else ''}"
+                    # 'run' (not 'exec'), so the args go to the image's runscript--like
+                    # outside an instance; the instance (only) has this run's task-io dir
+                    f"run "
+                    # always add these flags
+                    f"--no-eval "  # don't interpret CL args
+                    # env vars
+                    f"{" ".join(
+                        f"--env "
+                        f"{self._validate_env_var_name(n)}="
+                        f"{shlex.quote(self._validate_env_var_value_to_str(v))}"
+                        for n, v in sorted((self.env | env_as_dict).items())
+                        # in case of key conflicts, choose the vals specific to this run
+                    )} "  # <- space
+                    # instance + args -- the bind mounts were already made (see above)
+                    f"instance://{shlex.quote(instance.name)} "
+                    f"{' '.join(shlex.quote(a) for a in shlex.split(inst_args))}"
+                )
             case "apptainer":
-                cmd = (
+                return (
                     #
                     # NOTE: validate & sanitize values HERE--this is the point of no return!
                     #       (making calls here makes it very clear what is checked)
@@ -400,6 +602,11 @@ class ContainerRunner:
                     # always add these flags
                     f"--containall "  # don't auto-mount anything
                     f"--no-eval "  # don't interpret CL args
+                    # resource limits (requires cgroups) -- see ResourceSlotPool
+                    f"{f'--cpuset-cpus {slot.cpuset} ' if slot and slot.cpus else ''}"
+                    f"{f'--cpus {slot.cpu_quota:.2f} ' if slot and slot.cpu_quota else ''}"
+                    f"{f'--memory {slot.memory_bytes} ' if slot and slot.memory_bytes else ''}"
+                    f"{f'--pids-limit {slot.pids} ' if slot and slot.pids else ''}"
                     # bind mounts
                     f"{" ".join(
                         f"--mount type=bind,"
@@ -424,43 +631,429 @@ class ContainerRunner:
                 raise ValueError(
                     f"'_EWMS_PILOT_CONTAINER_PLATFORM' is not a supported value: {other} ({logging_alias})"
                 )
-        LOGGER.info(f"Running {logging_alias} command: {cmd}")
 
-        # run: call & check outputs
+    def _assemble_docker_api_config(
+        self,
+        bind_mounts: list[ContainerBindMount],
+        env_as_dict: dict,
+        inst_args: str,
+        slot: ResourceSlot | None = None,
+    ) -> dict:
+        """Get the container config for the Docker Engine API's 'create' call.
+
+        This is the equivalent of `docker run` (see `_assemble_cmd()`).
+        """
+        # NOTE: values are not passed through a shell, but are validated all the same
+        config: dict = {
+            "Image": self.image,
+            "Env": [
+                f"{self._validate_env_var_name(n)}="
+                f"{self._validate_env_var_value_to_str(v)}"
+                for n, v in sorted((self.env | env_as_dict).items())
+                # in case of key conflicts, choose the vals specific to this run
+            ],
+            "Labels": {OWNER_LABEL: self.lifecycle.owner},
+            "HostConfig": {
+                "Mounts": [
+                    {
+                        "Type": "bind",
+                        "Source": str(m.on_pilot),
+                        "Target": str(m.in_task_container),
+                        "ReadOnly": m.is_readonly,
+                    }
+                    for m in bind_mounts
+                ],
+            },
+        }
+        if args := shlex.split(inst_args):  # otherwise, use the image's default
+            config["Cmd"] = args
+        if ENV._EWMS_PILOT_DOCKER_SHM_SIZE:
+            config["HostConfig"]["ShmSize"] = _to_bytes(ENV._EWMS_PILOT_DOCKER_SHM_SIZE)
+        if slot:  # see ResourceSlotPool
+            if slot.cpus:
+                config["HostConfig"]["CpusetCpus"] = slot.cpuset
+            if slot.cpu_quota:
+                config["HostConfig"]["NanoCpus"] = int(slot.cpu_quota * 10**9)
+            if slot.memory_bytes:
+                config["HostConfig"]["Memory"] = slot.memory_bytes
+            if slot.pids:
+                config["HostConfig"]["PidsLimit"] = slot.pids
+        return config
+
+    async def _run_docker_api_container(
+        self,
+        logging_alias: str,
+        config: dict,
+        container_name: str,
+        stdoutfile: Path,
+        stderrfile: Path,
+        resource_usage: ResourceUsage | None,
+        slot: ResourceSlot | None,
+    ) -> int:
+        """Run the container via the Docker Engine API and return its exit code."""
+        assert self.docker_api  # for mypy
+
+        container = await self.lifecycle.track(
+            TrackedContainer(
+                container_name,
+                docker_api_id=await self.docker_api.create_container(
+                    config, container_name
+                ),
+                slot=slot,
+            )
+        )
+        exit_code: int | None = None
         try:
             with open(stdoutfile, "wb") as stdoutf, open(stderrfile, "wb") as stderrf:
-                # await to start & prep coroutines
-                proc = await asyncio.create_subprocess_shell(
-                    cmd,
-                    stdout=stdoutf,
-                    stderr=stderrf,
+                await self.docker_api.start_container(container.docker_api_id)
+                logs = asyncio.create_task(
+                    self.docker_api.stream_logs(container.docker_api_id, stdoutf, stderrf)
                 )
-                # await to finish
                 try:
-                    await asyncio.wait_for(  # raises TimeoutError
-                        proc.wait(),
-                        timeout=self.timeout,
-                    )
+                    async with self._resource_monitor(container, resource_usage):
+                        exit_code = await asyncio.wait_for(  # raises TimeoutError
+                            self.docker_api.wait_container(container.docker_api_id),
+                            timeout=self.timeout,
+                        )
+                    return exit_code
                 except (TimeoutError, asyncio.exceptions.TimeoutError) as e:
                     # < 3.11 -> asyncio.exceptions.TimeoutError
                     raise ContainerRunError(
                         logging_alias,
                         f"[Timeout-Error] timed out after {self.timeout}s",
                     ) from e
+                finally:
+                    if exit_code is None:  # timed out or cancelled
+                        await self.lifecycle.stop(container)
+                    # the logs stream ends when the container exits
+                    try:
+                        await logs
+                    except Exception as e:
+                        LOGGER.error(f"Could not get {logging_alias} logs: {repr(e)}")
+        finally:
+            # NOTE: it may have been removed already (see above)
+            try:
+                await self.docker_api.remove_container(container.docker_api_id)
+            except DockerAPIError as e:
+                if e.status != 404:
+                    LOGGER.error(f"Could not remove {logging_alias} container: {repr(e)}")
+            await self.lifecycle.forget(container)
+
+    def _resource_monitor(
+        self,
+        container: TrackedContainer,
+        usage: ResourceUsage | None,
+    ) -> contextlib.AbstractAsyncContextManager:
+        """Get a context manager that samples the container's usage into `usage`."""
+        if usage is None:
+            return contextlib.nullcontext()
+        return self.resource_monitor(container, usage)
+
+    def resource_monitor(
+        self,
+        container: TrackedContainer,
+        usage: ResourceUsage | None = None,
+    ) -> ResourceMonitor:
+        """Get a ResourceMonitor for the (already-started) container."""
+
+        async def locate() -> Callable[[], ResourceUsage] | None:
+            if container.docker_api_id:
+                assert self.docker_api  # for mypy
+                info = await self.docker_api.inspect_container(container.docker_api_id)
+                if not (pid := info["State"]["Pid"]):
+                    return None  # not running yet
+                return docker_sampler(container.docker_api_id, pid)
+            elif ENV._EWMS_PILOT_CONTAINER_PLATFORM.lower() == "docker":
+                # the docker cli process is only a client, so ask the daemon
+                proc = await asyncio.create_subprocess_shell(
+                    f"docker inspect --format '{{{{.Id}}}} {{{{.State.Pid}}}}' "
+                    f"{shlex.quote(container.name)}",
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.DEVNULL,
+                )
+                stdout, _ = await proc.communicate()
+                if proc.returncode or stdout.split()[1:] == [b"0"]:
+                    return None  # not created/running yet
+                container_id, pid = stdout.decode().split()
+                return docker_sampler(container_id, int(pid))
+            elif container.proc:
+                return process_sampler(container.proc.pid)
+            return None
+
+        return ResourceMonitor(locate, usage)
+
+    def extract_error(self, stderrfile: Path) -> str:
+        """Get the most relevant error message from the container's stderr file."""
+        log_parser = LogParser(stderrfile)
+        if ENV._EWMS_PILOT_CONTAINER_PLATFORM.lower() == "apptainer":
+            return log_parser.apptainer_extract_error()
+        else:
+            return log_parser.generic_extract_error()
+
+    async def start_instance(self) -> None:
+        """Start an apptainer instance of the image, for the following runs to reuse.
+
+        This is only for apptainer. Each following run borrows an idle instance
+        (see `acquire_instance()`)--more are started as needed--and is an
+        `apptainer run` in it, which skips the per-container setup (namespaces,
+        mounts, etc.).
+        """
+        if ENV._EWMS_PILOT_CONTAINER_PLATFORM.lower() != "apptainer":
+            raise ContainerSetupError(
+                "Instances are only supported by apptainer", self.image
+            )
+        if self.instance_mode:
+            raise RuntimeError("Apptainer instance was already started")
+
+        self.instance_mode = True
+        self._idle_instances.append(await self._start_instance())
+
+    async def _start_instance(self) -> ApptainerInstance:
+        instance = ApptainerInstance()
+        cmd = (
+            #
+            # NOTE: validate & sanitize values HERE--this is the point of no return!
+            #       (making calls here makes it very clear what is checked)
+            #
+            f"apptainer "
+            f"{'--debug ' if ENV.EWMS_PILOT_CONTAINER_DEBUG else ''}"
+            f"instance start "
+            # always add these flags
+            f"--containall "  # don't auto-mount anything
+            # bind mounts
+            f"{" ".join(
+                f"--mount type=bind,"
+                f"source={shlex.quote(str(m.on_pilot))},"
+                f"target={shlex.quote(str(m.in_task_container))}"
+                f"{',readonly' if m.is_readonly else ''}"
+                for m in instance.bind_mounts
+            )} "  # <- space
+            # env vars
+            f"{" ".join(
+                f"--env "
+                f"{self._validate_env_var_name(n)}="
+                f"{shlex.quote(self._validate_env_var_value_to_str(v))}"
+                for n, v in sorted(self.env.items())
+            )} "  # <- space
+            # image + instance name
+            f"{shlex.quote(self.image)} "
+            f"{shlex.quote(instance.name)}"
+        )
+        LOGGER.info(f"Starting apptainer instance: {cmd}")
+
+        stdoutfile = instance.dirs.outputs_on_pilot / "stdoutfile"
+        stderrfile = instance.dirs.outputs_on_pilot / "stderrfile"
+        with open(stdoutfile, "wb") as stdoutf, open(stderrfile, "wb") as stderrf:
+            proc = await asyncio.create_subprocess_shell(
+                cmd,
+                stdout=stdoutf,
+                stderr=stderrf,
+            )
+            await proc.wait()
+        if proc.returncode:
+            await run_blocking(dump_binary_file, stdoutfile, sys.stdout, instance.name)
+            await run_blocking(dump_binary_file, stderrfile, sys.stderr, instance.name)
+            error = await run_blocking(self.extract_error, stderrfile)
+            raise ContainerSetupError(
+                f"Could not start apptainer instance ({error})",
+                self.image,
+            )
+
+        self.instances.append(instance)
+        await self.lifecycle.track_instance(instance.name)
+        LOGGER.info(f"Apptainer instance is running: {instance.name}")
+        return instance
+
+    @contextlib.asynccontextmanager
+    async def acquire_instance(self) -> AsyncIterator[ApptainerInstance | None]:
+        """Borrow an idle apptainer instance, starting one if there are none.
+
+        An instance only runs one run at a time, so a run can't see another's
+        task-io directory. If not in instance mode (see `start_instance()`), this
+        is None.
+        """
+        if not self.instance_mode:
+            yield None
+            return
+
+        if self._idle_instances:
+            instance = self._idle_instances.pop()
+        else:
+            instance = await self._start_instance()
+        try:
+            yield instance
+        finally:
+            if instance in self.instances:  # ex: not stopped in the meantime
+                self._idle_instances.append(instance)
+
+    async def stop_instances(self) -> None:
+        """Stop all the apptainer instances (if there are any)."""
+        instances, self.instances, self._idle_instances = self.instances, [], []
+        await asyncio.gather(*(self._stop_instance(i) for i in instances))
+
+    async def _stop_instance(self, instance: ApptainerInstance) -> None:
+        cmd = f"apptainer instance stop {shlex.quote(instance.name)}"
+        LOGGER.info(f"Stopping apptainer instance: {cmd}")
+        proc = await asyncio.create_subprocess_shell(cmd)
+        await proc.wait()
+        if proc.returncode:
+            LOGGER.error(
+                f"Could not stop apptainer instance {instance.name} "
+                f"(return code: {proc.returncode})"
+            )
+        else:
+            await self.lifecycle.forget_instance(instance.name)
+
+        if not ENV.EWMS_PILOT_KEEP_ALL_TASK_FILES:
+            await run_blocking(instance.dirs.rm_unique_dirs)
+
+    async def start_container(
+        self,
+        logging_alias: str,  # what to call this container for logging and error-reporting
+        stdoutfile: Path,
+        stderrfile: Path,
+        bind_mounts: list[ContainerBindMount],
+        env_as_dict: dict,
+        datahub_arg_replacement: str = "",
+    ) -> TrackedContainer:
+        """Start the container in the background, with its stdin kept open as a pipe.
+
+        The caller is responsible for the container from here on (waiting, stopping
+        via `self.lifecycle`, etc.).
+        """
+        container_name = self.lifecycle.new_name()
+        slot = self.slots.acquire() if self.slots else None
+        try:
+            cmd = self._assemble_cmd(
+                logging_alias,
+                bind_mounts,
+                env_as_dict,
+                self._replace_arg_placeholders(
+                    datahub_arg_replacement=datahub_arg_replacement
+                ),
+                container_name,
+                keep_stdin_open=True,
+                slot=slot,
+            )
+            LOGGER.info(f"Starting {logging_alias} command: {cmd}")
+
+            # the process keeps its own handles to the files, so ours can be closed
+            with open(stdoutfile, "wb") as stdoutf, open(stderrfile, "wb") as stderrf:
+                proc = await asyncio.create_subprocess_shell(
+                    cmd,
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=stdoutf,
+                    stderr=stderrf,
+                    start_new_session=True,  # its own process group -- see lifecycle
+                )
+        except BaseException:
+            if slot:
+                slot.release()
+            raise
+        # the slot is released when the container is forgotten
+        return await self.lifecycle.track(
+            TrackedContainer(container_name, proc=proc, slot=slot)
+        )
+
+    async def run_container(
+        self,
+        logging_alias: str,  # what to call this container for logging and error-reporting
+        stdoutfile: Path,
+        stderrfile: Path,
+        bind_mounts: list[ContainerBindMount],
+        env_as_dict: dict,
+        infile_arg_replacement: str = "",
+        outfile_arg_replacement: str = "",
+        datahub_arg_replacement: str = "",
+        manifest_arg_replacement: str = "",
+        resource_usage: ResourceUsage | None = None,
+        instance: ApptainerInstance | None = None,
+    ) -> None:
+        """Run the container and dump outputs.
+
+        If `resource_usage` is given, it's filled in as the container runs.
+        If `instance` is given, it's run in that apptainer instance (see `acquire_instance()`).
+        """
+        dump_output = ENV.EWMS_PILOT_DUMP_TASK_OUTPUT
+
+        inst_args = self._replace_arg_placeholders(
+            infile_arg_replacement,
+            outfile_arg_replacement,
+            datahub_arg_replacement,
+            manifest_arg_replacement,
+        )
+        container_name = self.lifecycle.new_name()
+        slot = self.slots.acquire() if self.slots else None
+
+        # run: call & check outputs
+        returncode: int | None
+        try:
+            if self.docker_api:
+                config = self._assemble_docker_api_config(
+                    bind_mounts, env_as_dict, inst_args, slot
+                )
+                LOGGER.info(f"Running {logging_alias} via Docker Engine API: {config}")
+            else:
+                cmd = self._assemble_cmd(
+                    logging_alias,
+                    bind_mounts,
+                    env_as_dict,
+                    inst_args,
+                    container_name,
+                    slot=slot,
+                    instance=instance,
+                )
+                LOGGER.info(f"Running {logging_alias} command: {cmd}")
+
+            if self.docker_api:
+                returncode = await self._run_docker_api_container(
+                    logging_alias,
+                    config,
+                    container_name,
+                    stdoutfile,
+                    stderrfile,
+                    resource_usage,
+                    slot,
+                )
+            else:
+                with open(stdoutfile, "wb") as stdoutf, open(stderrfile, "wb") as stderrf:
+                    # await to start & prep coroutines
+                    proc = await asyncio.create_subprocess_shell(
+                        cmd,
+                        stdout=stdoutf,
+                        stderr=stderrf,
+                        start_new_session=True,  # its own process group -- see lifecycle
+                    )
+                    container = await self.lifecycle.track(
+                        TrackedContainer(container_name, proc=proc, slot=slot)
+                    )
+                    # await to finish
+                    try:
+                        async with self._resource_monitor(container, resource_usage):
+                            await asyncio.wait_for(  # raises TimeoutError
+                                proc.wait(),
+                                timeout=self.timeout,
+                            )
+                    except (TimeoutError, asyncio.exceptions.TimeoutError) as e:
+                        # < 3.11 -> asyncio.exceptions.TimeoutError
+                        raise ContainerRunError(
+                            logging_alias,
+                            f"[Timeout-Error] timed out after {self.timeout}s",
+                        ) from e
+                    finally:
+                        if proc.returncode is None:  # timed out or cancelled
+                            await self.lifecycle.stop(container)
+                        await self.lifecycle.forget(container)
+                returncode = proc.returncode
 
-            LOGGER.info(f"{logging_alias} return code: {proc.returncode}")
+            LOGGER.info(f"{logging_alias} return code: {returncode}")
 
             # exception handling (immediately re-handled by 'except' below)
-            if proc.returncode:
-                log_parser = LogParser(stderrfile)
+            if returncode:
                 raise ContainerRunError(
                     logging_alias,
-                    (
-                        log_parser.apptainer_extract_error()
-                        if ENV._EWMS_PILOT_CONTAINER_PLATFORM.lower() == "apptainer"
-                        else log_parser.generic_extract_error()
-                    ),
-                    exit_code=proc.returncode,
+                    await run_blocking(self.extract_error, stderrfile),
+                    exit_code=returncode,
                 )
 
         except Exception as e:
@@ -468,6 +1061,8 @@ class ContainerRunner:
             dump_output = True
             raise
         finally:
+            if slot:  # in case it never got to its container
+                slot.release()
             if dump_output:
-                _dump_binary_file(stdoutfile, sys.stdout, logging_alias)
-                _dump_binary_file(stderrfile, sys.stderr, logging_alias)
+                await run_blocking(dump_binary_file, stdoutfile, sys.stdout, logging_alias)
+                await run_blocking(dump_binary_file, stderrfile, sys.stderr, logging_alias)
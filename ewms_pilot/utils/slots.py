@@ -0,0 +1,242 @@
+"""Finding the pilot's slot size, and partitioning it between concurrent containers."""
+
+import contextlib
+import dataclasses as dc
+import logging
+import math
+import os
+import shutil
+from pathlib import Path
+
+from .resources import CGROUP_ROOT, cgroup_of
+
+LOGGER = logging.getLogger(__name__)
+
+
+def read_cgroup_limit(cgroup_dir: Path, fname: str) -> int | None:
+    """Get the smallest limit set on the cgroup (v2) or any of its ancestors."""
+    limits = []
+    for d in [cgroup_dir, *cgroup_dir.parents]:
+        if not d.is_relative_to(CGROUP_ROOT):
+            break
+        with contextlib.suppress(OSError, ValueError):
+            value = (d / fname).read_text().strip()
+            if value != "max":
+                limits.append(int(value))
+    return min(limits) if limits else None
+
+
+def _read_cgroup_cpus(cgroup_dir: Path) -> int | None:
+    """Get the no. of CPUs allowed by the cgroup's (v2) quota, or its ancestors'."""
+    limits = []
+    for d in [cgroup_dir, *cgroup_dir.parents]:
+        if not d.is_relative_to(CGROUP_ROOT):
+            break
+        with contextlib.suppress(OSError, ValueError):
+            quota, period = (d / "cpu.max").read_text().split()  # ex: "200000 100000"
+            if quota != "max":
+                limits.append(max(1, math.ceil(int(quota) / int(period))))
+    return min(limits) if limits else None
+
+
+def read_classad_file(fpath: str | Path) -> dict[str, str]:
+    """Read an (old-style) classad file, ex: `_CONDOR_JOB_AD`--values stay strings."""
+    ad = {}
+    with contextlib.suppress(OSError):
+        for line in Path(fpath).read_text().splitlines():
+            key, sep, value = line.partition("=")
+            if sep:
+                ad[key.strip().lower()] = value.strip().strip('"')
+    return ad
+
+
+def _classad_number(ad: dict[str, str], *keys: str) -> float | None:
+    """Get the first of the keys that has a (literal) number value."""
+    for key in keys:
+        with contextlib.suppress(KeyError, ValueError):
+            return float(ad[key.lower()])
+    return None
+
+
+@dc.dataclass(frozen=True)
+class SlotSize:
+    """The size of the pilot's slot--any unknown value is None."""
+
+    cpus: int | None
+    memory_bytes: int | None
+    disk_bytes: int | None  # scratch space
+    walltime_sec: int | None
+    source: str  # where the values came from (for logging)
+
+    @staticmethod
+    def detect() -> "SlotSize":
+        """Find the slot's size from HTCondor's machine & job ads, if there are any.
+
+        Otherwise (or for any missing value), fall back to the pilot's cgroup
+        limits, CPU affinity, and the machine itself.
+        """
+        machine_ad = read_classad_file(os.getenv("_CONDOR_MACHINE_AD", "/dev/null"))
+        job_ad = read_classad_file(os.getenv("_CONDOR_JOB_AD", "/dev/null"))
+        sources = []
+
+        def from_ads(*keys: str, scale: float = 1) -> int | None:
+            # the machine ad has the slot's actual size, the job ad only its request
+            for name, ad in [("machine ad", machine_ad), ("job ad", job_ad)]:
+                if (value := _classad_number(ad, *keys)) is not None:
+                    sources.append(name)
+                    return int(value * scale)
+            return None
+
+        cgroup = cgroup_of(os.getpid())
+
+        # cpus
+        cpus = from_ads("Cpus", "RequestCpus")
+        if cpus is None:
+            sources.append("cpu affinity")
+            cpus = len(os.sched_getaffinity(0))
+            if cgroup and (quota := _read_cgroup_cpus(cgroup)):
+                cpus = min(cpus, quota)
+        # memory
+        memory_bytes = from_ads("Memory", "RequestMemory", scale=1024**2)  # MB
+        if memory_bytes is None:
+            sources.append("cgroup")
+            if cgroup:
+                memory_bytes = read_cgroup_limit(cgroup, "memory.max")
+            if memory_bytes is None:
+                memory_bytes = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+        # disk
+        disk_bytes = from_ads("Disk", "RequestDisk", scale=1024)  # KB
+        if disk_bytes is None:
+            with contextlib.suppress(OSError):
+                disk_bytes = shutil.disk_usage(
+                    os.getenv("_CONDOR_SCRATCH_DIR", os.getcwd())
+                ).free
+        # walltime -- there's no standard attribute, so check the common ones
+        walltime_sec = from_ads("MaxRuntime", "BatchRuntime", "MaxWallTime")
+
+        return SlotSize(
+            cpus=cpus,
+            memory_bytes=memory_bytes,
+            disk_bytes=disk_bytes,
+            walltime_sec=walltime_sec,
+            source=", ".join(dict.fromkeys(sources)),  # dedup, in order
+        )
+
+
+def _format_cpuset(cpus: list[int]) -> str:
+    """Get the cpuset string, ex: [0, 1, 2, 5] -> '0-2,5'."""
+    ranges: list[list[int]] = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(f"{a}-{b}" if a != b else f"{a}" for a, b in ranges)
+
+
+@dc.dataclass(frozen=True)
+class SlotResources:
+    """The resources allocated to the pilot--any unknown limit is None."""
+
+    cpus: list[int]
+    memory_bytes: int | None
+    pids: int | None
+    # the no. of CPUs the slot may use, if fewer than `cpus` (ex: without
+    # HTCondor's ASSIGN_CPU_AFFINITY, the affinity is the whole node)
+    n_cpus: int | None = None
+
+    @staticmethod
+    def detect() -> "SlotResources":
+        """Get the pilot's CPUs (affinity) and its cgroup's memory & PID limits.
+
+        The no. of CPUs is capped like `SlotSize.detect()`'s (by the ads or
+        the cgroup's quota).
+        """
+        cgroup = cgroup_of(os.getpid())
+        cpus = sorted(os.sched_getaffinity(0))
+        n_cpus = SlotSize.detect().cpus
+        return SlotResources(
+            cpus=cpus,
+            memory_bytes=read_cgroup_limit(cgroup, "memory.max") if cgroup else None,
+            pids=read_cgroup_limit(cgroup, "pids.max") if cgroup else None,
+            n_cpus=n_cpus if n_cpus and n_cpus < len(cpus) else None,
+        )
+
+
+@dc.dataclass(eq=False)
+class ResourceSlot:
+    """One container's share of the pilot's slot--any unknown limit is None."""
+
+    index: int
+    cpus: list[int]  # to pin to (may be empty)
+    memory_bytes: int | None
+    pids: int | None
+    cpu_quota: float | None = None  # no. of CPUs, when not pinned
+    _pool: "ResourceSlotPool | None" = dc.field(default=None, repr=False)
+
+    @property
+    def cpuset(self) -> str:
+        """The cpuset string, ex: '0-2,5'."""
+        return _format_cpuset(self.cpus)
+
+    def release(self) -> None:
+        """Give the slot back to its pool--this can be called more than once."""
+        if self._pool:
+            self._pool.free.append(self)
+            self._pool = None
+
+
+class ResourceSlotPool:
+    """Splits the pilot's slot into `n` parts, one per concurrent container.
+
+    Each part gets a disjoint set of the CPUs (unless there are more parts
+    than CPUs), and an equal share of the memory & PID limits, so the parts
+    add up to the whole slot. A part is reused once its container is done.
+
+    If the slot may use fewer CPUs than it's pinned to (`n_cpus`), those CPUs
+    may be shared with other jobs, so each part gets an equal share of the
+    CPU quota instead.
+    """
+
+    def __init__(self, resources: SlotResources, n: int) -> None:
+        if n < 1:
+            raise ValueError(f"Cannot split the slot into {n} parts")
+        self.resources = resources
+
+        size, extra = divmod(len(resources.cpus), n)
+        self.slots: list[ResourceSlot] = []
+        start = 0
+        for i in range(n):
+            if resources.n_cpus:
+                cpus = []
+            elif size:
+                cpus = resources.cpus[start : start + size + (i < extra)]
+                start += len(cpus)
+            else:  # more parts than cpus -> share
+                cpus = [resources.cpus[i % len(resources.cpus)]]
+            self.slots.append(
+                ResourceSlot(
+                    i,
+                    cpus,
+                    resources.memory_bytes // n if resources.memory_bytes else None,
+                    max(1, resources.pids // n) if resources.pids else None,
+                    cpu_quota=resources.n_cpus / n if resources.n_cpus else None,
+                )
+            )
+        self.free = list(reversed(self.slots))  # pop() from the end -> 0, 1, ...
+
+        LOGGER.info(f"Split the pilot's slot ({resources}) into: {self.slots}")
+        if not size and not resources.n_cpus:
+            LOGGER.warning(
+                f"There are more concurrent containers ({n}) than CPUs "
+                f"({len(resources.cpus)}), so some CPUs are shared"
+            )
+
+    def acquire(self) -> ResourceSlot | None:
+        """Get a free slot, or None if they're all in use."""
+        if not self.free:
+            LOGGER.warning("All resource slots are in use, not partitioning container")
+            return None
+        slot = self.free.pop()
+        slot._pool = self
+        return slot
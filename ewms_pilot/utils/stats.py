@@ -0,0 +1,109 @@
+"""Streaming statistics."""
+
+import math
+
+
+class RuntimeStats:
+    """Streaming statistics for runtimes: O(1) per update, constant memory.
+
+    - count, mean, variance: Welford's online algorithm
+    - min, max, total: running values
+    - quantiles & distribution: an HDR-style histogram of log-scaled bins,
+      so any quantile estimate is within a (small) relative error
+    """
+
+    MIN_VALUE = 1e-3  # anything smaller goes in the lowest bin, [0, MIN_VALUE)
+    BINS_PER_DECADE = 64  # sketch resolution: each bin is ~3.7% wide
+    DISPLAY_BINS_PER_DECADE = 8  # must divide BINS_PER_DECADE
+
+    UNDERFLOW_BIN = -1
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0  # sum of squared differences from the mean
+        self.min = math.inf
+        self.max = -math.inf
+        self.total = 0.0
+
+        # bin index -> count (bounded: BINS_PER_DECADE per decade of values seen)
+        self._bins: dict[int, int] = {}
+
+    def add(self, value: float) -> None:
+        """Add a value."""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.total += value
+
+        index = self._bin_index(value)
+        self._bins[index] = self._bins.get(index, 0) + 1
+
+    @property
+    def variance(self) -> float:
+        """The (population) variance."""
+        return self._m2 / self.count if self.count else 0.0
+
+    @property
+    def std(self) -> float:
+        """The (population) standard deviation."""
+        return math.sqrt(self.variance)
+
+    #
+    # bins
+    #
+
+    def _bin_index(self, value: float) -> int:
+        if value < self.MIN_VALUE:
+            return self.UNDERFLOW_BIN
+        return math.floor(math.log10(value / self.MIN_VALUE) * self.BINS_PER_DECADE)
+
+    def _bin_edges(self, index: int, bins_per_decade: int) -> tuple[float, float]:
+        if index == self.UNDERFLOW_BIN:
+            return 0.0, self.MIN_VALUE
+        return (
+            self.MIN_VALUE * 10 ** (index / bins_per_decade),
+            self.MIN_VALUE * 10 ** ((index + 1) / bins_per_decade),
+        )
+
+    def quantile(self, q: float) -> float:
+        """Estimate the q-th quantile (0 <= q <= 1)."""
+        if not self.count:
+            raise ValueError("no values")
+        if not 0 <= q <= 1:
+            raise ValueError(f"quantile must be in [0, 1]: {q}")
+
+        # rank, as with linear interpolation (ex: numpy's default)
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self._bins):
+            n = self._bins[index]
+            if seen + n > rank:
+                # interpolate within the bin, then keep within the real bounds
+                left, right = self._bin_edges(index, self.BINS_PER_DECADE)
+                estimate = left + (right - left) * ((rank - seen) / n)
+                return min(max(estimate, self.min), self.max)
+            seen += n
+        return self.max  # only reached by float imprecision
+
+    def histogram(self) -> list[tuple[float, float, int]]:
+        """Get the distribution as fixed log-scaled bins: (left, right, count).
+
+        Bins are in ascending order; empty bins between non-empty bins are included.
+        """
+        ratio = self.BINS_PER_DECADE // self.DISPLAY_BINS_PER_DECADE
+        display: dict[int, int] = {}
+        for index, n in self._bins.items():
+            # NOTE: floor division keeps the underflow bin (-1) as -1
+            display[index // ratio] = display.get(index // ratio, 0) + n
+
+        if not display:
+            return []
+        return [
+            (*self._bin_edges(i, self.DISPLAY_BINS_PER_DECADE), display.get(i, 0))
+            for i in range(min(display), max(display) + 1)
+        ]
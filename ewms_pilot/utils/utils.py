@@ -4,10 +4,9 @@ import json
 import logging
 import re
 from pathlib import Path
+from typing import Iterable
 
-import numpy as np
-
-from ewms_pilot.tasks.map import TaskMapping
+from ewms_pilot.tasks.map import TaskLedger, TaskMapping, TaskRecord
 
 LOGGER = logging.getLogger(__name__)
 
@@ -24,7 +23,7 @@ def all_task_errors_string(task_errors: list[BaseException]) -> str:
     )
 
 
-def dump_all_taskmaps(task_maps: list[TaskMapping]) -> None:
+def dump_all_taskmaps(task_maps: Iterable[TaskMapping | TaskRecord]) -> None:
     """Dump all the task maps."""
     LOGGER.debug(
         json.dumps(
@@ -35,6 +34,9 @@ def dump_all_taskmaps(task_maps: list[TaskMapping]) -> None:
                     "runtime": tm.end_time - tm.start_time,
                     "done": tm.is_done,
                     "error": bool(tm.error),
+                    "resources": (
+                        tm.resource_usage.to_dict() if tm.resource_usage else None
+                    ),
                 }
                 for tm in task_maps
             ],
@@ -43,29 +45,25 @@ def dump_all_taskmaps(task_maps: list[TaskMapping]) -> None:
     )
 
 
-def dump_task_runtime_stats(task_maps: list[TaskMapping]) -> None:
+def dump_task_runtime_stats(task_maps: TaskLedger) -> None:
     """Dump stats about the given task maps."""
     LOGGER.info("Task runtime stats (successful tasks):")
 
-    runtimes = [
-        tm.end_time - tm.start_time for tm in task_maps if tm.is_done and not tm.error
-    ]
-    if not runtimes:
+    stats = task_maps.runtime_stats
+    if not stats.count:
         LOGGER.info("no finished successful tasks")
         return
 
-    data_np = np.array(runtimes)
-
-    # calculate statistics
+    # calculate statistics -- these are all kept up-to-date incrementally
     stats_summary = {
-        "Count": len(runtimes),
-        "Mean": np.mean(data_np),
-        "Median": np.median(data_np),
-        "Variance": np.var(data_np),
-        "Standard Deviation": np.std(data_np),
-        "Min": np.min(data_np),
-        "Max": np.max(data_np),
-        "Range": np.ptp(data_np),
+        "Count": stats.count,
+        "Mean": stats.mean,
+        "Median": stats.quantile(0.5),
+        "Variance": stats.variance,
+        "Standard Deviation": stats.std,
+        "Min": stats.min,
+        "Max": stats.max,
+        "Range": stats.max - stats.min,
     }
     for key, value in stats_summary.items():
         LOGGER.info(f"({key.lower()}: {value:.2f})")
@@ -75,15 +73,10 @@ def dump_task_runtime_stats(task_maps: list[TaskMapping]) -> None:
 
     # make bins and a terminal-friendly chart
     LOGGER.info("Runtimes distribution:")
-    hist, bin_edges = np.histogram(data_np, bins="auto")
     no_datapoints_buffer: list[float] | None = None
-    for i in range(len(hist)):
-        # calc range bounds
-        left = float(bin_edges[i])
-        right = float(bin_edges[i + 1])
-
+    for left, right, count in stats.histogram():
         # any data in range? if not, keep track of it so we don't log a ton of empty lines
-        if not hist[i]:
+        if not count:
             if no_datapoints_buffer:  # extend right bound
                 no_datapoints_buffer[1] = right
             else:
@@ -98,27 +91,47 @@ def dump_task_runtime_stats(task_maps: list[TaskMapping]) -> None:
             no_datapoints_buffer = None
 
         # log it
-        bar = "#" * hist[i]
+        bar = "#" * count
         bin_range = _to_range_string(left, right)
         LOGGER.info(f"{bin_range:20} | {bar}")
 
 
-def dump_tallies(task_maps: list[TaskMapping], dump_n_pending: bool = True) -> None:
+def dump_task_resource_stats(task_maps: TaskLedger) -> None:
+    """Dump stats about the resource usage of the given task maps."""
+    LOGGER.info("Task resource usage stats (successful tasks):")
+
+    if not task_maps.resource_stats:
+        LOGGER.info("no resource usage was measured")
+        return
+
+    for name, stats in task_maps.resource_stats.items():
+        LOGGER.info(
+            f"{name}: "
+            f"(count: {stats.count}) "
+            f"(mean: {stats.mean:.2f}) "
+            f"(median: {stats.quantile(0.5):.2f}) "
+            f"(90th percentile: {stats.quantile(0.9):.2f}) "
+            f"(max: {stats.max:.2f}) "
+            f"(total: {stats.total:.2f})"
+        )
+
+
+def dump_tallies(task_maps: TaskLedger, dump_n_pending: bool = True) -> None:
     """Dump tallies about the given task maps."""
     string = ""
     if dump_n_pending:
-        string += f"{TaskMapping.n_pending(task_maps)} Pending Tasks "
+        string += f"{task_maps.n_pending} Pending Tasks "
     string += (
-        f"{TaskMapping.n_done(task_maps)} Finished Tasks "
+        f"{task_maps.n_done} Finished Tasks "
         f"("
-        f"{TaskMapping.n_successful(task_maps)} succeeded, "
-        f"{TaskMapping.n_failed(task_maps)} failed"
+        f"{task_maps.n_successful} succeeded, "
+        f"{task_maps.n_failed} failed"
         f")"
     )
     LOGGER.info(string)
 
-    if _errors := [tm.error for tm in task_maps if tm.error]:
-        LOGGER.error(all_task_errors_string(_errors))
+    if task_maps.errors:
+        LOGGER.error(all_task_errors_string(task_maps.errors))
 
 
 class NoLogsInFileException(Exception):
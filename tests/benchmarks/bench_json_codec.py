@@ -0,0 +1,53 @@
+"""Micro-benchmarks for the JSON codecs (see `ewms_pilot/utils/json_codec.py`).
+
+Run: `python tests/benchmarks/bench_json_codec.py`
+"""
+
+import timeit
+
+from ewms_pilot.utils.json_codec import CODECS, get_codec
+
+PAYLOADS = {
+    # like the integration tests' messages -- many small objects
+    "small object": {"attr-a": "item7", "attr-b": "item7item7"},
+    # a typical result -- a big nested list (~8 MB of json)
+    "nested floats": [[i * 0.123456789 + j for j in range(500)] for i in range(1000)],
+    "nested records": [
+        {"id": i, "name": f"event-{i}", "values": list(range(50)), "ok": i % 2 == 0}
+        for i in range(20_000)
+    ],
+}
+
+REPEAT = 3
+
+
+def main() -> None:
+    """Print the best time (and speedup over stdlib) of each installed codec."""
+    codecs = []
+    for name in CODECS:
+        try:
+            codecs.append(get_codec(name))
+        except ImportError:
+            print(f"{name}: not installed")
+
+    for label, payload in PAYLOADS.items():
+        data = get_codec("stdlib").dumps(payload)
+        number = max(1, 100_000 // len(data))  # enough runs for small payloads
+        print(f"\n{label} ({len(data):,} bytes, {number} runs):")
+
+        baseline: dict[str, float] = {}
+        for codec in reversed(codecs):  # stdlib first
+            for op, func in [
+                ("dumps", lambda: codec.dumps(payload)),  # noqa: B023
+                ("loads", lambda: codec.loads(data)),  # noqa: B023
+            ]:
+                best = min(timeit.repeat(func, number=number, repeat=REPEAT)) / number
+                baseline.setdefault(op, best)
+                print(
+                    f"  {codec.name:>8} {op}: {best * 1e6:12.1f} µs"
+                    f"  ({baseline[op] / best:5.1f}x)"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -1417,3 +1417,148 @@ with open(os.environ['EWMS_TASK_DATA_HUB_DIR'] + '/initoutput', 'w') as f:
         expected_data_hub_dir_contents=[Path("initoutput")],
         expected_has_init_cmd_subdir=True,
     )
+
+
+########################################################################################
+
+
+async def test_7000__worker_mode(
+    queue_incoming: str,
+    queue_outgoing: str,
+) -> None:
+    """Test a pilot that sends tasks to long-lived task containers."""
+    msgs_to_subproc = MSGS_TO_SUBPROC
+    msgs_outgoing_expected = [f"{x}{x}\n" for x in msgs_to_subproc]
+
+    # run producer & consumer concurrently
+    await asyncio.gather(
+        populate_queue(
+            queue_incoming,
+            msgs_to_subproc,
+            intermittent_sleep=TIMEOUT_INCOMING / 4,
+        ),
+        consume_and_reply(
+            f"{os.environ['CI_TEST_ALPINE_PYTHON_IMAGE']}",
+            """python3 -c "
+import json, os, sys
+fifo = open(os.environ['EWMS_TASK_WORKER_FIFO'], 'w')
+for line in sys.stdin:
+    req = json.loads(line)
+    output = open(req['infile']).read().strip() * 2;
+    print(output, file=open(req['outfile'],'w'))
+    print(json.dumps({'id': req['id'], 'exit_code': 0}), file=fifo, flush=True)
+" """,  # double cat
+            queue_incoming=queue_incoming,
+            queue_outgoing=queue_outgoing,
+            timeout_incoming=TIMEOUT_INCOMING,
+            max_concurrent_tasks=MAX_CONCURRENT_TASKS,
+            task_worker_mode=True,
+        ),
+    )
+
+    await assert_results(queue_outgoing, msgs_outgoing_expected)
+
+    # each worker was only started once -- and did all of its tasks
+    worker_dirs = [p for p in PILOT_DATA_DIR.iterdir() if p.name.startswith("worker-")]
+    assert len(worker_dirs) <= MAX_CONCURRENT_TASKS
+    assert sum(
+        len(list(d.glob("task-io/outfile-*.out"))) for d in worker_dirs
+    ) >= len(msgs_outgoing_expected)
+
+
+########################################################################################
+
+
+@pytest.mark.skipif(
+    ENV._EWMS_PILOT_CONTAINER_PLATFORM != "apptainer",
+    reason="test only for apptainer",
+)
+async def test_7100__apptainer_instance_mode(
+    queue_incoming: str,
+    queue_outgoing: str,
+) -> None:
+    """Test a pilot that runs each task in an apptainer instance, one at a time."""
+    msgs_to_subproc = MSGS_TO_SUBPROC
+    msgs_outgoing_expected = [f"{x}{x}\n" for x in msgs_to_subproc]
+
+    # run producer & consumer concurrently
+    await asyncio.gather(
+        populate_queue(
+            queue_incoming,
+            msgs_to_subproc,
+            intermittent_sleep=TIMEOUT_INCOMING / 4,
+        ),
+        consume_and_reply(
+            f"{os.environ['CI_TEST_ALPINE_PYTHON_IMAGE']}",
+            """python3 -c "
+output = open('{{INFILE}}').read().strip() * 2;
+print(output, file=open('{{OUTFILE}}','w'))" """,  # double cat
+            queue_incoming=queue_incoming,
+            queue_outgoing=queue_outgoing,
+            timeout_incoming=TIMEOUT_INCOMING,
+            max_concurrent_tasks=MAX_CONCURRENT_TASKS,
+            task_apptainer_instance_mode=True,
+        ),
+    )
+
+    await assert_results(queue_outgoing, msgs_outgoing_expected)
+
+    # an instance was started for each concurrent task (at most)
+    instance_dirs = [
+        p for p in PILOT_DATA_DIR.iterdir() if p.name.startswith("instance-")
+    ]
+    assert 1 <= len(instance_dirs) <= MAX_CONCURRENT_TASKS
+    # ...and each task's kept i/o was moved out of its instance's mounted task-io dir
+    for d in instance_dirs:
+        assert not list(d.glob("task-io/*"))
+    assert len(list(PILOT_DATA_DIR.glob("*/task-io/outfile-*.out"))) >= len(
+        msgs_outgoing_expected
+    )
+
+
+########################################################################################
+
+
+@pytest.mark.parametrize("task_batch_wait_ms", [0, 500])
+async def test_7200__batches(
+    queue_incoming: str,
+    queue_outgoing: str,
+    task_batch_wait_ms: int,
+) -> None:
+    """Test a pilot that processes a batch of messages in each container."""
+    msgs_to_subproc = MSGS_TO_SUBPROC
+    msgs_outgoing_expected = [f"{x}{x}\n" for x in msgs_to_subproc]
+
+    # run producer & consumer concurrently
+    await asyncio.gather(
+        populate_queue(
+            queue_incoming,
+            msgs_to_subproc,
+            intermittent_sleep=TIMEOUT_INCOMING / 4,
+        ),
+        consume_and_reply(
+            f"{os.environ['CI_TEST_ALPINE_PYTHON_IMAGE']}",
+            """python3 -c "
+import json
+for pair in json.load(open('{{MANIFEST}}')):
+    output = open(pair['infile']).read().strip() * 2;
+    print(output, file=open(pair['outfile'],'w'))" """,  # double cat
+            queue_incoming=queue_incoming,
+            queue_outgoing=queue_outgoing,
+            timeout_incoming=TIMEOUT_INCOMING,
+            prefetch=5,
+            task_batch_size=5,
+            task_batch_wait_ms=task_batch_wait_ms,
+        ),
+    )
+
+    await assert_results(queue_outgoing, msgs_outgoing_expected)
+
+    # each batch has one manifest + the messages' files
+    batch_dirs = [p for p in PILOT_DATA_DIR.iterdir() if p.name.startswith("batch-")]
+    assert len(batch_dirs) < len(msgs_outgoing_expected)
+    for batch_dir in batch_dirs:
+        assert (batch_dir / "task-io/manifest.json").exists()
+        n_infiles = len(list(batch_dir.glob("task-io/infile-*.in")))
+        assert 1 <= n_infiles <= 5
+        assert len(list(batch_dir.glob("task-io/outfile-*.out"))) == n_infiles
@@ -0,0 +1,101 @@
+"""Test running tasks in apptainer instances."""
+
+import asyncio
+import dataclasses as dc
+import os
+from pathlib import Path
+
+import pytest
+
+from ewms_pilot.config import ENV
+from ewms_pilot.utils import runner
+from ewms_pilot.utils.runner import (
+    ApptainerInstance,
+    ContainerRunner,
+    ContainerSetupError,
+    DirectoryCatalog,
+)
+
+
+@pytest.fixture
+def task_runner(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> ContainerRunner:
+    """A task runner on apptainer, with a fake `apptainer` command."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "apptainer").write_text("#!/bin/sh\nexit 0\n")
+    (bin_dir / "apptainer").chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}:{os.environ['PATH']}")
+
+    monkeypatch.setattr(
+        runner, "ENV", dc.replace(ENV, _EWMS_PILOT_CONTAINER_PLATFORM="apptainer")
+    )
+    monkeypatch.setattr(runner, "PILOT_DATA_DIR", tmp_path / "ewms-pilot-data")
+    return ContainerRunner("foo/bar:latest", "", None, "{}")
+
+
+async def test_000__one_run_per_instance(task_runner: ContainerRunner) -> None:
+    """Test that concurrent runs get their own instances, and can't see each other's files."""
+    await task_runner.start_instance()
+    assert len(task_runner.instances) == 1
+
+    async def task(
+        name: str, go: asyncio.Event
+    ) -> tuple[DirectoryCatalog, ApptainerInstance]:
+        async with task_runner.acquire_instance() as instance:
+            assert instance
+            dirs = DirectoryCatalog(
+                name, include_task_io_directory=True, task_io_parent=instance.task_io_parent
+            )
+            assert dirs.task_io
+            (dirs.task_io.on_pilot / "infile").write_text(name)
+            instance.check_bind_mounts(dirs.assemble_bind_mounts())
+            await go.wait()  # both are running
+            return dirs, instance
+
+    go = asyncio.Event()
+    runs = [asyncio.create_task(task(n, go)) for n in ["a", "b"]]
+    await asyncio.sleep(0.1)
+    go.set()
+    (dirs_a, instance_a), (dirs_b, instance_b) = await asyncio.gather(*runs)
+
+    assert instance_a is not instance_b
+    assert len(task_runner.instances) == 2
+    # neither instance has the other run's task-io dir mounted
+    for dirs, other in [(dirs_a, instance_b), (dirs_b, instance_a)]:
+        assert dirs.task_io
+        assert not any(
+            dirs.task_io.on_pilot.is_relative_to(m.on_pilot)
+            for m in other.bind_mounts
+        )
+        with pytest.raises(ContainerSetupError):
+            other.check_bind_mounts(dirs.assemble_bind_mounts())
+
+    # an idle instance is reused
+    async with task_runner.acquire_instance() as instance:
+        assert instance in (instance_a, instance_b)
+    assert len(task_runner.instances) == 2
+
+    await task_runner.stop_instances()
+    assert not task_runner.instances
+
+
+async def test_100__detach_task_io(task_runner: ContainerRunner) -> None:
+    """Test that a kept task-io dir is moved out of the instance's mounted dir."""
+    await task_runner.start_instance()
+    async with task_runner.acquire_instance() as instance:
+        assert instance
+        dirs = DirectoryCatalog(
+            "a", include_task_io_directory=True, task_io_parent=instance.task_io_parent
+        )
+        assert dirs.task_io
+        (dirs.task_io.on_pilot / "outfile").write_text("out")
+        dirs.detach_task_io()
+        assert not list(instance.task_io_parent.on_pilot.iterdir())
+        assert (runner.PILOT_DATA_DIR / "a" / "task-io" / "outfile").read_text() == "out"
+    await task_runner.stop_instances()
+
+
+async def test_200__not_instance_mode(task_runner: ContainerRunner) -> None:
+    """Test."""
+    async with task_runner.acquire_instance() as instance:
+        assert instance is None
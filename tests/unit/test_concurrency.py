@@ -0,0 +1,133 @@
+"""Test the adaptive concurrency controller."""
+
+import dataclasses as dc
+
+import pytest
+
+from ewms_pilot.utils import concurrency
+from ewms_pilot.utils.concurrency import (
+    ConcurrencyController,
+    LoadSample,
+    sample_load,
+)
+
+
+def test_000__sample_load() -> None:
+    """Test that this machine can be sampled."""
+    for use_cgroup in [True, False]:
+        sample = sample_load(3, use_cgroup)
+        assert sample.n_done == 3
+        assert sample.memory_headroom is None or 0 <= sample.memory_headroom <= 1
+
+
+class FakeLoad:
+    """Feeds the controller made-up samples, one per update."""
+
+    def __init__(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        self.sample = LoadSample(
+            time=0.0,
+            n_done=0,
+            cpu_usec=0.0,
+            memory_headroom=0.5,
+            cpu_pressure=0.0,
+            memory_pressure=0.0,
+            io_pressure=0.0,
+        )
+        monkeypatch.setattr(concurrency, "sample_load", self._sample_load)
+
+    def _sample_load(self, n_done: int, use_cgroup: bool = True) -> LoadSample:
+        return self.sample
+
+    def next(self, tasks_per_sec: float, utilization: float, **kwargs: float) -> None:
+        """Move ahead 10 secs."""
+        self.sample = dc.replace(
+            self.sample,
+            time=self.sample.time + 10,
+            n_done=self.sample.n_done + int(tasks_per_sec * 10),
+            cpu_usec=self.sample.cpu_usec + utilization * 10 * 4 * 1e6,  # type: ignore[operator]
+            **kwargs,
+        )
+
+
+@pytest.fixture
+def controller(monkeypatch: pytest.MonkeyPatch) -> ConcurrencyController:
+    """Get a controller with 4 cpus, up to 8 tasks, that updates every time."""
+    monkeypatch.setattr(ConcurrencyController, "INTERVAL", 0.0)
+    ctrl = ConcurrencyController(8)
+    ctrl.n_cpus = ctrl.limit = 4
+    return ctrl
+
+
+def _update(controller: ConcurrencyController) -> int | None:
+    """Update and get the new limit, if it changed."""
+    change = controller.update(0)
+    return change[0] if change else None
+
+
+def test_100__aimd(
+    controller: ConcurrencyController,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test raising, backing off, and the upper bound."""
+    load = FakeLoad(monkeypatch)
+    assert _update(controller) is None  # first sample
+
+    # held back + idle cpus -> raise
+    load.next(tasks_per_sec=1, utilization=0.5)
+    controller.note_running(4)
+    assert _update(controller) == 5
+
+    # not held back -> keep
+    load.next(tasks_per_sec=1.2, utilization=0.5)
+    assert _update(controller) is None
+
+    # saturated cpus -> keep
+    load.next(tasks_per_sec=1.2, utilization=0.95)
+    controller.note_running(5)
+    assert _update(controller) is None
+
+    # running out of memory -> halve
+    load.next(tasks_per_sec=1.2, utilization=0.5, memory_headroom=0.05)
+    assert _update(controller) == 2
+
+    # ...up to the upper bound
+    for _ in range(10):
+        load.next(tasks_per_sec=1.2, utilization=0.5, memory_headroom=0.5)
+        controller.note_running(controller.limit)
+        _update(controller)
+    assert controller.limit == 8
+
+
+def test_200__throughput_drop(
+    controller: ConcurrencyController,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test that a raise that lowers the throughput is undone."""
+    load = FakeLoad(monkeypatch)
+    _update(controller)
+
+    load.next(tasks_per_sec=2, utilization=0.5)
+    controller.note_running(4)
+    assert _update(controller) == 5
+
+    load.next(tasks_per_sec=1, utilization=0.5)
+    controller.note_running(5)
+    assert _update(controller) == 4
+
+
+def test_300__pressure(
+    controller: ConcurrencyController,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test that cpu/io saturation lowers the limit."""
+    load = FakeLoad(monkeypatch)
+    _update(controller)
+
+    load.next(tasks_per_sec=1, utilization=0.5, io_pressure=80.0)
+    assert _update(controller) == 3
+    load.next(tasks_per_sec=1, utilization=0.5, io_pressure=0.0, cpu_pressure=80.0)
+    assert _update(controller) == 2
+    load.next(tasks_per_sec=1, utilization=0.5, memory_pressure=50.0)
+    assert _update(controller) == 1
+    load.next(tasks_per_sec=1, utilization=0.5, memory_pressure=50.0)
+    assert _update(controller) is None  # never below 1
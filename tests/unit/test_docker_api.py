@@ -0,0 +1,91 @@
+"""Test the Docker Engine API client."""
+
+import asyncio
+import io
+import json
+from pathlib import Path
+
+import pytest
+
+from ewms_pilot.utils.docker_api import (
+    DockerAPIError,
+    DockerEngineClient,
+    split_image_tag,
+)
+
+
+@pytest.mark.parametrize(
+    "image,expected",
+    [
+        ("foo", ("foo", "latest")),
+        ("foo:1.0", ("foo", "1.0")),
+        ("ghcr.io/org/foo:1.0", ("ghcr.io/org/foo", "1.0")),
+        ("localhost:5000/foo", ("localhost:5000/foo", "latest")),
+        ("foo@sha256:abc", ("foo", "sha256:abc")),
+    ],
+)
+def test_000__split_image_tag(image: str, expected: tuple[str, str]) -> None:
+    """Test."""
+    assert split_image_tag(image) == expected
+
+
+def _frame(stream_type: int, payload: bytes) -> bytes:
+    return bytes([stream_type, 0, 0, 0]) + len(payload).to_bytes(4, "big") + payload
+
+
+async def test_100__requests(tmp_path: Path) -> None:
+    """Test requests over one pooled connection, including chunked log streams."""
+    n_connections = 0
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        nonlocal n_connections
+        n_connections += 1
+        while line := await reader.readline():
+            method, path, _ = line.decode().split()
+            length = 0
+            while (header := await reader.readline()) != b"\r\n":
+                if header.lower().startswith(b"content-length:"):
+                    length = int(header.split(b":")[1])
+            await reader.readexactly(length)
+
+            if path.endswith("/containers/create"):
+                body = json.dumps({"Id": "abc", "Warnings": None}).encode()
+                writer.write(b"HTTP/1.1 201 Created\r\n")
+                writer.write(b"Content-Length: %d\r\n\r\n" % len(body) + body)
+            elif path.endswith("/logs?follow=1&stdout=1&stderr=1"):
+                frames = _frame(1, b"hello ") + _frame(2, b"oops") + _frame(1, b"world")
+                writer.write(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n")
+                for i in range(0, len(frames), 5):  # split frames across chunks
+                    chunk = frames[i : i + 5]
+                    writer.write(b"%x\r\n" % len(chunk) + chunk + b"\r\n")
+                writer.write(b"0\r\n\r\n")
+            elif path.endswith("/wait"):
+                body = b'{"StatusCode": 3}'
+                writer.write(b"HTTP/1.1 200 OK\r\n")
+                writer.write(b"Content-Length: %d\r\n\r\n" % len(body) + body)
+            elif method == "DELETE":
+                body = b'{"message": "no such container"}'
+                writer.write(b"HTTP/1.1 404 Not Found\r\n")
+                writer.write(b"Content-Length: %d\r\n\r\n" % len(body) + body)
+            else:
+                writer.write(b"HTTP/1.1 204 No Content\r\n\r\n")
+            await writer.drain()
+
+    sock = str(tmp_path / "docker.sock")
+    server = await asyncio.start_unix_server(handle, sock)
+    client = DockerEngineClient(sock)
+
+    cid = await client.create_container({"Image": "foo"})
+    assert cid == "abc"
+    await client.start_container(cid)
+    stdout, stderr = io.BytesIO(), io.BytesIO()
+    await client.stream_logs(cid, stdout, stderr)
+    assert stdout.getvalue() == b"hello world"
+    assert stderr.getvalue() == b"oops"
+    assert await client.wait_container(cid) == 3
+    with pytest.raises(DockerAPIError, match="no such container"):
+        await client.remove_container(cid)
+
+    await client.close()
+    server.close()
+    assert n_connections == 1
@@ -0,0 +1,166 @@
+"""Test handling finished tasks: sending their outputs & acking/nacking their messages."""
+
+import asyncio
+import time
+from typing import Any
+
+from mqclient.broker_client_interface import Message
+
+from ewms_pilot.tasks.io import NoTaskResponseException
+from ewms_pilot.tasks.map import TaskLedger, TaskMapping
+from ewms_pilot.tasks.publish import OutputPublisher
+from ewms_pilot.tasks.wait_on_tasks import handle_finished_tasks, mark_finished_tasks
+
+
+class FakePub:
+    """Records what's sent--every send waits until all the expected sends have started."""
+
+    def __init__(self, events: list[tuple[str, Any]], n_concurrent: int) -> None:
+        self.events = events
+        self.n_concurrent = n_concurrent
+        self.n_started = 0
+        self.all_started = asyncio.Event()
+
+    async def send(self, data: Any) -> None:
+        self.n_started += 1
+        if self.n_started == self.n_concurrent:
+            self.all_started.set()
+        await asyncio.wait_for(self.all_started.wait(), timeout=1)  # else, not concurrent
+        if data == "unsendable":
+            raise ConnectionError("can't send")
+        self.events.append(("send", data))
+
+
+class FakeSub:
+    """Records what's acked/nacked."""
+
+    def __init__(self, events: list[tuple[str, Any]]) -> None:
+        self.events = events
+
+    async def ack(self, msg: Message) -> None:
+        self.events.append(("ack", msg.data))
+
+    async def nack(self, msg: Message) -> None:
+        self.events.append(("nack", msg.data))
+
+
+async def _run(result: Any) -> Any:
+    if isinstance(result, BaseException):
+        raise result
+    return result
+
+
+async def test_000__batch() -> None:
+    """Test that the outputs are sent concurrently, each before its message's ack."""
+    results = {
+        "a": "out-a",
+        "b": "out-b",
+        "c": "unsendable",
+        "d": NoTaskResponseException(),
+        "e": ValueError("task failed"),
+    }
+    ledger = TaskLedger()
+    for data, result in results.items():
+        ledger.add(
+            TaskMapping(
+                message=Message(data, Message.serialize(data)),
+                asyncio_task=asyncio.create_task(_run(result)),
+                start_time=time.time(),
+            )
+        )
+    newly_done, _ = await asyncio.wait(ledger.pending_asyncio_tasks)
+
+    events: list[tuple[str, Any]] = []
+    await handle_finished_tasks(
+        FakeSub(events),  # type: ignore[arg-type]
+        FakePub(events, n_concurrent=3),  # type: ignore[arg-type]
+        ledger,
+        mark_finished_tasks(ledger, newly_done),
+    )
+
+    assert sorted(events) == sorted(
+        [
+            ("send", "out-a"),
+            ("send", "out-b"),
+            ("ack", "a"),
+            ("ack", "b"),
+            ("nack", "c"),  # its output couldn't be sent
+            ("ack", "d"),  # no output is ok
+            ("nack", "e"),
+        ]
+    )
+    # all the sends come before any ack/nack
+    assert {e for e, _ in events[:2]} == {"send"}
+
+    assert ledger.n_done == 5
+    assert ledger.n_failed == 2
+
+
+class SlowPub:
+    """Records what's sent, once it's allowed to send."""
+
+    def __init__(self, events: list[tuple[str, Any]]) -> None:
+        self.events = events
+        self.can_send = asyncio.Event()
+
+    async def send(self, data: Any) -> None:
+        await self.can_send.wait()
+        self.events.append(("send", data))
+
+
+class FakeHousekeeper:
+    """Records the publisher's metrics."""
+
+    def __init__(self) -> None:
+        self.queue_depths: list[int] = []
+
+    async def new_messages_done(self, *args: Any) -> None:
+        pass
+
+    async def outputs_published(self, queue_depth: int, send_latency: Any) -> None:
+        self.queue_depths.append(queue_depth)
+
+
+async def test_100__publisher() -> None:
+    """Test that finished tasks are handed over without waiting on the broker."""
+    ledger = TaskLedger()
+    for data in ["a", "b"]:
+        ledger.add(
+            TaskMapping(
+                message=Message(data, Message.serialize(data)),
+                asyncio_task=asyncio.create_task(_run(f"out-{data}")),
+                start_time=time.time(),
+            )
+        )
+    newly_done, _ = await asyncio.wait(ledger.pending_asyncio_tasks)
+
+    events: list[tuple[str, Any]] = []
+    pub = SlowPub(events)
+    housekeeper = FakeHousekeeper()
+    publisher = OutputPublisher(
+        FakeSub(events),  # type: ignore[arg-type]
+        pub,  # type: ignore[arg-type]
+        ledger,
+        queue_size=2,
+        housekeeper=housekeeper,  # type: ignore[arg-type]
+    )
+    publisher_task = publisher.start()
+
+    # the broker is stalled, but handing over doesn't wait on it
+    await asyncio.wait_for(
+        publisher.put(mark_finished_tasks(ledger, newly_done)), timeout=1
+    )
+    await asyncio.sleep(0.1)
+    assert not events
+    assert ledger.n_pending == 0
+
+    # stopping waits for the queue to be flushed
+    pub.can_send.set()
+    await publisher.stop()
+    assert sorted(events) == sorted(
+        [("send", "out-a"), ("send", "out-b"), ("ack", "a"), ("ack", "b")]
+    )
+    assert publisher_task.done()
+    assert publisher.send_latency.count == 2
+    assert publisher.send_latency.min >= 0.1  # stalled
+    assert housekeeper.queue_depths == [0]
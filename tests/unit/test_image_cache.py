@@ -0,0 +1,85 @@
+"""Test the node-local Apptainer image cache."""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from ewms_pilot.utils.image_cache import ApptainerImageCache, image_key
+
+
+def _builder(builds: list[Path], size: int = 1000):
+    def build(dest: Path) -> None:
+        builds.append(dest)
+        time.sleep(0.1)
+        dest.mkdir()
+        (dest / "file").write_bytes(b"0" * size)
+
+    return build
+
+
+def test_000__image_key(tmp_path: Path) -> None:
+    """Test."""
+    sif = tmp_path / "foo.sif"
+    sif.write_bytes(b"abc")
+    assert image_key(str(sif)) == image_key(str(sif))
+    assert image_key(str(sif)) != image_key("docker://foo:1.0")
+    assert image_key("docker://foo@sha256:abc123") == "abc123"
+
+
+def test_100__build_once(tmp_path: Path) -> None:
+    """Test that concurrent checkouts share one build."""
+    cache = ApptainerImageCache(tmp_path, 0)
+    builds: list[Path] = []
+
+    with ThreadPoolExecutor(4) as pool:
+        leases = list(
+            pool.map(
+                lambda _: cache.checkout("docker://foo:1.0", _builder(builds)),
+                range(4),
+            )
+        )
+
+    assert len(builds) == 1
+    assert len({lease.path for lease in leases}) == 1
+    assert (leases[0].path / "file").exists()
+    for lease in leases:
+        lease.release()
+
+
+def test_200__failed_build(tmp_path: Path) -> None:
+    """Test that a failed build leaves nothing to be used."""
+    cache = ApptainerImageCache(tmp_path, 0)
+
+    def bad_build(dest: Path) -> None:
+        dest.mkdir()
+        raise RuntimeError("build failed")
+
+    with pytest.raises(RuntimeError):
+        cache.checkout("docker://foo:1.0", bad_build)
+    assert not [p for p in tmp_path.iterdir() if p.suffix != ".lock"]
+
+    # try again
+    builds: list[Path] = []
+    cache.checkout("docker://foo:1.0", _builder(builds)).release()
+    assert len(builds) == 1
+
+
+def test_300__lru_eviction(tmp_path: Path) -> None:
+    """Test that the least-recently-used, unused images are evicted."""
+    cache = ApptainerImageCache(tmp_path, 2500)
+    builds: list[Path] = []
+
+    in_use = cache.checkout("docker://in-use", _builder(builds))
+    for name in ["a", "b", "c"]:
+        cache.checkout(f"docker://{name}", _builder(builds)).release()
+        time.sleep(0.01)  # distinct mtimes
+
+    remaining = {p.name for p in tmp_path.iterdir() if p.suffix == ".complete"}
+    assert remaining == {
+        f"{image_key('docker://in-use')}.complete",
+        f"{image_key('docker://c')}.complete",
+    }
+    assert in_use.path.exists()
+    in_use.release()
@@ -0,0 +1,65 @@
+"""Test the JSON codecs."""
+
+import json
+import mmap
+from pathlib import Path
+
+import pytest
+
+from ewms_pilot.utils.json_codec import CODECS, get_codec
+
+
+def _installed() -> list[str]:
+    names = []
+    for name in CODECS:
+        try:
+            get_codec(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+PAYLOADS = [
+    {"attr-0": "item0"},  # like the integration tests'
+    [[1.5, 2, -3e-10] for _ in range(100)],
+    {"nested": {"list": [None, True, False, "ü"]}, "int": 2**40},
+    "just a string",
+]
+
+
+@pytest.mark.parametrize("name", _installed())
+@pytest.mark.parametrize("payload", PAYLOADS)
+def test_000__round_trip(name: str, payload: object, tmp_path: Path) -> None:
+    """Test that any codec's output is read the same by all."""
+    codec = get_codec(name)
+    data = codec.dumps(payload)
+    assert json.loads(data) == payload
+
+    # from a map, too
+    fpath = tmp_path / "f.json"
+    fpath.write_bytes(data)
+    with open(fpath, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        assert codec.loads(m) == payload
+
+
+@pytest.mark.parametrize("name", _installed())
+def test_100__fallback(name: str) -> None:
+    """Test that values a fast codec can't handle still work, like stdlib."""
+    codec = get_codec(name)
+    big = {"big": 2**100, "3": "int key as str"}
+    assert codec.loads(codec.dumps(big)) == big
+    assert codec.loads(b'{"big": 1267650600228229401496703205376}') == {"big": 2**100}
+
+    with pytest.raises(TypeError):
+        codec.dumps({"not json": object()})
+    with pytest.raises(ValueError):
+        codec.loads(b"{not json")
+
+
+def test_200__get_codec() -> None:
+    """Test that 'auto' is 'stdlib'--a faster codec is only used if chosen."""
+    assert get_codec().name == get_codec("auto").name == "stdlib"
+    assert get_codec().dumps([float("nan"), float("inf")]) == b"[NaN, Infinity]"
+    with pytest.raises(ValueError):
+        get_codec("nope")
@@ -0,0 +1,114 @@
+"""Test the container lifecycle helpers."""
+
+import asyncio
+import dataclasses as dc
+import fcntl
+import json
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from ewms_pilot.utils import lifecycle
+from ewms_pilot.utils.lifecycle import (
+    ContainerLifecycleManager,
+    _stop_process_group,
+    current_owner,
+    owner_is_alive,
+)
+
+
+@pytest.fixture(autouse=True)
+def lease_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Use a fresh lease dir (and lease)."""
+    monkeypatch.setattr(lifecycle, "_lease_dir", lambda: tmp_path / "leases")
+    monkeypatch.setattr(lifecycle, "_lease", None)
+    return tmp_path / "leases"
+
+
+def test_000__owner_is_alive(lease_dir: Path) -> None:
+    """Test."""
+    owner = current_owner()
+    assert owner_is_alive(owner)
+    assert current_owner() == owner
+    dir_id, _ = owner.split(":")
+
+    # a pilot that died (its lease is no longer locked), or its lease was cleared out
+    (lease_dir / f"deadbeef{lifecycle.LEASE_SUFFIX}").touch()
+    assert not owner_is_alive(f"{dir_id}:deadbeef")
+    assert not owner_is_alive(f"{dir_id}:cafe")
+
+    # a pilot in another pid namespace or container (ex: another apptainer job,
+    # or a pilot in another docker container on this node) -- it's not our pid/host
+    fd = os.open(lease_dir / f"cafe{lifecycle.LEASE_SUFFIX}", os.O_RDWR | os.O_CREAT)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    assert owner_is_alive(f"{dir_id}:cafe")
+    os.close(fd)
+    assert not owner_is_alive(f"{dir_id}:cafe")
+
+    # a pilot elsewhere (another lease dir), or unknown -- can't tell, so assume alive
+    assert owner_is_alive("1-1:deadbeef")
+    assert owner_is_alive(f"{dir_id}:../deadbeef")
+    assert owner_is_alive(f"some-host:{dir_id}:deadbeef")
+    assert owner_is_alive(str(os.getpid()))
+    assert owner_is_alive("")
+
+
+def test_010__dead_leases_cleared(lease_dir: Path) -> None:
+    """Test that a new pilot clears out the leases of dead pilots--not live ones."""
+    lease_dir.mkdir()
+    (lease_dir / f"dead{lifecycle.LEASE_SUFFIX}").touch()
+    fd = os.open(lease_dir / f"alive{lifecycle.LEASE_SUFFIX}", os.O_RDWR | os.O_CREAT)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+
+    owner = current_owner()
+    leases = sorted(p.name for p in lease_dir.iterdir())
+    assert leases == sorted(
+        [f"alive{lifecycle.LEASE_SUFFIX}", f"{owner.split(':')[-1]}{lifecycle.LEASE_SUFFIX}"]
+    )
+    os.close(fd)
+
+
+def test_020__one_lease_per_process(lease_dir: Path) -> None:
+    """Test that every container manager in a pilot shares the one lease."""
+    managers = [ContainerLifecycleManager() for _ in range(3)]
+    assert len({m.owner for m in managers}) == 1
+    assert len(list(lease_dir.iterdir())) == 1
+
+
+async def test_030__save_state(
+    lease_dir: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test that the running apptainer instances are recorded, then cleared."""
+    monkeypatch.setattr(
+        lifecycle,
+        "ENV",
+        dc.replace(
+            lifecycle.ENV,
+            _EWMS_PILOT_CONTAINER_PLATFORM="apptainer",
+            _EWMS_PILOT_APPTAINER_BUILD_WORKDIR=str(tmp_path),
+        ),
+    )
+    manager = ContainerLifecycleManager()
+    await asyncio.gather(*(manager.track_instance(n) for n in ["b", "a"]))
+    state = json.loads(manager._state_file.read_text())
+    assert state["owner"] == manager.owner
+    assert state["instances"] == ["a", "b"]
+
+    await asyncio.gather(*(manager.forget_instance(n) for n in ["a", "b"]))
+    assert not manager._state_file.exists()
+
+
+async def test_100__stop_process_group() -> None:
+    """Test that a process that ignores SIGTERM (and its children) gets killed."""
+    proc = await asyncio.create_subprocess_shell(
+        "trap '' TERM; sleep 100 & sleep 100; wait",
+        start_new_session=True,
+    )
+    await asyncio.sleep(0.2)  # let it set up its trap
+
+    start = time.time()
+    await _stop_process_group(proc, grace=0.5)
+    assert 0.5 <= time.time() - start < 5
+    assert proc.returncode == -9
@@ -0,0 +1,87 @@
+"""Test the listener loop's helpers."""
+
+import asyncio
+import time
+
+import pytest
+from mqclient.broker_client_interface import Message
+
+from ewms_pilot import pilot
+from ewms_pilot.tasks.map import TaskLedger, TaskMapping
+
+
+class FakeController:
+    """Like `ConcurrencyController`."""
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.n_running: int | None = None
+
+    def note_running(self, n_running: int) -> None:
+        self.n_running = n_running
+
+
+async def _ledger(n_pending: int) -> TaskLedger:
+    ledger = TaskLedger()
+    for _ in range(n_pending):
+        ledger.add(
+            TaskMapping(
+                message=Message("id", Message.serialize("x")),
+                asyncio_task=asyncio.create_task(asyncio.sleep(10)),
+                start_time=time.time(),
+            )
+        )
+    return ledger
+
+
+@pytest.mark.parametrize("n_pending,expected", [(0, True), (1, True), (2, False)])
+async def test_000__room_for_task(n_pending: int, expected: bool) -> None:
+    """Test."""
+    ledger = await _ledger(n_pending)
+    assert pilot._has_room_for_task(ledger, set(), 1, 2, None) is expected
+    for t in ledger.pending_asyncio_tasks:
+        t.cancel()
+
+
+async def test_010__room_for_task_controller() -> None:
+    """Test that the concurrency controller's limit is used instead."""
+    ledger = await _ledger(2)
+    controller = FakeController(3)
+    assert pilot._has_room_for_task(ledger, set(), 1, 2, controller)  # type: ignore[arg-type]
+    assert controller.n_running == 2
+    controller.limit = 2
+    assert not pilot._has_room_for_task(ledger, set(), 1, 2, controller)  # type: ignore[arg-type]
+    for t in ledger.pending_asyncio_tasks:
+        t.cancel()
+
+
+async def test_020__room_for_batch() -> None:
+    """Test that batches (not messages) are counted--and finished ones are dropped."""
+    ledger = await _ledger(5)  # the batches' messages
+    running = asyncio.create_task(asyncio.sleep(10))
+    finished = asyncio.create_task(asyncio.sleep(0))
+    await finished
+    batches = {running, finished}
+
+    assert pilot._has_room_for_task(ledger, batches, 5, 2, None)
+    assert batches == {running}
+    batches.add(asyncio.create_task(asyncio.sleep(10)))
+    assert not pilot._has_room_for_task(ledger, batches, 5, 2, None)
+    for t in ledger.pending_asyncio_tasks | batches:
+        t.cancel()
+
+
+async def _fail() -> None:
+    raise ValueError("prefetcher failed")
+
+
+async def test_100__raise_background_error() -> None:
+    """Test that only a finished background task's error is raised."""
+    running = asyncio.create_task(asyncio.sleep(10))
+    failed = asyncio.create_task(_fail())
+    done, _ = await asyncio.wait({running, failed}, return_when=asyncio.FIRST_COMPLETED)
+
+    pilot._raise_background_error(done, running)  # not done -> nothing
+    with pytest.raises(ValueError, match="prefetcher failed"):
+        pilot._raise_background_error(done, running, failed)
+    running.cancel()
@@ -0,0 +1,39 @@
+"""Test running blocking work off of the event loop."""
+
+import asyncio
+import threading
+import time
+
+from ewms_pilot.utils.offload import EventLoopLagMonitor, run_blocking
+
+
+async def test_000__run_blocking() -> None:
+    """Test that the work runs in another thread, while the loop keeps going."""
+    ticks = 0
+
+    async def tick() -> None:
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    ticker = asyncio.create_task(tick())
+    thread_name = await run_blocking(
+        lambda secs: time.sleep(secs) or threading.current_thread().name,  # type: ignore[func-returns-value]
+        0.3,
+    )
+    ticker.cancel()
+
+    assert thread_name != threading.current_thread().name
+    assert ticks >= 10
+
+
+async def test_100__event_loop_lag_monitor() -> None:
+    """Test that a block is measured."""
+    async with EventLoopLagMonitor() as monitor:
+        await asyncio.sleep(0.25)
+        time.sleep(0.3)  # block!
+        await asyncio.sleep(0.25)
+
+    assert monitor.stats.count >= 2
+    assert 0.2 < monitor.stats.max < 1
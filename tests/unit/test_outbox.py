@@ -0,0 +1,200 @@
+"""Test the on-disk outbox for output-events that couldn't be sent."""
+
+import asyncio
+import time
+from pathlib import Path
+from typing import Any
+
+import pytest
+from mqclient.broker_client_interface import Message
+
+from ewms_pilot.tasks import outbox as outbox_module
+from ewms_pilot.tasks.map import TaskLedger, TaskMapping
+from ewms_pilot.tasks.outbox import Outbox
+from ewms_pilot.tasks.wait_on_tasks import (
+    abandon_outbox,
+    handle_finished_tasks,
+    mark_finished_tasks,
+    retry_outbox,
+)
+
+
+class FakeBrokerPub:
+    """A broker client's pub--it can be taken down."""
+
+    def __init__(self) -> None:
+        self.is_down = False
+        self.sent: list[Any] = []
+
+    async def send_message(self, msg_bytes: bytes, **kwargs: Any) -> None:
+        if self.is_down:
+            raise ConnectionError("broker is down")
+        self.sent.append(Message("id", msg_bytes).data)
+
+
+class FakePub:
+    """Like `QueuePubResource`."""
+
+    def __init__(self) -> None:
+        self.pub = FakeBrokerPub()
+        self.retries = 0
+        self.retry_delay = 0
+
+    async def send(self, data: Any) -> None:
+        await self.pub.send_message(Message.serialize(data))
+
+
+class FakeSub:
+    """Records what's acked/nacked."""
+
+    def __init__(self) -> None:
+        self.events: list[tuple[str, Any]] = []
+
+    async def ack(self, msg: Message) -> None:
+        self.events.append(("ack", msg.data))
+
+    async def nack(self, msg: Message) -> None:
+        self.events.append(("nack", msg.data))
+
+
+async def _output(data: str) -> str:
+    return f"out-{data}"
+
+
+async def _finished_tasks(ledger: TaskLedger, *datas: str) -> list[TaskMapping]:
+    for data in datas:
+        ledger.add(
+            TaskMapping(
+                message=Message(data, Message.serialize(data)),
+                asyncio_task=asyncio.create_task(_output(data)),
+                start_time=time.time(),
+            )
+        )
+    newly_done, _ = await asyncio.wait(ledger.pending_asyncio_tasks)
+    return mark_finished_tasks(ledger, newly_done)
+
+
+async def test_000__persisted(tmp_path: Path) -> None:
+    """Test that entries are kept on disk until they're removed."""
+    outbox = Outbox(tmp_path / "outbox.sqlite")
+    entry = await outbox.add(b"abc", None)
+    await outbox.add(b"def", None)
+    await outbox.remove(entry)
+    assert [e.msg_bytes for e in outbox.pending] == [b"def"]
+
+    # a new pilot doesn't take over a live pilot's entries...
+    assert await Outbox(tmp_path / "outbox.sqlite").adopt_leftovers() == 0
+
+
+async def test_010__adopt_leftovers(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test that a dead pilot's entries are taken over (once)."""
+    dead = Outbox(tmp_path / "outbox.sqlite")
+    dead.owner = "some-host:1234:5678"
+    await dead.add(b"abc", None)
+    await dead.add(b"def", None)
+    monkeypatch.setattr(outbox_module, "owner_is_alive", lambda o: o != dead.owner)
+
+    outbox = Outbox(tmp_path / "outbox.sqlite")
+    assert await outbox.adopt_leftovers() == 2
+    assert [e.msg_bytes for e in outbox.pending] == [b"abc", b"def"]
+    assert all(e.tmap is None for e in outbox.pending)
+    # already adopted
+    assert await outbox.adopt_leftovers() == 0
+    assert await Outbox(tmp_path / "outbox.sqlite").adopt_leftovers() == 0
+
+
+def test_020__backoff(tmp_path: Path) -> None:
+    """Test."""
+    entry = outbox_module.OutboxEntry(1, b"", None)
+    outbox = Outbox(tmp_path / "outbox.sqlite")
+    delays = []
+    for _ in range(10):
+        outbox.reschedule(entry)
+        delays.append(round(entry.next_attempt - time.time()))
+    assert delays == [1, 2, 4, 8, 16, 32, 60, 60, 60, 60]
+
+
+async def test_100__send_later(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that an unsent output-event is retried, then its message is acked."""
+    monkeypatch.setattr(Outbox, "RETRY_DELAY_MIN", 0.0)
+    outbox = Outbox(tmp_path / "outbox.sqlite")
+    pub, sub, ledger = FakePub(), FakeSub(), TaskLedger()
+
+    pub.pub.is_down = True
+    await handle_finished_tasks(
+        sub,  # type: ignore[arg-type]
+        pub,  # type: ignore[arg-type]
+        ledger,
+        await _finished_tasks(ledger, "a"),
+        outbox=outbox,
+    )
+    assert not sub.events  # not acked, not nacked
+    assert ledger.n_failed == 0
+    assert len(outbox.pending) == 1
+
+    await retry_outbox(sub, pub, ledger, outbox)  # type: ignore[arg-type]
+    assert not sub.events
+    assert outbox.pending[0].n_attempts == 2
+
+    pub.pub.is_down = False
+    await retry_outbox(sub, pub, ledger, outbox)  # type: ignore[arg-type]
+    assert pub.pub.sent == ["out-a"]
+    assert sub.events == [("ack", "a")]
+    assert not outbox.pending
+    assert await Outbox(tmp_path / "outbox.sqlite").adopt_leftovers() == 0
+    assert ledger.n_successful == 1
+
+
+async def test_105__no_message_compares(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test that handling finished tasks doesn't compare (so, decode) their messages."""
+
+    def _eq(*args: Any) -> bool:
+        raise AssertionError("a message was compared")
+
+    monkeypatch.setattr(Message, "__eq__", _eq)
+    outbox = Outbox(tmp_path / "outbox.sqlite")
+    pub, sub, ledger = FakePub(), FakeSub(), TaskLedger()
+
+    pub.pub.is_down = True
+    await handle_finished_tasks(
+        sub,  # type: ignore[arg-type]
+        pub,  # type: ignore[arg-type]
+        ledger,
+        await _finished_tasks(ledger, "a", "b", "c"),
+        outbox=outbox,
+    )
+    assert len(outbox.pending) == 3
+
+
+async def test_110__abandon(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that an output-event that was never sent fails its task, but stays on disk."""
+    outbox = Outbox(tmp_path / "outbox.sqlite")
+    pub, sub, ledger = FakePub(), FakeSub(), TaskLedger()
+
+    pub.pub.is_down = True
+    await handle_finished_tasks(
+        sub,  # type: ignore[arg-type]
+        pub,  # type: ignore[arg-type]
+        ledger,
+        await _finished_tasks(ledger, "a"),
+        outbox=outbox,
+    )
+    await abandon_outbox(sub, ledger, outbox)  # type: ignore[arg-type]
+    assert sub.events == [("nack", "a")]
+    assert ledger.n_failed == 1
+    assert not outbox.pending
+
+    # the next pilot sends it
+    monkeypatch.setattr(outbox_module, "owner_is_alive", lambda o: False)
+    next_outbox = Outbox(tmp_path / "outbox.sqlite")
+    next_outbox.owner = "next-pilot"
+    assert await next_outbox.adopt_leftovers() == 1
+    pub.pub.is_down = False
+    next_outbox.pending[0].next_attempt = 0
+    await retry_outbox(sub, pub, ledger, next_outbox)  # type: ignore[arg-type]
+    assert pub.pub.sent == ["out-a"]
+    assert sub.events == [("nack", "a")]  # its message was already given back
@@ -0,0 +1,54 @@
+"""Test reading outfiles."""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from ewms_pilot.tasks.io import NoTaskResponseException, OutFileInterface
+
+
+@pytest.mark.parametrize("size", [10, 2 * OutFileInterface.MMAP_THRESHOLD])
+def test_000__text(tmp_path: Path, size: int) -> None:
+    """Test."""
+    fpath = tmp_path / "outfile.out"
+    text = ("héllo\n" * size)[:size]
+    fpath.write_text(text)
+    assert OutFileInterface.read(fpath) == text
+
+
+def test_010__text_newlines(tmp_path: Path) -> None:
+    """Test that newlines are translated, like in text mode."""
+    fpath = tmp_path / "outfile.out"
+    fpath.write_bytes(b"a\r\nb\rc\n")
+    assert OutFileInterface.read(fpath) == "a\nb\nc\n"
+
+
+@pytest.mark.parametrize("size", [10, 2 * OutFileInterface.MMAP_THRESHOLD])
+def test_100__bytes(tmp_path: Path, size: int) -> None:
+    """Test."""
+    fpath = tmp_path / "outfile.out"
+    data = (b"abc\xff\xfe\x00" * size)[:size]
+    fpath.write_bytes(data)
+    out = OutFileInterface.read(fpath)
+    assert isinstance(out, bytes)
+    assert out == data
+
+
+@pytest.mark.parametrize("size", [10, 2 * OutFileInterface.MMAP_THRESHOLD])
+def test_200__json(tmp_path: Path, size: int) -> None:
+    """Test."""
+    fpath = tmp_path / "outfile.json"
+    obj = {"a": [1, 2.5, "x" * size], "b": None}
+    fpath.write_text(json.dumps(obj))
+    assert OutFileInterface.read(fpath) == obj
+
+
+def test_300__empty_and_missing(tmp_path: Path) -> None:
+    """Test."""
+    fpath = tmp_path / "outfile.out"
+    fpath.write_bytes(b"")
+    assert OutFileInterface.read(fpath) == ""
+
+    with pytest.raises(NoTaskResponseException):
+        OutFileInterface.read(tmp_path / "nope.out")
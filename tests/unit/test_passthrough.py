@@ -0,0 +1,123 @@
+"""Test passing JSON between messages and task files, as-is."""
+
+import dataclasses as dc
+import json
+from pathlib import Path
+from typing import Any
+
+import pytest
+from mqclient.broker_client_interface import Message
+
+from ewms_pilot.config import ENV
+from ewms_pilot.tasks import io
+from ewms_pilot.tasks.io import (
+    InFileInterface,
+    InvalidDataFromOutfileException,
+    OutFileInterface,
+)
+from ewms_pilot.tasks.passthrough import RawJSON, extract_raw_data, serialize
+
+DATA = [
+    {"a": 1, "b": [1.5, None, True], "c": {"d": "héllo"}},
+    [1, 2, 3],
+    12345,
+    None,
+]
+
+
+@pytest.fixture
+def passthrough(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Turn on passthrough mode."""
+    monkeypatch.setattr(io, "ENV", dc.replace(ENV, EWMS_PILOT_JSON_PASSTHROUGH=True))
+
+
+@pytest.mark.parametrize("data", DATA)
+def test_000__serialize(data: Any) -> None:
+    """Test that the message is the same as mqclient's."""
+    msg = Message("id", serialize(RawJSON(json.dumps(data).encode()), {"x": "y"}))
+    assert msg.data == data
+    assert msg.headers == {"x": "y"}
+
+
+@pytest.mark.parametrize("data", DATA)
+def test_100__extract(data: Any) -> None:
+    """Test that the data is sliced out as-is."""
+    msg = Message("id", Message.serialize(data, headers={"x": {"y": "}, \"data\": "}}))
+    raw = extract_raw_data(msg)
+    assert raw is not None
+    assert bytes(raw) == json.dumps(data).encode()
+
+
+@pytest.mark.parametrize("payload", [b"not zstd", None])
+def test_110__extract_not_envelope(payload: bytes | None) -> None:
+    """Test that anything but mqclient's envelope is not sliced."""
+    import zstd  # type: ignore[import-not-found]
+
+    if payload is None:  # compressed, but not an envelope
+        payload = zstd.compress(b'{"data": 1, "headers": {}}')
+    assert extract_raw_data(Message("id", payload)) is None
+
+
+def test_120__extract_string() -> None:
+    """Test that a string is not sliced (it's written as plain text)."""
+    assert extract_raw_data(Message("id", Message.serialize("abc"))) is None
+
+
+@pytest.mark.parametrize("data", DATA)
+def test_130__round_trip(data: Any) -> None:
+    """Test slicing & splicing against mqclient's own (de)serializing.
+
+    If mqclient's envelope format changes, this fails.
+    """
+    headers = {"a": ', "data": ', "b": {"c": "}, \"data\": [1]"}, "d": "héllo"}
+    payload = Message.serialize(data, headers=headers)
+    raw = extract_raw_data(Message("id", payload))
+    assert raw is not None
+
+    out_payload = serialize(RawJSON(bytes(raw)), headers)
+    assert out_payload == payload
+    out_msg = Message("id", out_payload)
+    assert out_msg.data == data
+    assert out_msg.headers == headers
+
+
+@pytest.mark.usefixtures("passthrough")
+@pytest.mark.parametrize("data", DATA)
+def test_200__infile(tmp_path: Path, data: Any) -> None:
+    """Test."""
+    fpath = tmp_path / "infile.json"
+    InFileInterface.write(Message("id", Message.serialize(data)), fpath)
+    assert fpath.read_bytes() == json.dumps(data).encode()
+
+
+@pytest.mark.usefixtures("passthrough")
+def test_210__infile_string(tmp_path: Path) -> None:
+    """Test that a string is still written as plain text."""
+    fpath = tmp_path / "infile.json"
+    InFileInterface.write(Message("id", Message.serialize("abc")), fpath)
+    assert fpath.read_text() == "abc"
+
+
+@pytest.mark.usefixtures("passthrough")
+def test_300__outfile(tmp_path: Path) -> None:
+    """Test."""
+    fpath = tmp_path / "outfile.json"
+    fpath.write_bytes(b'{"a":  [1, 2]}\n')  # not decoded, so not reformatted
+    assert OutFileInterface.read(fpath) == RawJSON(b'{"a":  [1, 2]}\n')
+
+
+@pytest.mark.usefixtures("passthrough")
+def test_310__outfile_empty(tmp_path: Path) -> None:
+    """Test."""
+    fpath = tmp_path / "outfile.json"
+    fpath.write_bytes(b"")
+    with pytest.raises(InvalidDataFromOutfileException):
+        OutFileInterface.read(fpath)
+
+
+@pytest.mark.usefixtures("passthrough")
+def test_320__outfile_not_json_ext(tmp_path: Path) -> None:
+    """Test that other file extensions are read as usual."""
+    fpath = tmp_path / "outfile.out"
+    fpath.write_text("abc")
+    assert OutFileInterface.read(fpath) == "abc"
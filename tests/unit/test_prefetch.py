@@ -0,0 +1,137 @@
+"""Test receiving incoming messages ahead of time."""
+
+import asyncio
+import contextlib
+from typing import Any, AsyncIterator
+
+import mqclient as mq
+from mqclient.broker_client_interface import Message
+
+from ewms_pilot.pilot import _max_unsettled
+from ewms_pilot.tasks.prefetch import MessagePrefetcher
+from ewms_pilot.tasks.reconnect import ReconnectingSubResource
+
+
+class FakeBrokerSub:
+    """A broker client's sub -- it counts its receives."""
+
+    def __init__(self, incoming: list[Any]) -> None:
+        self.incoming = incoming
+        self.n_receives = 0
+
+    async def get_message(self, *args: Any, **kwargs: Any) -> Message | None:
+        self.n_receives += 1
+        await asyncio.sleep(0.01)  # a (short) timeout
+        if not self.incoming:
+            return None
+        data = self.incoming.pop(0)
+        return Message(data, Message.serialize(data))
+
+    async def close(self) -> None:
+        pass
+
+
+class FakeQueue:
+    """Like `mq.Queue`, but only what's needed by `ReconnectingSubResource`."""
+
+    def __init__(self, *incoming: Any) -> None:
+        self.retries = 0
+        self.retry_delay = 0
+        self.timeout = 1
+
+        self.broker_sub = FakeBrokerSub(list(incoming))
+        self.events: list[tuple[str, Any]] = []
+
+    @contextlib.asynccontextmanager
+    async def open_sub_manual_acking(
+        self,
+    ) -> AsyncIterator[mq.queue.ManualQueueSubResource]:
+        yield mq.queue.ManualQueueSubResource(self, self.broker_sub)  # type: ignore[arg-type]
+
+    async def _safe_ack(self, sub: FakeBrokerSub, msg: Message) -> None:
+        self.events.append(("ack", msg.data))
+
+    async def _safe_nack(self, sub: FakeBrokerSub, msg: Message) -> None:
+        self.events.append(("nack", msg.data))
+
+
+async def _prefetcher(
+    queue: FakeQueue, buffer_size: int, max_unsettled: int
+) -> MessagePrefetcher:
+    sub = ReconnectingSubResource(queue, 0)  # type: ignore[arg-type]
+    await sub.connect()
+    return MessagePrefetcher(sub, buffer_size, max_unsettled)
+
+
+async def test_000__no_receive_while_broker_cant_deliver() -> None:
+    """Test that there's no (blocking) receive while every message is unsettled."""
+    queue = FakeQueue("a", "b")
+    prefetcher = await _prefetcher(queue, 1, 1)
+    prefetcher.start()
+
+    msg = await prefetcher.buffer.get()  # -> the task starts
+    assert msg.data == "a"
+    n_receives = queue.broker_sub.n_receives
+    await asyncio.sleep(0.3)
+    assert queue.broker_sub.n_receives == n_receives == 1
+
+    await prefetcher.sub.ack(msg)  # -> the task finished
+    assert (await prefetcher.buffer.get()).data == "b"
+    await prefetcher.stop()
+
+
+async def test_005__concurrent_tasks() -> None:
+    """Test that more tasks than the prefetch can run at once (ex: RabbitMQ's default)."""
+    queue = FakeQueue("a", "b", "c", "d", "e")
+    prefetch, max_concurrent_tasks = 1, 3
+    prefetcher = await _prefetcher(
+        queue, prefetch, _max_unsettled(prefetch, max_concurrent_tasks)
+    )
+    prefetcher.start()
+
+    # start tasks -- none finish (so, nothing is acked)
+    running = [await asyncio.wait_for(prefetcher.buffer.get(), 1) for _ in range(3)]
+    assert [m.data for m in running] == ["a", "b", "c"]
+    await asyncio.sleep(0.3)
+    assert prefetcher.buffer.qsize() == 1  # 'd' is prefetched, 'e' is not
+    assert queue.broker_sub.n_receives == 4
+    await prefetcher.stop()
+
+
+async def test_010__buffer_full() -> None:
+    """Test that there's no receive while the buffer is full."""
+    queue = FakeQueue("a", "b", "c", "d")
+    prefetcher = await _prefetcher(queue, 2, 10)
+    prefetcher.start()
+
+    await asyncio.sleep(0.3)
+    assert prefetcher.buffer.qsize() == 2
+    assert queue.broker_sub.n_receives == 2
+    await prefetcher.stop()
+
+
+async def test_100__fill_batch() -> None:
+    """Test that a batch gets what's buffered, waiting up to `wait` for the rest."""
+    queue = FakeQueue("a", "b", "c")
+    prefetcher = await _prefetcher(queue, 5, 10)
+    prefetcher.start()
+
+    first = await prefetcher.buffer.get()
+    batch = await prefetcher.fill_batch(first, 5, 0.3)
+    assert [m.data for m in batch] == ["a", "b", "c"]
+    await prefetcher.stop()
+
+
+async def test_200__stop_nacks_unstarted() -> None:
+    """Test that buffered & handed-back messages are nacked when stopped."""
+    queue = FakeQueue("a", "b", "c")
+    prefetcher = await _prefetcher(queue, 2, 10)
+    prefetcher.start()
+
+    started = await prefetcher.buffer.get()
+    while not prefetcher.buffer.full():
+        await asyncio.sleep(0.01)
+    prefetcher.return_unstarted(await prefetcher.buffer.get())
+    await prefetcher.stop()
+    assert sorted(queue.events) == [("nack", "b"), ("nack", "c")]
+    assert started.data == "a"
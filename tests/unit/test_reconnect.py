@@ -0,0 +1,192 @@
+"""Test reconnecting to the broker without failing the pilot."""
+
+import asyncio
+import contextlib
+from typing import Any, AsyncIterator
+
+import mqclient as mq
+import pytest
+from mqclient.broker_client_interface import Message
+
+from ewms_pilot.tasks.prefetch import MessagePrefetcher
+from ewms_pilot.tasks.reconnect import (
+    Reconnector,
+    ReconnectingPubResource,
+    ReconnectingSubResource,
+)
+
+
+@pytest.fixture(autouse=True)
+def no_delay(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Don't wait between reconnect attempts."""
+    monkeypatch.setattr(Reconnector, "DELAY_MIN", 0.01)
+
+
+class FakeBrokerClient:
+    """A broker client's pub/sub -- its connection can be lost."""
+
+    def __init__(self, broker: "FakeBroker") -> None:
+        self.broker = broker
+        self.generation = broker.n_connects
+
+    def _check(self) -> None:
+        if self.broker.n_connects != self.generation or self.broker.is_down:
+            raise ConnectionError("connection lost")
+
+    async def send_message(self, msg_bytes: bytes, **kwargs: Any) -> None:
+        self._check()
+        self.broker.sent.append(Message("id", msg_bytes).data)
+
+    async def get_message(self, *args: Any, **kwargs: Any) -> Message | None:
+        self._check()
+        if not self.broker.incoming:
+            return None
+        data = self.broker.incoming.pop(0)
+        return Message(data, Message.serialize(data))
+
+    async def close(self) -> None:
+        pass
+
+
+class FakeBroker:
+    """Like `mq.Queue`, but only what's needed by the reconnecting resources."""
+
+    def __init__(self) -> None:
+        self.retries = 0
+        self.retry_delay = 0
+        self.timeout = 1
+
+        self.is_down = False
+        self.n_connects = 0
+        self.n_failed_connects = 0
+        self.sent: list[Any] = []
+        self.incoming: list[Any] = []
+        self.events: list[tuple[str, Any]] = []
+
+    def drop_connections(self) -> None:
+        """Make every open connection fail."""
+        self.n_connects += 1
+
+    async def _connect(self) -> FakeBrokerClient:
+        if self.is_down:
+            self.n_failed_connects += 1
+            if self.n_failed_connects >= 3:
+                self.is_down = False  # back up
+            raise ConnectionError("broker is down")
+        return FakeBrokerClient(self)
+
+    @contextlib.asynccontextmanager
+    async def open_pub(self) -> AsyncIterator[mq.queue.QueuePubResource]:
+        yield mq.queue.QueuePubResource(
+            await self._connect(),  # type: ignore[arg-type]
+            self.retries,
+            self.retry_delay,
+        )
+
+    @contextlib.asynccontextmanager
+    async def open_sub_manual_acking(
+        self,
+    ) -> AsyncIterator[mq.queue.ManualQueueSubResource]:
+        yield mq.queue.ManualQueueSubResource(
+            self,  # type: ignore[arg-type]
+            await self._connect(),  # type: ignore[arg-type]
+        )
+
+    async def _safe_ack(self, sub: FakeBrokerClient, msg: Message) -> None:
+        sub._check()
+        self.events.append(("ack", msg.data))
+
+    async def _safe_nack(self, sub: FakeBrokerClient, msg: Message) -> None:
+        sub._check()
+        self.events.append(("nack", msg.data))
+
+
+async def test_000__pub_reconnect() -> None:
+    """Test that a send that failed is sent after reconnecting."""
+    broker = FakeBroker()
+    pub = ReconnectingPubResource(broker, 60)  # type: ignore[arg-type]
+    await pub.connect()
+
+    await pub.send("a")
+    broker.drop_connections()
+    broker.is_down = True  # the 1st couple reconnect attempts fail
+    await pub.send("b")
+    await pub.send_bytes(Message.serialize("c"))
+    assert broker.sent == ["a", "b", "c"]
+    assert pub.reconnector.generation == 1
+    assert broker.n_failed_connects == 3
+
+
+async def test_010__no_reconnect() -> None:
+    """Test that the error is raised if reconnecting is off."""
+    broker = FakeBroker()
+    pub = ReconnectingPubResource(broker, 0)  # type: ignore[arg-type]
+    await pub.connect()
+
+    broker.drop_connections()
+    with pytest.raises(ConnectionError, match="connection lost"):
+        await pub.send("a")
+
+
+async def test_020__reconnect_timeout() -> None:
+    """Test that the original error is raised if the broker stays down."""
+    broker = FakeBroker()
+    pub = ReconnectingPubResource(broker, 0.02)  # type: ignore[arg-type]
+    await pub.connect()
+
+    broker.drop_connections()
+    broker.is_down = True
+    with pytest.raises(ConnectionError, match="connection lost"):
+        await pub.send("a")
+    assert pub.reconnector.generation == 0
+
+
+async def test_100__sub_stale_acks() -> None:
+    """Test that messages from a lost connection are not acked/nacked."""
+    broker = FakeBroker()
+    sub = ReconnectingSubResource(broker, 60)  # type: ignore[arg-type]
+    await sub.connect()
+
+    broker.incoming = ["a", "b"]
+    received = []
+    async for msg in sub.iter_messages():
+        received.append(msg)
+        if len(received) == 2:
+            broker.drop_connections()  # while the tasks are running
+            broker.incoming = ["a", "c"]  # the broker redelivers 'a'
+        if len(received) == 4:
+            break
+    assert [m.data for m in received] == ["a", "b", "a", "c"]
+
+    assert sub.n_unsettled == 2
+    for msg in received:
+        await sub.ack(msg)
+    assert broker.events == [("ack", "a"), ("ack", "c")]
+    assert not sub._generations
+    assert sub.n_unsettled == 0
+
+
+async def test_200__prefetcher_drops_stale() -> None:
+    """Test that prefetched messages are dropped when their connection is lost."""
+    broker = FakeBroker()
+    sub = ReconnectingSubResource(broker, 60)  # type: ignore[arg-type]
+    await sub.connect()
+    prefetcher = MessagePrefetcher(sub, 2, 10)
+
+    broker.incoming = ["a", "b", "c"]
+    task = prefetcher.start()
+    while not prefetcher.buffer.full():
+        await asyncio.sleep(0.01)
+    broker.drop_connections()
+    broker.incoming = ["a", "b", "c"]  # redelivered
+    await prefetcher.buffer.get()  # makes room -- the prefetcher runs into the lost connection
+    while sub.reconnector.generation == 0:
+        await asyncio.sleep(0.01)
+
+    msgs = [await prefetcher.buffer.get(), await prefetcher.buffer.get()]
+    assert [m.data for m in msgs] == ["a", "b"]
+    assert not any(sub.is_stale(m) for m in msgs)
+    # only the 1st connection's message that was handed out is still tracked
+    assert sub.n_unsettled == len(sub._generations) - 1 == 2
+    assert not task.done()
+    await prefetcher.stop()
@@ -0,0 +1,48 @@
+"""Test the resource usage helpers."""
+
+import os
+
+from ewms_pilot.utils.resources import ResourceUsage, read_process_tree
+
+
+def test_000__update_add() -> None:
+    """Test."""
+    usage = ResourceUsage()
+    usage.update(ResourceUsage(cpu_user_sec=1.0, peak_memory_bytes=100))
+    usage.update(ResourceUsage(cpu_user_sec=2.0, peak_memory_bytes=50))
+    assert usage == ResourceUsage(cpu_user_sec=2.0, peak_memory_bytes=100)
+
+    usage.add(ResourceUsage(cpu_user_sec=3.0, io_read_bytes=7, peak_memory_bytes=200))
+    assert usage == ResourceUsage(
+        cpu_user_sec=5.0, io_read_bytes=7, peak_memory_bytes=200
+    )
+    assert usage.to_dict() == {
+        "cpu_user_sec": 5.0,
+        "io_read_bytes": 7,
+        "peak_memory_bytes": 200,
+    }
+
+
+def test_100__since_share() -> None:
+    """Test."""
+    before = ResourceUsage(cpu_user_sec=1.0, io_write_bytes=10, peak_pids=3)
+    after = ResourceUsage(cpu_user_sec=4.0, io_write_bytes=30, peak_pids=5)
+    # peaks are not reset
+    assert after.since(before) == ResourceUsage(
+        cpu_user_sec=3.0, io_write_bytes=20, peak_pids=5
+    )
+    # counters are split, peaks are not
+    assert after.share(2) == ResourceUsage(
+        cpu_user_sec=2.0, io_write_bytes=15, peak_pids=5
+    )
+
+
+def test_200__read_process_tree() -> None:
+    """Test."""
+    usage = read_process_tree(os.getpid())
+    assert usage.peak_pids and usage.peak_pids >= 1
+    assert usage.peak_memory_bytes and usage.peak_memory_bytes > 0
+    assert usage.cpu_user_sec is not None
+
+    # a dead process
+    assert read_process_tree(2**22 + 1) == ResourceUsage()
@@ -0,0 +1,149 @@
+"""Test the local cache of task results."""
+
+import asyncio
+import os
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+import pytest
+from mqclient.broker_client_interface import Message
+
+from ewms_pilot.tasks.io import FileExtension
+from ewms_pilot.tasks.result_cache import ResultCache
+
+
+def _cache(
+    tmp_path: Path,
+    max_bytes: int = 0,
+    task_args: str = "",
+    task_env: dict | None = None,
+    init_image: str = "",
+) -> ResultCache:
+    return ResultCache(
+        tmp_path / "cache",
+        max_bytes,
+        "foo/bar:latest",
+        task_args,
+        task_env or {},
+        FileExtension(".in"),
+        FileExtension(".out"),
+        init_image,
+    )
+
+
+def _msg(data: Any) -> Message:
+    # the headers differ for each message
+    headers = {"traceparent": os.urandom(4).hex()}
+    return Message("id", Message.serialize(data, headers=headers))
+
+
+class FakeTask:
+    """Like `process_msg_task()`--it counts its 'containers'."""
+
+    def __init__(self, tmp_path: Path) -> None:
+        self.tmp_path = tmp_path
+        self.n_runs = 0
+        self.release = asyncio.Event()
+        self.release.set()
+        self.error: Exception | None = None
+
+    def run(self, output: str) -> Callable[..., Awaitable[Any]]:
+        async def _run(store_outfile: Callable[[Path], Awaitable[None]]) -> Any:
+            self.n_runs += 1
+            await self.release.wait()
+            if self.error:
+                raise self.error
+            outfile = self.tmp_path / f"outfile-{self.n_runs}.out"
+            outfile.write_text(output)
+            await store_outfile(outfile)
+            return output
+
+        return _run
+
+
+def test_000__key(tmp_path: Path) -> None:
+    """Test that only the task & the message's data make up the key."""
+    cache = _cache(tmp_path)
+    assert cache.key(_msg({"a": [1, 2]})) == cache.key(_msg({"a": [1, 2]}))
+    assert cache.key(_msg("abc")) == cache.key(_msg("abc"))
+    assert cache.key(_msg({"a": [1, 2]})) != cache.key(_msg({"a": [1, 3]}))
+    assert cache.key(_msg("abc")) != _cache(tmp_path, task_args="-x").key(_msg("abc"))
+
+
+def test_010__key_task_setup(tmp_path: Path) -> None:
+    """Test that anything that changes the task's output changes the key."""
+    key = _cache(tmp_path).key(_msg("abc"))
+    assert key == _cache(tmp_path, task_env={}).key(_msg("abc"))
+    assert key != _cache(tmp_path, task_env={"A": "1"}).key(_msg("abc"))
+    assert key != _cache(tmp_path, init_image="foo/init").key(_msg("abc"))
+
+
+async def test_100__hit(tmp_path: Path) -> None:
+    """Test that a finished task's result is reused."""
+    cache, task = _cache(tmp_path), FakeTask(tmp_path)
+    assert await cache.get_or_run(_msg("a"), task.run("out-a")) == "out-a"
+    assert await cache.get_or_run(_msg("a"), task.run("not this")) == "out-a"
+    assert await cache.get_or_run(_msg("b"), task.run("out-b")) == "out-b"
+    assert task.n_runs == 2
+    assert (cache.n_hits, cache.n_coalesced, cache.n_misses) == (1, 0, 2)
+
+    # ...even by the next pilot
+    assert await _cache(tmp_path).get_or_run(_msg("a"), task.run("no")) == "out-a"
+    assert task.n_runs == 2
+
+
+async def test_110__single_flight(tmp_path: Path) -> None:
+    """Test that identical tasks wait on the one that's running."""
+    cache, task = _cache(tmp_path), FakeTask(tmp_path)
+    task.release.clear()
+    tasks = [
+        asyncio.create_task(cache.get_or_run(_msg("a"), task.run("out-a")))
+        for _ in range(3)
+    ]
+    await asyncio.sleep(0.1)
+    assert task.n_runs == 1
+    task.release.set()
+    assert await asyncio.gather(*tasks) == ["out-a"] * 3
+    assert (cache.n_hits, cache.n_coalesced, cache.n_misses) == (0, 2, 1)
+
+
+async def test_120__single_flight_error(tmp_path: Path) -> None:
+    """Test that identical tasks get the running task's error--and it's not cached."""
+    cache, task = _cache(tmp_path), FakeTask(tmp_path)
+    task.release.clear()
+    task.error = ValueError("task failed")
+    tasks = [
+        asyncio.create_task(cache.get_or_run(_msg("a"), task.run("out-a")))
+        for _ in range(2)
+    ]
+    await asyncio.sleep(0.1)
+    task.release.set()
+    for result in await asyncio.gather(*tasks, return_exceptions=True):
+        assert isinstance(result, ValueError)
+
+    task.error = None
+    assert await cache.get_or_run(_msg("a"), task.run("out-a")) == "out-a"
+    assert task.n_runs == 2
+
+
+async def test_200__evict(tmp_path: Path) -> None:
+    """Test that the least-recently-used results are removed to stay within budget."""
+    cache, task = _cache(tmp_path, max_bytes=350), FakeTask(tmp_path)
+    for i, data in enumerate("abc"):
+        await cache.get_or_run(_msg(data), task.run(data * 100))
+        os.utime(cache._path(cache.key(_msg(data))), (i, i))  # make the order clear
+    # 'a' was used last
+    assert await cache.get_or_run(_msg("a"), task.run("no")) == "a" * 100
+    assert task.n_runs == 3
+
+    await cache.get_or_run(_msg("d"), task.run("d" * 100))
+    assert sorted(p.read_text()[0] for p in cache.root.iterdir()) == ["a", "c", "d"]
+    assert cache._size == 300
+
+
+@pytest.mark.parametrize("max_bytes", [0, 50])
+async def test_210__too_big(tmp_path: Path, max_bytes: int) -> None:
+    """Test that a result larger than the cache is not cached (unless unlimited)."""
+    cache, task = _cache(tmp_path, max_bytes=max_bytes), FakeTask(tmp_path)
+    await cache.get_or_run(_msg("a"), task.run("a" * 100))
+    assert len(list(cache.root.iterdir())) == (0 if max_bytes else 1)
@@ -0,0 +1,65 @@
+"""Test the RuntimeStats class."""
+
+import random
+import statistics
+
+import pytest
+
+from ewms_pilot.utils.stats import RuntimeStats
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        [random.uniform(1, 5) for _ in range(1_000)],
+        [random.lognormvariate(0, 2) for _ in range(1_000)],
+        [random.expovariate(0.1) for _ in range(1_000)],
+        [2.5] * 10,
+        [0.0, 0.0001, 1.0, 3600.0],
+    ],
+)
+def test_000__against_batch_stats(values: list[float]) -> None:
+    """Test."""
+    stats = RuntimeStats()
+    for v in values:
+        stats.add(v)
+
+    assert stats.count == len(values)
+    assert stats.mean == pytest.approx(statistics.fmean(values))
+    assert stats.variance == pytest.approx(statistics.pvariance(values), abs=1e-9)
+    assert stats.min == min(values)
+    assert stats.max == max(values)
+
+    # quantiles are estimated -- within a bin's width (~3.7%), given enough values
+    if len(values) < 1_000:
+        return
+    qs = statistics.quantiles(values, n=100, method="inclusive")
+    for q, expected in [(0.5, qs[49]), (0.9, qs[89]), (0.99, qs[98])]:
+        assert stats.quantile(q) == pytest.approx(expected, rel=0.04, abs=1e-3)
+
+
+def test_100__histogram() -> None:
+    """Test."""
+    stats = RuntimeStats()
+    values = [0.0, 1.0, 1.1, 100.0]
+    for v in values:
+        stats.add(v)
+
+    hist = stats.histogram()
+    assert sum(n for _, _, n in hist) == len(values)
+    # contiguous, ascending, fixed log-scaled bins
+    assert hist[0][:2] == (0.0, RuntimeStats.MIN_VALUE)
+    for (_, right, _), (left, _, _) in zip(hist, hist[1:]):
+        assert right == pytest.approx(left)
+    for v in values:
+        assert any(left <= v < right and n for left, right, n in hist)
+
+
+def test_200__empty() -> None:
+    """Test."""
+    stats = RuntimeStats()
+    assert stats.count == 0
+    assert stats.variance == 0.0
+    assert stats.histogram() == []
+    with pytest.raises(ValueError):
+        stats.quantile(0.5)
@@ -0,0 +1,47 @@
+"""Test finding the pilot's slot size."""
+
+from pathlib import Path
+
+import pytest
+
+from ewms_pilot.utils.slots import SlotSize, read_classad_file
+
+
+def test_000__read_classad_file(tmp_path: Path) -> None:
+    """Test."""
+    fpath = tmp_path / ".machine.ad"
+    fpath.write_text('Cpus = 4\nMemory = 2048\nName = "slot1_1@host"\nbad line\n')
+    assert read_classad_file(fpath) == {
+        "cpus": "4",
+        "memory": "2048",
+        "name": "slot1_1@host",
+    }
+    assert read_classad_file(tmp_path / "nope") == {}
+
+
+def test_100__detect_from_ads(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that the machine ad is preferred over the job ad."""
+    machine_ad = tmp_path / ".machine.ad"
+    machine_ad.write_text("Cpus = 4\nMemory = 2048\n")
+    job_ad = tmp_path / ".job.ad"
+    job_ad.write_text("RequestCpus = 2\nRequestDisk = 1000\nMaxRuntime = 3600\n")
+    monkeypatch.setenv("_CONDOR_MACHINE_AD", str(machine_ad))
+    monkeypatch.setenv("_CONDOR_JOB_AD", str(job_ad))
+
+    slot = SlotSize.detect()
+    assert slot.cpus == 4
+    assert slot.memory_bytes == 2048 * 1024**2
+    assert slot.disk_bytes == 1000 * 1024
+    assert slot.walltime_sec == 3600
+    assert slot.source == "machine ad, job ad"
+
+
+def test_200__detect_fallback(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that there's a size without any ads."""
+    monkeypatch.delenv("_CONDOR_MACHINE_AD", raising=False)
+    monkeypatch.delenv("_CONDOR_JOB_AD", raising=False)
+
+    slot = SlotSize.detect()
+    assert slot.cpus and slot.cpus >= 1
+    assert slot.memory_bytes and slot.memory_bytes > 0
+    assert slot.walltime_sec is None
@@ -0,0 +1,73 @@
+"""Test splitting the pilot's slot between containers."""
+
+import os
+from pathlib import Path
+
+import pytest
+
+from ewms_pilot.utils.slots import ResourceSlotPool, SlotResources, _format_cpuset
+
+
+def test_000__format_cpuset() -> None:
+    """Test."""
+    assert _format_cpuset([0, 1, 2, 5]) == "0-2,5"
+    assert _format_cpuset([7, 3]) == "3,7"
+    assert _format_cpuset([4]) == "4"
+
+
+def test_100__split() -> None:
+    """Test that the parts are disjoint and add up to the whole."""
+    resources = SlotResources(list(range(10)), memory_bytes=1000, pids=100)
+    pool = ResourceSlotPool(resources, 3)
+
+    assert [s.cpus for s in pool.slots] == [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]]
+    assert sum(s.memory_bytes for s in pool.slots) <= 1000  # type: ignore[misc]
+    assert sum(s.pids for s in pool.slots) <= 100  # type: ignore[misc]
+
+
+def test_110__split_more_parts_than_cpus() -> None:
+    """Test."""
+    pool = ResourceSlotPool(SlotResources([2, 3], None, None), 3)
+    assert [s.cpus for s in pool.slots] == [[2], [3], [2]]
+    assert all(s.memory_bytes is None and s.pids is None for s in pool.slots)
+
+
+def test_120__split_cpu_quota() -> None:
+    """Test that the CPU quota is split (not pinned) when it's less than the affinity."""
+    pool = ResourceSlotPool(SlotResources(list(range(64)), None, None, n_cpus=3), 2)
+    assert [(s.cpus, s.cpu_quota) for s in pool.slots] == [([], 1.5), ([], 1.5)]
+
+
+@pytest.mark.parametrize("request_cpus, n_cpus", [(2, 2), (8, None), (16, None)])
+def test_150__detect_caps_cpus(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    request_cpus: int,
+    n_cpus: int | None,
+) -> None:
+    """Test that, without affinity set for the slot, the job's CPU request caps it."""
+    job_ad = tmp_path / ".job.ad"
+    job_ad.write_text(f"RequestCpus = {request_cpus}\n")
+    monkeypatch.delenv("_CONDOR_MACHINE_AD", raising=False)
+    monkeypatch.setenv("_CONDOR_JOB_AD", str(job_ad))
+    monkeypatch.setattr(os, "sched_getaffinity", lambda pid: set(range(8)))
+
+    resources = SlotResources.detect()
+    assert resources.cpus == list(range(8))
+    assert resources.n_cpus == n_cpus
+
+
+def test_200__acquire_release() -> None:
+    """Test that slots are reused."""
+    pool = ResourceSlotPool(SlotResources([0, 1], None, None), 2)
+
+    first = pool.acquire()
+    second = pool.acquire()
+    assert first and second and first.index == 0 and second.index == 1
+    assert pool.acquire() is None  # all in use
+
+    first.release()
+    first.release()  # no-op
+    again = pool.acquire()
+    assert again is first
+    assert pool.acquire() is None
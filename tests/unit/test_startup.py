@@ -0,0 +1,81 @@
+"""Test the pilot's (overlapping) startup stages."""
+
+import asyncio
+from typing import Any
+
+import pytest
+
+from ewms_pilot import pilot
+
+
+@pytest.fixture(autouse=True)
+def short_refresh(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Don't wait a whole second between housekeeping rounds."""
+    monkeypatch.setattr(pilot, "REFRESH_INTERVAL", 0.01)
+
+
+class FakeHousekeeper:
+    """Records the queue housekeeping."""
+
+    def __init__(self) -> None:
+        self.queue_housekeeping_calls: list[tuple[Any, Any]] = []
+
+    async def queue_housekeeping(self, in_queue: Any, sub: Any, pub: Any) -> None:
+        self.queue_housekeeping_calls.append((sub, pub))
+
+
+async def _stage(
+    duration: float, result: Any = None, error: Exception | None = None
+) -> Any:
+    await asyncio.sleep(duration)
+    if error:
+        raise error
+    return result
+
+
+async def test_000__gather_or_cancel() -> None:
+    """Test that the results are in order."""
+    results = await pilot._gather_or_cancel(_stage(0.02, "a"), _stage(0.01, "b"))
+    assert results == ["a", "b"]
+
+
+async def test_010__gather_or_cancel_error() -> None:
+    """Test that the first error is raised as-is, and the rest are cancelled."""
+    slow = asyncio.ensure_future(_stage(10))
+    with pytest.raises(ValueError, match="init failed"):
+        await pilot._gather_or_cancel(
+            slow, _stage(0.01, error=ValueError("init failed"))
+        )
+    await asyncio.sleep(0)
+    assert slow.cancelled()
+
+
+async def test_100__keep_alive() -> None:
+    """Test that the queues are kept alive while a long stage runs."""
+    housekeeper = FakeHousekeeper()
+    connect = asyncio.ensure_future(_stage(0.05, ["pub", "sub"]))
+    result = await pilot._keep_queues_alive_during(
+        _stage(0.3, "prepared"),
+        connect,
+        None,  # type: ignore[arg-type]
+        housekeeper,  # type: ignore[arg-type]
+    )
+    assert result == "prepared"
+    assert set(housekeeper.queue_housekeeping_calls) == {("sub", "pub")}
+    # only once connected (after 0.05s of the 0.3s)
+    assert 0 < len(housekeeper.queue_housekeeping_calls) <= 0.25 / 0.01 + 1
+
+
+async def test_110__keep_alive_connect_failed() -> None:
+    """Test that nothing is done with failed connections--the stage's error is raised."""
+    housekeeper = FakeHousekeeper()
+    connect = asyncio.ensure_future(_stage(0, error=ConnectionError()))
+    with pytest.raises(ValueError, match="init failed"):
+        await pilot._keep_queues_alive_during(
+            _stage(0.1, error=ValueError("init failed")),
+            connect,
+            None,  # type: ignore[arg-type]
+            housekeeper,  # type: ignore[arg-type]
+        )
+    assert not housekeeper.queue_housekeeping_calls
+    assert isinstance(connect.exception(), ConnectionError)
@@ -0,0 +1,120 @@
+"""Test the TaskLedger class."""
+
+import asyncio
+import gc
+import time
+import weakref
+
+import pytest
+from mqclient.broker_client_interface import Message
+
+from ewms_pilot.tasks.map import TaskLedger, TaskMapping, TaskRecord
+
+
+async def _noop() -> None:
+    pass
+
+
+def make_taskmap() -> TaskMapping:
+    return TaskMapping(
+        message=Message(0, Message.serialize("foo")),
+        asyncio_task=asyncio.create_task(_noop()),
+        start_time=time.time(),
+    )
+
+
+async def test_000__lookups() -> None:
+    """Test."""
+    ledger = TaskLedger()
+    tmaps = [make_taskmap() for _ in range(5)]
+    for tm in tmaps:
+        ledger.add(tm)
+
+    assert len(ledger) == 5
+    assert list(ledger) == tmaps
+    for tm in tmaps:
+        assert ledger.get(asyncio_task=tm.asyncio_task) is tm
+        assert ledger.get(uuid=tm.message.uuid) is tm
+
+    with pytest.raises(ValueError):
+        ledger.get()
+
+
+async def test_100__tallies() -> None:
+    """Test."""
+    ledger = TaskLedger()
+    tmaps = [make_taskmap() for _ in range(5)]
+    for tm in tmaps:
+        ledger.add(tm)
+    assert ledger.n_pending == 5
+    assert ledger.pending_asyncio_tasks == {tm.asyncio_task for tm in tmaps}
+
+    ledger.mark_done(tmaps[0])
+    ledger.mark_done(tmaps[1])
+    ledger.mark_failed(tmaps[1], ValueError("bad"))
+    ledger.mark_done(tmaps[2])
+    ledger.mark_failed(tmaps[2], KeyError("worse"))
+
+    assert ledger.n_pending == 2
+    assert ledger.pending_asyncio_tasks == {tm.asyncio_task for tm in tmaps[3:]}
+    assert ledger.n_done == 3
+    assert ledger.n_successful == 1
+    assert ledger.n_failed == 2
+    assert [repr(e) for e in ledger.errors] == [
+        repr(ValueError("bad")),
+        repr(KeyError("worse")),
+    ]
+    assert ledger.error_type_names == {"ValueError", "KeyError"}
+
+    # sub-ledger, made from already-done task maps
+    just_now = TaskLedger(tmaps[:3])
+    assert just_now.n_pending == 0
+    assert just_now.n_done == 3
+    assert just_now.n_successful == 1
+    assert just_now.n_failed == 2
+
+
+async def test_200__invalid_transitions() -> None:
+    """Test."""
+    ledger = TaskLedger()
+    tm = make_taskmap()
+    ledger.add(tm)
+
+    with pytest.raises(RuntimeError):
+        ledger.mark_failed(tm, ValueError())  # not done yet
+
+    ledger.mark_done(tm)
+    with pytest.raises(RuntimeError):
+        ledger.mark_done(tm)
+
+    ledger.mark_failed(tm, ValueError())
+    with pytest.raises(RuntimeError):
+        ledger.mark_failed(tm, ValueError())
+
+
+async def test_300__compact() -> None:
+    """Test."""
+    ledger = TaskLedger()
+    tmaps = [make_taskmap() for _ in range(3)]
+    for tm in tmaps:
+        ledger.add(tm)
+        await tm.asyncio_task
+        ledger.mark_done(tm)
+    ledger.mark_failed(tmaps[1], ValueError("bad"))
+
+    msg_ref = weakref.ref(tmaps[1].message)
+    uuids = [tm.uuid for tm in tmaps]
+    for tm in tmaps:
+        ledger.compact(tm)
+    tmaps.clear()
+    gc.collect()
+
+    # the message is released...
+    assert msg_ref() is None
+    # ...but the summary is kept
+    assert [r.uuid for r in ledger] == uuids
+    assert all(isinstance(r, TaskRecord) and r.is_done for r in ledger)
+    assert ledger.get(uuid=uuids[1]).error == repr(ValueError("bad"))
+    assert ledger.get(uuid=uuids[0]).error is None
+    assert ledger.n_done == 3
+    assert ledger.n_failed == 1